@@ -0,0 +1,19 @@
+"""
+ASGI config for booker project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``, to run the project under an ASGI server, eg.
+``uvicorn booker.asgi:application``.
+
+Django 2.2 has no ASGI handler of its own, so the WSGI application is
+adapted by asgiref and its views run in a thread pool.
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'booker.settings')
+
+application = WsgiToAsgi(get_wsgi_application())
@@ -0,0 +1,76 @@
+"""PostgreSQL backend borrowing its connections from a process wide
+ConnectionPool (booker/db/pool.py) instead of opening one per request.
+
+Selected with ENGINE 'booker.db.backends.postgresql_pool' and CONN_MAX_AGE
+0, so that Django gives the connection back at the end of every request.
+The pool is configured by the POOL dict of the database settings, with the
+keys MIN_SIZE, MAX_SIZE, MAX_IDLE, TIMEOUT and CHECK_AFTER (seconds).
+"""
+from django.db.backends.postgresql import base, creation
+
+from booker.db.pool import ConnectionPool, close_pools, get_pool
+from booker_app.metrics import DB_POOL_WAIT_SECONDS
+
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'MAX_IDLE': 300,
+    'TIMEOUT': 10,
+    'CHECK_AFTER': 30,
+}
+
+
+def connect(conn_params, isolation_level=None):
+    """A new connection, set up like the ones of the parent backend."""
+    connection = base.Database.connect(**conn_params)
+    if (isolation_level is not None
+            and isolation_level != connection.isolation_level):
+        connection.set_session(isolation_level=isolation_level)
+    return connection
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled connections would keep the test database in use
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params):
+        # Test and maintenance connections of the same alias use another
+        # database, so the parameters are part of the key
+        key = (self.alias, repr(sorted(conn_params.items())))
+        options = dict(POOL_DEFAULTS, **self.settings_dict.get('POOL', {}))
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        alias = self.alias
+        return get_pool(key, lambda: ConnectionPool(
+            lambda: connect(conn_params, isolation_level),
+            min_size=options['MIN_SIZE'],
+            max_size=options['MAX_SIZE'],
+            max_idle=options['MAX_IDLE'],
+            timeout=options['TIMEOUT'],
+            check_after=options['CHECK_AFTER'],
+            on_wait=lambda seconds: DB_POOL_WAIT_SECONDS.observe(
+                seconds, alias=alias)
+        ))
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.getconn()
+        # As set by the parent class for a new connection; psycopg2 reports
+        # the session's level whatever the autocommit mode
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            # A connection closed in an atomic block stays referenced by
+            # the wrapper until the block exits; it can't be shared
+            self.pool.putconn(self.connection, close=self.in_atomic_block)
@@ -0,0 +1,235 @@
+"""In-process pool of DB-API connections, used by the
+`booker.db.backends.postgresql_pool` database backend.
+
+A pool holds between `min_size` and `max_size` connections. Borrowing
+takes the most recently returned idle connection, opens a new one while
+the pool is below `max_size`, or waits up to `timeout` seconds for one to
+be returned. A connection idle for `check_after` seconds or more is pinged
+before being handed out; connections idle for longer than `max_idle` are
+closed down to `min_size` by a reaper thread, which also opens connections
+up to `min_size` ahead of demand.
+"""
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def ping(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    # Leaves no transaction open outside of autocommit
+    connection.rollback()
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Thread safe pool of the connections returned by `connect()`.
+
+    Attributes:
+        stats: numbers of connections opened (`connects`), closed after a
+            failed check or reset (`discarded`) or for being idle
+            (`evictions`) and of borrowers which gave up (`timeouts`). Dict.
+        on_wait: called with the seconds waited by every borrower. Callable.
+    """
+    def __init__(self, connect, min_size=1, max_size=10, max_idle=300.0,
+                 timeout=10.0, check_after=30.0, check=ping, on_wait=None,
+                 reap_interval=None):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_after = check_after
+        self.check = check
+        self.on_wait = on_wait
+        self.stats = {'connects': 0, 'discarded': 0, 'evictions': 0,
+                      'timeouts': 0}
+        # (connection, returned at), the most recently returned last
+        self._idle = []
+        # Connections idle, in use or being opened
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        if reap_interval is None:
+            reap_interval = max(1.0, min(max_idle, check_after) / 2)
+        if reap_interval:
+            threading.Thread(
+                target=self._reap, args=(reap_interval,), daemon=True
+            ).start()
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    @property
+    def in_use(self):
+        return self._size - len(self._idle)
+
+    def getconn(self):
+        """Borrows a connection. Raises PoolTimeout if none is free after
+        `timeout` seconds."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        connection = None
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('The pool is closed')
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # The slot is taken now, the connection opened below
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No connection free after {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+                self._condition.wait(remaining)
+        if self.on_wait:
+            self.on_wait(time.monotonic() - started)
+
+        if connection is not None and (
+                time.monotonic() - returned_at >= self.check_after):
+            try:
+                self.check(connection)
+            except Exception:
+                # eg. closed by the server meanwhile; its slot is reused
+                close_quietly(connection)
+                connection = None
+                with self._condition:
+                    self.stats['discarded'] += 1
+        if connection is None:
+            connection = self._open()
+        return connection
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.stats['connects'] += 1
+        return connection
+
+    def putconn(self, connection, close=False):
+        """Gives a connection back, rolling back what it left open. With
+        `close`, or if it can't be reset, it is closed instead."""
+        if not close:
+            try:
+                connection.rollback()
+            except Exception:
+                close = True
+        with self._condition:
+            if close or self._closed:
+                self._size -= 1
+                if close:
+                    self.stats['discarded'] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+        if close or self._closed:
+            close_quietly(connection)
+
+    def evict_idle(self):
+        """Closes the connections idle for longer than `max_idle`, the
+        oldest first, keeping `min_size` connections."""
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            while (self._idle and self._size > self.min_size
+                   and now - self._idle[0][1] > self.max_idle):
+                expired.append(self._idle.pop(0)[0])
+                self._size -= 1
+            self.stats['evictions'] += len(expired)
+        for connection in expired:
+            close_quietly(connection)
+        return len(expired)
+
+    def fill(self):
+        """Opens idle connections up to `min_size`."""
+        while True:
+            with self._condition:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            connection = self._open()
+            self.putconn(connection)
+
+    def _reap(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.evict_idle()
+                self.fill()
+            except Exception:
+                # eg. the database is down; tried again on the next round
+                pass
+
+    def close(self):
+        """Closes the idle connections; the ones in use are closed once
+        given back."""
+        self._stop.set()
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            close_quietly(connection)
+
+
+# Pools of this process by key, eg. (alias, connection parameters)
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(key, factory):
+    """The pool of `key`, created by `factory()` on first use."""
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Forked, eg. by gunicorn --preload: the connections belong to
+            # the parent, forget them without closing them
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def all_pools():
+    with _pools_lock:
+        return dict(_pools)
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 import dj_database_url
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booker_app.metrics.MetricsMiddleware',
+    'booker_app.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,6 +94,43 @@ DATABASES = {
 db_from_env = dj_database_url.config(conn_max_age=600)
 DATABASES['default'].update(db_from_env)
 
+# Read replicas, space separated database URLs. They get the aliases
+# replica_0, replica_1... See booker_app/replicas.py
+DATABASE_REPLICAS = []
+for index, url in enumerate(
+        os.environ.get('DATABASE_REPLICA_URLS', '').split()):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=600)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['booker_app.replicas.ReplicaRouter']
+
+# Seconds a client reads from the primary after it wrote
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# With DATABASE_POOL=1 the PostgreSQL databases borrow their connections
+# from a pool of each process (booker/db/pool.py) instead of keeping one
+# per thread: gunicorn threads share MAX_SIZE connections per process
+if os.environ.get('DATABASE_POOL'):
+    for alias in ['default'] + DATABASE_REPLICAS:
+        if DATABASES[alias]['ENGINE'] in (
+                'django.db.backends.postgresql',
+                'django.db.backends.postgresql_psycopg2'):
+            DATABASES[alias]['ENGINE'] = 'booker.db.backends.postgresql_pool'
+            # Given back to the pool at the end of every request
+            DATABASES[alias]['CONN_MAX_AGE'] = 0
+            DATABASES[alias]['POOL'] = {
+                'MIN_SIZE': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 1)),
+                'MAX_SIZE': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+                # Seconds
+                'MAX_IDLE': float(
+                    os.environ.get('DATABASE_POOL_MAX_IDLE', 300)),
+                'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+                'CHECK_AFTER': float(
+                    os.environ.get('DATABASE_POOL_CHECK_AFTER', 30)),
+            }
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -133,3 +173,100 @@ STATIC_ROOT = os.path.join(BASE_DIR,'static')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MAX_STR_LEN = 255
+
+# Keyset pagination of the book list and book_list_json
+BOOK_PAGE_SIZE = int(os.environ.get('BOOK_PAGE_SIZE', 20))
+BOOK_MAX_PAGE_SIZE = int(os.environ.get('BOOK_MAX_PAGE_SIZE', 100))
+
+# Rows fetched per server-side cursor round-trip by streaming responses
+BOOK_STREAM_CHUNK_SIZE = int(os.environ.get('BOOK_STREAM_CHUNK_SIZE', 2000))
+
+# Books read per query by the catalog export, see booker_app/export.py
+BOOK_EXPORT_WINDOW_SIZE = int(os.environ.get('BOOK_EXPORT_WINDOW_SIZE', 10000))
+
+# Google Books API client, see booker_app/google_books.py
+GOOGLE_BOOKS_API_URL = 'https://www.googleapis.com/books/v1/volumes'
+GOOGLE_BOOKS_API_KEY = os.environ.get('GOOGLE_BOOKS_API_KEY')
+GOOGLE_BOOKS_CONNECT_TIMEOUT = float(
+    os.environ.get('GOOGLE_BOOKS_CONNECT_TIMEOUT', 3.05))
+GOOGLE_BOOKS_READ_TIMEOUT = float(
+    os.environ.get('GOOGLE_BOOKS_READ_TIMEOUT', 10))
+# maxResults accepted by the API is 40
+GOOGLE_BOOKS_PAGE_SIZE = 40
+GOOGLE_BOOKS_MAX_ITEMS = int(os.environ.get('GOOGLE_BOOKS_MAX_ITEMS', 200))
+GOOGLE_BOOKS_MAX_WORKERS = int(os.environ.get('GOOGLE_BOOKS_MAX_WORKERS', 4))
+# Lookups in flight at once during a batch ISBN import
+GOOGLE_BOOKS_MAX_CONCURRENCY = int(
+    os.environ.get('GOOGLE_BOOKS_MAX_CONCURRENCY', 20))
+
+# Two-tier cache of Google Books lookups, see booker_app/cache.py
+GOOGLE_BOOKS_CACHE_TTL = int(os.environ.get('GOOGLE_BOOKS_CACHE_TTL', 86400))
+GOOGLE_BOOKS_CACHE_SIZE = int(os.environ.get('GOOGLE_BOOKS_CACHE_SIZE', 1024))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'google_books': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'GOOGLE_BOOKS_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'booker_google_books')
+        ),
+        'TIMEOUT': GOOGLE_BOOKS_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Local thumbnails of the book covers, see booker_app/covers.py
+COVER_CACHE_DIR = os.environ.get(
+    'COVER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'booker_covers'))
+COVER_THUMBNAIL_SIZE = (128, 192)
+COVER_FETCH_TIMEOUT = float(os.environ.get('COVER_FETCH_TIMEOUT', 5))
+COVER_MAX_BYTES = int(os.environ.get('COVER_MAX_BYTES', 5 * 1024 * 1024))
+COVER_PREFETCH_WORKERS = int(os.environ.get('COVER_PREFETCH_WORKERS', 4))
+# Only covers on these hosts and their subdomains are fetched, separated
+# by spaces: the addresses come from users
+COVER_ALLOWED_HOSTS = os.environ.get(
+    'COVER_ALLOWED_HOSTS', 'books.google.com googleusercontent.com').split()
+# Seconds before a cover which could not be fetched is tried again
+COVER_FAILURE_TTL = int(os.environ.get('COVER_FAILURE_TTL', 3600))
+
+# Most identifiers resolved by one request to the identifier lookup API
+IDENTIFIER_LOOKUP_MAX = int(os.environ.get('IDENTIFIER_LOOKUP_MAX', 1000))
+
+# Operations of the book batch API: per request and per transaction
+BOOK_BATCH_MAX_OPERATIONS = int(
+    os.environ.get('BOOK_BATCH_MAX_OPERATIONS', 10000))
+BOOK_BATCH_CHUNK_SIZE = int(os.environ.get('BOOK_BATCH_CHUNK_SIZE', 500))
+# Tokens accepted by the book batch API (Authorization: Bearer <token>),
+# separated by spaces; without any the API refuses every request
+BOOK_BATCH_API_TOKENS = os.environ.get('BOOK_BATCH_API_TOKENS', '').split()
+
+# Directory shared by the processes of a host (eg. the gunicorn workers),
+# where each writes its metrics for a scrape to add up; clear it when the
+# server starts. Without it a scrape returns the metrics of one process.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+# Seconds between two writes of the metrics of a process
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+
+# Rendered book cards of the book list, see booker_app/fragments.py
+BOOK_CARD_CACHE_TIMEOUT = int(os.environ.get('BOOK_CARD_CACHE_TIMEOUT', 3600))
+
+# Typeahead suggestions, see booker_app/autocomplete.py: suggestions per
+# prefix, shortest prefix looked up and seconds a prefix stays cached
+AUTOCOMPLETE_LIMIT = int(os.environ.get('AUTOCOMPLETE_LIMIT', 10))
+AUTOCOMPLETE_MIN_LENGTH = int(os.environ.get('AUTOCOMPLETE_MIN_LENGTH', 2))
+AUTOCOMPLETE_CACHE_TIMEOUT = int(
+    os.environ.get('AUTOCOMPLETE_CACHE_TIMEOUT', 3600))
+
+# Most ISBNs imported by one batch import job
+IMPORT_BATCH_MAX_ISBNS = int(os.environ.get('IMPORT_BATCH_MAX_ISBNS', 500))
+
+# Seconds between two renewals of the lease of a running import job
+IMPORT_JOB_HEARTBEAT_INTERVAL = int(
+    os.environ.get('IMPORT_JOB_HEARTBEAT_INTERVAL', 30))
+
+# Running import jobs whose lease wasn't renewed for this long (in seconds)
+# are considered abandoned by a dead worker and get queued again
+IMPORT_JOB_TIMEOUT = int(os.environ.get('IMPORT_JOB_TIMEOUT', 300))
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+default_app_config = 'booker_app.BookerAppConfig'
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    from booker_app.autocomplete import ensure_sqlite_index
+    from booker_app.search import ensure_sqlite_triggers
+    ensure_sqlite_triggers(using)
+    ensure_sqlite_index(using)
 
 
 class BookerAppConfig(AppConfig):
     name = 'booker_app'
+
+    def ready(self):
+        post_migrate.connect(restore_search_triggers, sender=self)
@@ -0,0 +1,112 @@
+"""Typeahead suggestions over book titles and authors, served by
+AutocompleteView.
+
+Book.title_key and Book.authors_key hold the titles and the authors
+normalized by search_key(). Both are indexed with the book id and compared
+bytewise (COLLATE "C" on PostgreSQL, the default on SQLite), so the books
+starting with a prefix are a range of the index, read in order: a lookup
+is two index range scans of AUTOCOMPLETE_LIMIT rows whatever the size of
+the catalog. The authors match by the first listed author.
+
+Suggestions are cached per prefix under the catalog version, so every
+write to the catalog makes the cached prefixes stale at once.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from booker_app.models import Book, search_key
+from booker.settings import (
+    AUTOCOMPLETE_CACHE_TIMEOUT, AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MIN_LENGTH
+)
+
+
+# Columns suggestions are matched on, in the order they are listed
+KEY_COLUMNS = ('title_key', 'authors_key')
+
+# Bytewise order, in which a prefix is a range; the other databases
+# compare these keys the same way by default
+COLLATIONS = {'postgresql': ' COLLATE "C"'}
+
+# The indexes created by migration 0017, re-run on SQLite after every
+# migrate: SQLite rebuilds a table (dropping the indexes Django doesn't
+# know of) on ALTER.
+SQLITE_INDEX_SQL = [
+    f'CREATE INDEX IF NOT EXISTS booker_app_book_{column}_idx '
+    f'ON booker_app_book ({column}, id)'
+    for column in KEY_COLUMNS
+]
+
+
+def prefix_end(prefix):
+    """Smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_matches(column, prefix):
+    """Books whose `column` starts with the non empty `prefix`, in the
+    order of the index."""
+    books = Book.objects.all()
+    collation = COLLATIONS.get(connections[books.db].vendor, '')
+    key = f'booker_app_book.{column}{collation}'
+    return books.extra(
+        where=[f'{key} >= %s', f'{key} < %s'],
+        params=[prefix, prefix_end(prefix)]
+    ).order_by(RawSQL(key, ()), 'id')
+
+
+def suggest(prefix, limit=AUTOCOMPLETE_LIMIT):
+    """Up to `limit` books whose title, then whose first author, starts
+    with the normalized `prefix`."""
+    suggestions = []
+    seen = set()
+    for column in KEY_COLUMNS:
+        if len(suggestions) == limit:
+            break
+        books = prefix_matches(column, prefix).values(
+            'id', 'title', 'authors')[:limit]
+        for book in books:
+            if book['id'] in seen or len(suggestions) == limit:
+                continue
+            seen.add(book['id'])
+            book['match'] = column[:-len('_key')]
+            suggestions.append(book)
+    return suggestions
+
+
+def suggestion_key(version, prefix):
+    # Prefixes may hold spaces and any letter, which some caches refuse
+    digest = hashlib.sha1(prefix.encode()).hexdigest()
+    return f'autocomplete:{version}:{digest}'
+
+
+def get_suggestions(text, version):
+    """Normalized prefix of `text` and its suggestions, from the cache of
+    the catalog `version` when possible."""
+    prefix = search_key(text)
+    if len(prefix) < AUTOCOMPLETE_MIN_LENGTH:
+        return prefix, []
+    key = suggestion_key(version, prefix)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = suggest(prefix)
+        cache.set(key, suggestions, AUTOCOMPLETE_CACHE_TIMEOUT)
+    return prefix, suggestions
+
+
+def ensure_sqlite_index(using):
+    """Recreates the indexes dropped by SQLite table rebuilds."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        columns = [
+            column.name for column in
+            db.introspection.get_table_description(cursor, 'booker_app_book')
+        ]
+        if 'title_key' not in columns:
+            return  # migration adding the keys has not run yet
+        for sql in SQLITE_INDEX_SQL:
+            cursor.execute(sql)
@@ -0,0 +1,329 @@
+"""Batch of create, update and delete operations on books, see
+BookBatchView.
+
+Operations are validated with the forms of the HTML views and applied in
+chunks of BOOK_BATCH_CHUNK_SIZE, each chunk in one transaction with a
+constant number of queries: the books to change are locked with one query,
+identifier and fingerprint conflicts are found with one query each and the
+writes are bulk inserts, updates and deletes.
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.forms.models import model_to_dict
+from django.utils import timezone
+
+from booker_app.forms import BookForm, BookFormEdit, IdentifierForm
+from booker_app.models import Book, CatalogVersion, Identifier
+from booker.settings import BOOK_BATCH_CHUNK_SIZE
+
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+OPERATIONS = (CREATE, UPDATE, DELETE)
+
+# Statuses of the per-operation results
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+INVALID = 'invalid'
+EXISTS = 'exists'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+BOOK_FIELDS = [
+    'authors',
+    'title',
+    'pub_date',
+    'page_count',
+    'language',
+    'cover_image_adress'
+]
+
+
+class Operation:
+    """One item of the batch and its result."""
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item if isinstance(item, dict) else {}
+        self.op = self.item.get('op')
+        self.book_id = self.item.get('id')
+        self.book = None
+        # {type: value} of the identifiers to store
+        self.identifiers = {}
+        self.result = {
+            'index': index,
+            'op': self.op,
+            'status': None,
+            'book_id': self.book_id,
+            'message': '',
+            'errors': {}
+        }
+
+    def fail(self, status, message, errors=None):
+        self.result['status'] = status
+        self.result['message'] = message
+        self.result['errors'] = errors or {}
+
+    @property
+    def owner(self):
+        """Tells apart the books of a chunk, new ones included."""
+        return self.book_id if self.op != CREATE else ('new', self.index)
+
+    @property
+    def failed(self):
+        return self.result['status'] is not None
+
+
+def apply_operations(items):
+    """Applies the operations in order, chunk by chunk. Returns one result
+    per item: a dict with `index`, `op`, `status`, `book_id`, `message` and
+    `errors` (of the forms)."""
+    operations = [Operation(index, item) for index, item in enumerate(items)]
+    for start in range(0, len(operations), BOOK_BATCH_CHUNK_SIZE):
+        chunk = operations[start:start + BOOK_BATCH_CHUNK_SIZE]
+        try:
+            with transaction.atomic():
+                apply_chunk(chunk)
+        except IntegrityError:
+            # A concurrent write took a value or fingerprint in the
+            # meantime; the whole chunk is rolled back
+            for operation in chunk:
+                if operation.result['status'] in (None, CREATED, UPDATED,
+                                                  DELETED):
+                    operation.fail(
+                        FAILED, 'Conflicting concurrent write, try again.')
+                    operation.result['book_id'] = operation.book_id
+    return [operation.result for operation in operations]
+
+
+def apply_chunk(chunk):
+    books = lock_books(chunk)
+    for operation in chunk:
+        if operation.failed:
+            continue
+        if operation.op == CREATE:
+            validate_create(operation)
+        else:
+            operation.book = books.get(operation.book_id)
+            if operation.book is None:
+                operation.fail(
+                    NOT_FOUND, f'Book {operation.book_id} not found.')
+            elif operation.op == UPDATE:
+                validate_update(operation)
+
+    to_delete = [
+        op.book_id for op in chunk if op.op == DELETE and not op.failed]
+    writes = [
+        op for op in chunk if op.op in (CREATE, UPDATE) and not op.failed]
+    find_conflicts(writes, to_delete)
+    writes = [op for op in writes if not op.failed]
+
+    if to_delete:
+        # Identifiers go with their books (on_delete=CASCADE)
+        Book.objects.filter(id__in=to_delete).delete()
+    save_creates([op for op in writes if op.op == CREATE])
+    save_updates([op for op in writes if op.op == UPDATE])
+
+    for operation in chunk:
+        if not operation.failed:
+            operation.result['status'] = {
+                CREATE: CREATED, UPDATE: UPDATED, DELETE: DELETED
+            }[operation.op]
+            operation.result['book_id'] = operation.book.id
+    if to_delete or writes:
+        CatalogVersion.bump()
+
+
+def lock_books(chunk):
+    """Validates the operation names and ids and locks the books to update
+    or delete with one query."""
+    seen_ids = set()
+    for operation in chunk:
+        if operation.op not in OPERATIONS:
+            operation.fail(
+                INVALID, f'op must be one of: {", ".join(OPERATIONS)}.')
+        elif operation.op != CREATE:
+            if not isinstance(operation.book_id, int):
+                operation.fail(INVALID, f'{operation.op} needs a book id.')
+            elif operation.book_id in seen_ids:
+                operation.fail(
+                    INVALID,
+                    f'Book {operation.book_id} is changed twice in a chunk.'
+                )
+            seen_ids.add(operation.book_id)
+    ids = [op.book_id for op in chunk if op.op != CREATE and not op.failed]
+    if not ids:
+        return {}
+    return Book.objects.select_for_update().in_bulk(ids)
+
+
+def clean_identifiers(operation):
+    identifiers = operation.item.get('identifiers') or {}
+    if not isinstance(identifiers, dict):
+        operation.fail(INVALID, 'identifiers must be an object.')
+        return False
+    form_ident = IdentifierForm(identifiers)
+    if not form_ident.is_valid():
+        operation.fail(
+            INVALID, 'Invalid identifiers.', form_ident.errors.get_json_data())
+        return False
+    operation.identifiers = {
+        ident_type: form_ident.cleaned_data[ident_type]
+        for ident_type, _ in Identifier.IDENTIFIER_TYPES
+        if form_ident.cleaned_data[ident_type]
+    }
+    values = list(operation.identifiers.values())
+    if len(set(values)) != len(values):
+        operation.fail(INVALID, 'The same value is given for two types.')
+        return False
+    return True
+
+
+def book_data(operation):
+    """The `book` object of the item, None (and the operation failed) if it
+    is something else."""
+    data = operation.item.get('book') or {}
+    if not isinstance(data, dict):
+        operation.fail(INVALID, 'book must be an object.')
+        return None
+    return data
+
+
+def validate_create(operation):
+    data = book_data(operation)
+    if data is None:
+        return
+    form_book = BookForm(data)
+    if not form_book.is_valid():
+        operation.fail(
+            INVALID, 'Invalid book.', form_book.errors.get_json_data())
+        return
+    if not clean_identifiers(operation):
+        return
+    operation.book = Book(**{
+        field: form_book.cleaned_data[field] for field in BOOK_FIELDS})
+    clean_pub_date(operation)
+
+
+def validate_update(operation):
+    changes = book_data(operation)
+    if changes is None:
+        return
+    # Fields left out keep their stored values
+    data = model_to_dict(operation.book, BOOK_FIELDS)
+    data.update(changes)
+    form_book = BookFormEdit(data, instance=operation.book)
+    if not form_book.is_valid():
+        operation.fail(
+            INVALID, 'Invalid book.', form_book.errors.get_json_data())
+        return
+    if clean_identifiers(operation):
+        clean_pub_date(operation)
+
+
+def clean_pub_date(operation):
+    # BookForm only completes partial dates; bulk writes bypass the model
+    # field validation
+    field = Book._meta.get_field('pub_date')
+    try:
+        operation.book.pub_date = field.to_python(operation.book.pub_date)
+    except ValidationError as e:
+        operation.fail(INVALID, 'Invalid book.', {'pub_date': e.messages})
+
+
+def find_conflicts(writes, to_delete):
+    """Marks the creates and updates whose identifier value or fingerprint
+    belongs to another book, stored or earlier in the chunk. Books deleted
+    in the chunk free their values."""
+    values = [
+        value for op in writes for value in op.identifiers.values()]
+    update_ids = [op.book_id for op in writes if op.op == UPDATE]
+    identifiers = Identifier.objects.filter(
+        Q(value__in=values) | Q(book_id__in=update_ids)
+    ).exclude(book_id__in=to_delete)
+    owners = {}
+    own_identifiers = {}
+    for ident in identifiers:
+        owners[ident.value] = ident.book_id
+        own_identifiers.setdefault(ident.book_id, {})[ident.type] = ident
+
+    fingerprints = {
+        fingerprint: book_id
+        for fingerprint, book_id in Book.objects.filter(
+            fingerprint__in=[op.book.fill_fingerprint() for op in writes]
+        ).exclude(id__in=to_delete).values_list('fingerprint', 'id')
+    }
+
+    for operation in writes:
+        taken = [
+            value for value in operation.identifiers.values()
+            if owners.get(value, operation.owner) != operation.owner
+        ]
+        if taken:
+            operation.fail(EXISTS, f'Identifier {taken[0]} already exists.')
+            continue
+        owner = fingerprints.get(operation.book.fingerprint, operation.owner)
+        if owner != operation.owner:
+            operation.fail(
+                EXISTS,
+                f'{operation.book.title} by {operation.book.authors} '
+                f'already exists.'
+            )
+            continue
+        # Later operations of the chunk can't take them any more
+        for value in operation.identifiers.values():
+            owners[value] = operation.owner
+        fingerprints[operation.book.fingerprint] = operation.owner
+        operation.own_identifiers = own_identifiers.get(operation.book_id, {})
+
+
+def save_creates(creates):
+    books = [op.book for op in creates]
+    for book in books:
+        book.fill_search_keys()
+    if connection.features.can_return_ids_from_bulk_insert:
+        Book.objects.bulk_create(books)
+    else:
+        # Without RETURNING the ids of bulk inserted rows are unknown
+        for book in books:
+            book.save()
+    new_identifiers = []
+    for operation in creates:
+        for ident_type, value in operation.identifiers.items():
+            ident = Identifier(type=ident_type, value=value, book=operation.book)
+            ident.fill_canonical()
+            new_identifiers.append(ident)
+    Identifier.objects.bulk_create(new_identifiers)
+
+
+def save_updates(updates):
+    now = timezone.now()
+    books = []
+    to_update = []
+    to_create = []
+    for operation in updates:
+        # bulk_update() skips auto_now
+        operation.book.updated_at = now
+        operation.book.fill_search_keys()
+        books.append(operation.book)
+        for ident_type, value in operation.identifiers.items():
+            ident = operation.own_identifiers.get(ident_type)
+            if ident is None:
+                ident = Identifier(
+                    type=ident_type, value=value, book=operation.book)
+                ident.fill_canonical()
+                to_create.append(ident)
+            elif ident.value != value:
+                ident.value = value
+                ident.fill_canonical()
+                ident.updated_at = now
+                to_update.append(ident)
+    Book.objects.bulk_update(
+        books,
+        BOOK_FIELDS + ['fingerprint', 'title_key', 'authors_key', 'updated_at']
+    )
+    Identifier.objects.bulk_update(
+        to_update, ['value', 'canonical', 'updated_at'])
+    Identifier.objects.bulk_create(to_create)
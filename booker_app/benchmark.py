@@ -0,0 +1,505 @@
+"""Synthetic catalog and benchmark harness, see `manage.py generate_books`,
+`manage.py benchmark` and `manage.py benchmark_pool`.
+
+The catalog is generated from a seeded random generator, so the same
+options always give the same books. The benchmark drives the routes of
+booker_app/urls.py in process through the Django test client and reports
+latency percentiles, throughput and query counts per scenario as JSON
+with sorted keys, which can be diffed between runs.
+
+The covers of generated books don't exist: the book_cover scenario stores a
+plain thumbnail for those it requests, so it measures the serving of stored
+thumbnails without going to the network.
+"""
+import io
+import os
+import random
+import threading
+import time
+from datetime import date
+
+from django.db import connections
+from django.db.models import Max
+from django.test import Client
+from django.urls import reverse
+from PIL import Image
+
+from booker.db.pool import ConnectionPool
+from booker.settings import BOOK_BATCH_API_TOKENS, COVER_THUMBNAIL_SIZE
+from booker_app.covers import cover_key, store, thumbnail_path
+from booker_app.metrics import QueryTimer
+from booker_app.models import Book, Identifier, ImportJob
+
+
+# Rough shares of the languages of a general catalog
+LANGUAGE_WEIGHTS = (
+    ('en', 55), ('es', 8), ('de', 7), ('fr', 7), ('pl', 5), ('it', 4),
+    ('pt', 4), ('ru', 4), ('ja', 3), ('zh', 3)
+)
+# Number of identifiers of a book; about 3 on average
+IDENTIFIER_COUNT_WEIGHTS = ((1, 10), (2, 20), (3, 40), (4, 30))
+TITLE_WORDS = (
+    'river', 'garden', 'shadow', 'winter', 'empire', 'letters', 'journey',
+    'silent', 'northern', 'glass', 'house', 'memory', 'stone', 'city',
+    'forgotten', 'light', 'history', 'ocean', 'secret', 'machine'
+)
+FIRST_NAMES = (
+    'Anna', 'John', 'Maria', 'Piotr', 'Elena', 'James', 'Sofia', 'Adam',
+    'Laura', 'Tomasz', 'Hiro', 'Chen'
+)
+LAST_NAMES = (
+    'Nowak', 'Smith', 'Garcia', 'Muller', 'Rossi', 'Dubois', 'Kowalski',
+    'Tanaka', 'Wang', 'Ivanova', 'Silva', 'Brown'
+)
+SYNTHETIC_COVER_URL = (
+    'http://books.google.com/books/content?id=synthetic{number}'
+    '&printsec=frontcover&img=1&zoom=1'
+)
+# Books whose covers book_cover requests
+COVER_SAMPLE = 20
+# Operations per request of book_batch and ISBNs per request of import_batch
+BATCH_SIZE = 10
+
+
+def weighted_choice(rng, weights):
+    values, shares = zip(*weights)
+    return rng.choices(values, shares)[0]
+
+
+def isbn_10(number):
+    digits = f'{number:09d}'
+    check = sum((10 - i) * int(d) for i, d in enumerate(digits)) % 11
+    check = (11 - check) % 11
+    return digits + ('X' if check == 10 else str(check))
+
+
+def isbn_13(number):
+    digits = f'978{number:09d}'
+    check = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(digits))
+    return digits + str((10 - check % 10) % 10)
+
+
+def synthetic_identifier(ident_type, number):
+    """Identifier values derived from the book number, so they never
+    collide between books or types."""
+    if ident_type == 'ISBN_10':
+        return isbn_10(number)
+    if ident_type == 'ISBN_13':
+        return isbn_13(number)
+    if ident_type == 'ISSN':
+        return f'{number // 10000:04d}-{number % 10000:04d}'
+    return f'SYN:{number}'
+
+
+def synthetic_volume(rng, number):
+    """Book field values and (type, value) identifiers of book `number`,
+    in the form of importer.volume_fields()."""
+    # Most books are recent; the publication year decays exponentially
+    year = max(1800, date.today().year - int(rng.expovariate(1 / 15)))
+    pub_date = None
+    if rng.random() > 0.1:
+        pub_date = date(year, rng.randint(1, 12), rng.randint(1, 28))
+    page_count = None
+    if rng.random() > 0.05:
+        page_count = max(1, int(rng.lognormvariate(5.5, 0.5)))
+    cover = None
+    if rng.random() > 0.3:
+        cover = SYNTHETIC_COVER_URL.format(number=number)
+    fields = {
+        'authors': ','.join(
+            f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            for _ in range(weighted_choice(rng, ((1, 80), (2, 15), (3, 5))))
+        ),
+        'title': ' '.join(
+            rng.sample(TITLE_WORDS, rng.randint(1, 4))
+        ).capitalize() + f' {number}',
+        'pub_date': pub_date,
+        'page_count': page_count,
+        'language': weighted_choice(rng, LANGUAGE_WEIGHTS),
+        'cover_image_adress': cover
+    }
+    ident_types = rng.sample(
+        [ident_type for ident_type, _ in Identifier.IDENTIFIER_TYPES],
+        weighted_choice(rng, IDENTIFIER_COUNT_WEIGHTS)
+    )
+    identifiers = [
+        (ident_type, synthetic_identifier(ident_type, number))
+        for ident_type in ident_types
+    ]
+    return fields, identifiers
+
+
+def synthetic_batches(count, seed, start, batch_size):
+    """Batches of parsed records for loader.write_batch()."""
+    rng = random.Random(seed)
+    batch = []
+    for number in range(start, start + count):
+        fields, identifiers = synthetic_volume(rng, number)
+        batch.append((fields['title'], fields, identifiers, None))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_synthetic_cover(url):
+    return url.startswith(SYNTHETIC_COVER_URL.split('{')[0])
+
+
+def store_synthetic_thumbnails(urls):
+    """Stores a plain thumbnail for the generated covers among `urls`
+    which have none yet."""
+    for url in urls:
+        path = thumbnail_path(cover_key(url))
+        if not is_synthetic_cover(url) or os.path.exists(path):
+            continue
+        output = io.BytesIO()
+        Image.new('RGB', COVER_THUMBNAIL_SIZE, (120, 90, 60)).save(
+            output, 'JPEG')
+        store(path, output.getvalue())
+
+
+def percentile(sorted_values, share):
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(share * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Scenario:
+    """One kind of request. `request(i)` returns the (method, path, data,
+    headers) of the i-th request."""
+    def __init__(self, name, request, writes=False):
+        self.name = name
+        self.request = request
+        self.writes = writes
+
+
+def build_scenarios(rng, book_ids, job_id, search_words, cover_paths):
+    def path(name, **kwargs):
+        return reverse(name, kwargs=kwargs or None)
+
+    def details(i):
+        book_id = rng.choice(book_ids)
+        return 'get', path('book_details', book_id=book_id), None, {}
+
+    def search(i):
+        data = {'search_field': rng.choice(search_words)}
+        return 'post', path('book_list'), data, {}
+
+    def identifier_lookup(i):
+        # ISBN-10s of generated books, found through their ISBN-13s too
+        numbers = [rng.randrange(max(len(book_ids), 1)) for _ in range(100)]
+        data = {'identifiers': [isbn_10(number) for number in numbers]}
+        headers = {'content_type': 'application/json'}
+        return 'post', path('identifier_lookup'), data, headers
+
+    def autocomplete(i):
+        # What is typed so far of a title word or an author's first name
+        word = rng.choice(TITLE_WORDS + FIRST_NAMES)
+        data = {'q': word[:rng.randint(2, len(word))]}
+        return 'get', path('autocomplete'), data, {}
+
+    etags = {}
+
+    def conditional_list(i):
+        if 'book_list' not in etags:
+            response = Client(SERVER_NAME='localhost').get(path('book_list'))
+            etags['book_list'] = response['ETag']
+        headers = {'HTTP_IF_NONE_MATCH': etags['book_list']}
+        return 'get', path('book_list'), None, headers
+
+    created = []
+
+    def book_form(i):
+        return {
+            'authors': 'Benchmark',
+            'title': f'Benchmark book {i} {rng.random()}',
+            'pub_date': '2020-01-01',
+            'language': 'en',
+            'page_count': 100
+        }
+
+    def add_book(i):
+        return 'post', path('add_book'), book_form(i), {}
+
+    def edit_book(i):
+        book_id = created[i % len(created)]
+        data = dict(book_form(i), ISBN_13=isbn_13(900000000 + i))
+        return 'post', path('book_details', book_id=book_id), data, {}
+
+    def delete_book(i):
+        return 'post', path('delete_book', id=created.pop()), None, {}
+
+    def import_book(i):
+        data = {'search_title': rng.choice(search_words)}
+        return 'post', path('import_book'), data, {}
+
+    def cover(i):
+        return 'get', rng.choice(cover_paths), None, {}
+
+    def book_batch(i):
+        # Creates only, as every update and delete would touch these books
+        operations = [
+            {
+                'op': 'create',
+                'book': book_form(i),
+                'identifiers': {
+                    'ISBN_13': isbn_13(910000000 + i * BATCH_SIZE + n)
+                }
+            }
+            for n in range(BATCH_SIZE)
+        ]
+        headers = {
+            'content_type': 'application/json',
+            'HTTP_AUTHORIZATION': f'Bearer {BOOK_BATCH_API_TOKENS[0]}'
+        }
+        return 'post', path('book_batch'), {'operations': operations}, headers
+
+    def import_batch(i):
+        numbers = [
+            rng.randrange(max(len(book_ids), 1)) for _ in range(BATCH_SIZE)]
+        data = {'isbns': '\n'.join(isbn_13(number) for number in numbers)}
+        return 'post', path('import_batch'), data, {}
+
+    scenarios = [
+        Scenario('book_list', lambda i: ('get', path('book_list'), None, {})),
+        Scenario('book_list_search', search),
+        Scenario('book_list_not_modified', conditional_list),
+        Scenario('book_list_json', lambda i: (
+            'get', path('book_list_json'), None, {})),
+        Scenario('book_list_json_filtered', lambda i: (
+            'get', path('book_list_json') + '?language=pl&format=ndjson',
+            None, {})),
+        Scenario('book_details', details),
+        Scenario('book_export', lambda i: (
+            'get', path('book_export') + '?format=csv', None, {})),
+        Scenario('book_cover', cover),
+        Scenario('identifier_lookup', identifier_lookup),
+        Scenario('autocomplete', autocomplete),
+        Scenario('add_book_form', lambda i: (
+            'get', path('add_book'), None, {})),
+        Scenario('import_book_form', lambda i: (
+            'get', path('import_book'), None, {})),
+        Scenario('import_job', lambda i: (
+            'get', path('import_job', job_id=job_id), None, {})),
+        Scenario('metrics', lambda i: ('get', path('metrics'), None, {})),
+        Scenario('add_book', add_book, writes=True),
+        Scenario('edit_book', edit_book, writes=True),
+        Scenario('delete_book', delete_book, writes=True),
+        Scenario('import_book', import_book, writes=True),
+        Scenario('book_batch', book_batch, writes=True),
+        Scenario('import_batch', import_batch, writes=True),
+    ]
+    return scenarios, created
+
+
+def to_ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def latency_stats(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'mean_ms': to_ms(sum(latencies) / len(latencies)),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+    }
+
+
+def run_connection_clients(acquire, release, query, requests, threads):
+    """Runs `threads` threads sending `requests` requests each; a request
+    takes a connection, runs `query` and gives the connection back."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def client():
+        barrier.wait()
+        own = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                connection = acquire()
+                try:
+                    cursor = connection.cursor()
+                    cursor.execute(query)
+                    cursor.fetchall()
+                    cursor.close()
+                finally:
+                    release(connection)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        raise RuntimeError(f'Every request failed, eg. {errors[0]}')
+    return dict(latency_stats(latencies, elapsed), errors=len(errors))
+
+
+def run_connection_benchmark(alias='default', requests=200, threads=4,
+                             query='SELECT 1', min_size=1, max_size=4,
+                             timeout=10.0):
+    """Compares a connection opened for every request, as with
+    CONN_MAX_AGE 0, with connections borrowed from a ConnectionPool, on the
+    database of `alias`. Returns the report."""
+    wrapper = connections[alias]
+    params = wrapper.get_connection_params()
+
+    def connect():
+        return wrapper.Database.connect(**params)
+
+    report = {'connect_per_request': run_connection_clients(
+        connect, lambda connection: connection.close(), query, requests,
+        threads
+    )}
+
+    waits = []
+    pool = ConnectionPool(
+        connect, min_size=min_size, max_size=max_size, timeout=timeout,
+        on_wait=waits.append, reap_interval=0
+    )
+    try:
+        pool.fill()
+        report['pooled'] = run_connection_clients(
+            pool.getconn, pool.putconn, query, requests, threads)
+    finally:
+        pool.close()
+    waits.sort()
+    report['pooled']['pool'] = dict(
+        pool.stats,
+        wait_p99_ms=to_ms(percentile(waits, 0.99)),
+        wait_max_ms=to_ms(waits[-1]),
+    )
+
+    return {
+        'dataset': {'database': wrapper.vendor},
+        'settings': {
+            'alias': alias,
+            'requests': requests,
+            'threads': threads,
+            'query': query,
+            'min_size': min_size,
+            'max_size': max_size,
+        },
+        'scenarios': report,
+    }
+
+
+def run_scenario(scenario, requests, warmup):
+    """Sends `warmup` untimed requests, then `requests` timed ones, and
+    returns the statistics of the timed ones."""
+    client = Client(SERVER_NAME='localhost')
+    latencies = []
+    queries = []
+    errors = 0
+    for i in range(warmup + requests):
+        if i == warmup:
+            started = time.perf_counter()
+        method, path, data, headers = scenario.request(i)
+        timer = QueryTimer()
+        with connections['default'].execute_wrapper(timer):
+            request_started = time.perf_counter()
+            response = getattr(client, method)(path, data, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latency = time.perf_counter() - request_started
+        if i < warmup:
+            continue
+        latencies.append(latency)
+        queries.append(timer.count)
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    return dict(
+        latency_stats(latencies, elapsed),
+        errors=errors,
+        queries_mean=round(sum(queries) / len(queries), 2),
+        queries_max=max(queries),
+    )
+
+
+def run_benchmark(requests=100, warmup=10, seed=0, writes=False,
+                  only=None):
+    """Runs every scenario (the read only ones unless `writes`) and returns
+    the report. Books and jobs created by the write scenarios are removed
+    afterwards."""
+    rng = random.Random(seed)
+    book_ids = list(Book.objects.values_list('id', flat=True))
+    last_book_id = max(book_ids, default=0)
+    last_job_id = ImportJob.objects.aggregate(last=Max('id'))['last'] or 0
+    covered = list(
+        Book.objects.exclude(cover_image_adress__isnull=True)
+        .exclude(cover_image_adress='').order_by('id')[:COVER_SAMPLE]
+    )
+    cover_paths = [book.cover_url for book in covered]
+    scenarios, created = build_scenarios(
+        rng, book_ids, last_job_id, TITLE_WORDS, cover_paths)
+
+    report = {}
+    try:
+        for scenario in scenarios:
+            if scenario.writes and not writes:
+                continue
+            if only and scenario.name not in only:
+                continue
+            if scenario.name == 'book_details' and not book_ids:
+                continue
+            if scenario.name == 'import_job' and not last_job_id:
+                continue
+            if scenario.name == 'book_cover':
+                if not cover_paths:
+                    continue
+                store_synthetic_thumbnails(
+                    book.cover_image_adress for book in covered)
+            if scenario.name == 'book_batch' and not BOOK_BATCH_API_TOKENS:
+                # The batch API refuses every request without a token
+                continue
+            if scenario.name in ('edit_book', 'delete_book') and (
+                    len(created) < warmup + requests):
+                # Works on the books of add_book, which didn't run
+                continue
+            report[scenario.name] = run_scenario(scenario, requests, warmup)
+            if scenario.name == 'add_book':
+                created.extend(Book.objects.filter(
+                    id__gt=last_book_id, authors='Benchmark'
+                ).order_by('id').values_list('id', flat=True))
+    finally:
+        if writes:
+            Book.objects.filter(
+                id__gt=last_book_id, authors='Benchmark').delete()
+            ImportJob.objects.filter(id__gt=last_job_id).delete()
+
+    return {
+        'dataset': {
+            'books': Book.objects.count(),
+            'identifiers': Identifier.objects.count(),
+            'database': connections['default'].vendor,
+        },
+        'settings': {
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed,
+            'writes': writes,
+        },
+        'scenarios': report,
+    }
@@ -0,0 +1,181 @@
+"""Two-tier cache of Google Books lookups.
+
+The first tier is an in-process LRU with a TTL, answering repeated imports
+of the same ISBN or author without leaving the worker. The second one is
+the `google_books` Django cache (file based by default), shared by the
+workers and surviving restarts. Keys are built from the normalized search
+fields, so eg. 'Tolkien ' and 'tolkien' hit the same entry.
+
+A purge clears the persistent tier and increments a generation counter
+stored there. The keys of the memory tier hold the generation, which every
+process reads again every GENERATION_CHECK_INTERVAL seconds, so a purge
+reaches the memory of every worker within that time.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from booker.settings import (
+    GOOGLE_BOOKS_CACHE_SIZE, GOOGLE_BOOKS_CACHE_TTL
+)
+
+
+PERSISTENT_CACHE_ALIAS = 'google_books'
+GENERATION_KEY = 'google_books:generation'
+# Seconds a process keeps using the generation it read last
+GENERATION_CHECK_INTERVAL = 5
+
+
+class TTLCache:
+    """Thread safe LRU mapping whose entries expire after `ttl` seconds."""
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_keywords(keywords_fields):
+    """Lowercased, whitespace collapsed, non-empty search fields in a stable
+    order. Hyphens and spaces are not significant in identifiers."""
+    normalized = {}
+    for key_field, value in keywords_fields.items():
+        value = ' '.join((value or '').lower().split())
+        if key_field in ('isbn', 'lccn', 'oclc'):
+            value = re.sub(r'[\s-]', '', value)
+        if value:
+            normalized[key_field] = value
+    return sorted(normalized.items())
+
+
+def cache_key(keywords_fields):
+    query = json.dumps(normalize_keywords(keywords_fields))
+    return 'google_books:' + hashlib.sha1(query.encode()).hexdigest()
+
+
+class GoogleBooksCache:
+    def __init__(self, max_size=GOOGLE_BOOKS_CACHE_SIZE,
+                 ttl=GOOGLE_BOOKS_CACHE_TTL):
+        self.ttl = ttl
+        self.memory = TTLCache(max_size, ttl)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+        self._generation = None
+        self._generation_checked = 0.0
+        self._generation_lock = threading.Lock()
+
+    @property
+    def persistent(self):
+        return caches[PERSISTENT_CACHE_ALIAS]
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0}
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def generation(self):
+        """Number of purges of the persistent tier, as last read."""
+        now = time.monotonic()
+        with self._generation_lock:
+            if (self._generation is not None
+                    and now - self._generation_checked
+                    < GENERATION_CHECK_INTERVAL):
+                return self._generation
+        generation = self.persistent.get(GENERATION_KEY, 0)
+        with self._generation_lock:
+            self._generation = generation
+            self._generation_checked = now
+        return generation
+
+    def memory_key(self, key):
+        return f'{self.generation()}:{key}'
+
+    def get(self, keywords_fields):
+        """Cached volume infos for the search fields: a list, empty if the
+        search found nothing, or None if no tier has a live entry."""
+        key = cache_key(keywords_fields)
+        volume_infos = self.memory.get(self.memory_key(key))
+        if volume_infos is not None:
+            self._count('memory_hits')
+            return volume_infos
+
+        volume_infos = self.persistent.get(key)
+        if volume_infos is not None:
+            self._count('persistent_hits')
+            self.memory.set(self.memory_key(key), volume_infos)
+            return volume_infos
+
+        self._count('misses')
+        return None
+
+    def set(self, keywords_fields, volume_infos):
+        key = cache_key(keywords_fields)
+        volume_infos = volume_infos or []
+        self.memory.set(self.memory_key(key), volume_infos)
+        self.persistent.set(key, volume_infos, self.ttl)
+
+    def search(self, keywords_fields, fetch):
+        """Volume infos for the search fields, calling `fetch` only when
+        neither tier has a live entry. Empty results are cached too."""
+        volume_infos = self.get(keywords_fields)
+        if volume_infos is None:
+            volume_infos = fetch(keywords_fields)
+            self.set(keywords_fields, volume_infos)
+        return volume_infos or None
+
+    def purge(self):
+        """Empties both tiers, of every process: the others drop their
+        memory tier on their next generation check."""
+        generation = self.persistent.get(GENERATION_KEY, 0) + 1
+        self.persistent.clear()
+        self.persistent.set(GENERATION_KEY, generation, None)
+        self.memory.clear()
+        with self._generation_lock:
+            self._generation = generation
+            self._generation_checked = time.monotonic()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GoogleBooksCache()
+    return _cache
@@ -0,0 +1,218 @@
+"""Local thumbnails of the book covers, served by CoverView.
+
+Imported books point at their covers on books.google.com. Every cover is
+downloaded once, shrunk to COVER_THUMBNAIL_SIZE and stored as a JPEG in
+COVER_CACHE_DIR under the sha256 of its address. The URL of a thumbnail
+holds the same hash (see Book.cover_url), so a changed cover gets a new URL
+and browsers can keep a thumbnail forever.
+
+The covers of imported books are fetched in the background by
+prefetch_covers(), so the book list rarely waits for Google.
+
+Cover addresses are given by users, so only the hosts of
+COVER_ALLOWED_HOSTS are fetched, never at a private, loopback or link-local
+address, and redirects are checked the same way before being followed.
+"""
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image
+
+from booker_app.cache import TTLCache
+from booker_app.google_books import GoogleBooksClient
+from booker.settings import (
+    COVER_ALLOWED_HOSTS, COVER_CACHE_DIR, COVER_FAILURE_TTL,
+    COVER_FETCH_TIMEOUT, COVER_MAX_BYTES, COVER_PREFETCH_WORKERS,
+    COVER_THUMBNAIL_SIZE
+)
+
+
+# Thumbnail URLs never change their content
+COVER_MAX_AGE = 365 * 24 * 3600
+JPEG_QUALITY = 85
+MAX_REDIRECTS = 3
+
+
+class CoverError(Exception):
+    pass
+
+
+def cover_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def thumbnail_path(key):
+    # Subdirectories by the first byte keep the directories small
+    return os.path.join(COVER_CACHE_DIR, key[:2], f'{key}.jpg')
+
+
+_session = None
+_executor = None
+_setup_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _setup_lock:
+        if _session is None:
+            _session = GoogleBooksClient.build_session(COVER_PREFETCH_WORKERS)
+    return _session
+
+
+def get_executor():
+    global _executor
+    with _setup_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=COVER_PREFETCH_WORKERS)
+    return _executor
+
+
+def host_allowed(host):
+    host = (host or '').lower().rstrip('.')
+    return any(
+        host == allowed or host.endswith(f'.{allowed}')
+        for allowed in COVER_ALLOWED_HOSTS
+    )
+
+
+def is_proxied(url):
+    """Whether the cover at `url` is served through the local thumbnails;
+    covers from other hosts are linked to directly."""
+    parts = urlsplit(url)
+    return parts.scheme in ('http', 'https') and host_allowed(parts.hostname)
+
+
+def is_public_address(host, port):
+    """Whether every address `host` resolves to is a public one."""
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError):
+        return False
+    return bool(addresses) and all(
+        # Scoped IPv6 addresses end with %interface
+        ipaddress.ip_address(address[4][0].split('%')[0]).is_global
+        for address in addresses
+    )
+
+
+def check_url(url):
+    """Raises CoverError unless the cover at `url` may be fetched."""
+    parts = urlsplit(url)
+    if not is_proxied(url):
+        raise CoverError(f'Cover host not allowed: {parts.hostname}')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        raise CoverError(f'Invalid cover address: {url}')
+    if not is_public_address(parts.hostname, port):
+        raise CoverError(f'Cover host is not public: {parts.hostname}')
+
+
+def download(url):
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            check_url(url)
+            with get_session().get(
+                    url, timeout=COVER_FETCH_TIMEOUT, stream=True,
+                    allow_redirects=False) as response:
+                if response.is_redirect:
+                    url = urljoin(url, response.headers['Location'])
+                    continue
+                response.raise_for_status()
+                content = bytearray()
+                for chunk in response.iter_content(65536):
+                    content.extend(chunk)
+                    if len(content) > COVER_MAX_BYTES:
+                        raise CoverError(
+                            f'Cover larger than {COVER_MAX_BYTES}B')
+                return bytes(content)
+    except requests.RequestException as e:
+        raise CoverError(f'Cover download failed: {e}')
+    raise CoverError(f'More than {MAX_REDIRECTS} redirects')
+
+
+def make_thumbnail(content):
+    """JPEG of the image shrunk to fit in COVER_THUMBNAIL_SIZE."""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.thumbnail(COVER_THUMBNAIL_SIZE, Image.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise CoverError(f'Invalid cover image: {e}')
+    return output.getvalue()
+
+
+def store(path, data):
+    """Writes the file aside and renames it, so a thumbnail is never read
+    half written, whatever the number of processes."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(data)
+        os.replace(partial, path)
+    except BaseException:
+        os.remove(partial)
+        raise
+
+
+# Covers which failed recently, not to ask for them on every page view
+_failures = TTLCache(1024, COVER_FAILURE_TTL)
+# Locks of the covers being downloaded, so each is downloaded once
+_fetching = {}
+_fetching_lock = threading.Lock()
+
+
+def get_thumbnail(url):
+    """Path of the thumbnail of the cover at `url`, downloading it first if
+    it isn't stored yet. Raises CoverError."""
+    key = cover_key(url)
+    path = thumbnail_path(key)
+    if os.path.exists(path):
+        return path
+    error = _failures.get(key)
+    if error is not None:
+        raise CoverError(error)
+
+    with _fetching_lock:
+        lock = _fetching.setdefault(key, threading.Lock())
+    with lock:
+        try:
+            if not os.path.exists(path):
+                store(path, make_thumbnail(download(url)))
+        except CoverError as e:
+            _failures.set(key, str(e))
+            raise
+        finally:
+            with _fetching_lock:
+                _fetching.pop(key, None)
+    return path
+
+
+def prefetch(url):
+    try:
+        get_thumbnail(url)
+    except CoverError:
+        pass
+
+
+def prefetch_covers(urls):
+    """Downloads the covers served as thumbnails in the background.
+    Returns the futures."""
+    executor = get_executor()
+    return [
+        executor.submit(prefetch, url)
+        for url in set(urls) if url and is_proxied(url)
+    ]
@@ -0,0 +1,158 @@
+"""Export of the whole catalog, see BookExportView and
+`manage.py export_books`.
+
+Books are written in the dump formats read by `manage.py load_books`: CSV
+with the loader's CSV_COLUMNS or JSONL of volumeInfos, with the book `id`
+added. An export can so be loaded into another instance as is.
+
+The catalog is read in keyset windows of BOOK_EXPORT_WINDOW_SIZE books.
+Each window is one query joining the books to their identifiers, read
+through a server-side cursor BOOK_STREAM_CHUNK_SIZE rows at a time, in its
+own short transaction: however long the export, no snapshot or lock is
+held between windows and memory stays bounded by one chunk. Books written
+during an export are included if their window is not read yet.
+"""
+import csv
+import zlib
+from itertools import groupby
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from booker_app.loader import CSV_COLUMNS, split_authors
+from booker_app.models import Book, Identifier
+from booker.settings import BOOK_EXPORT_WINDOW_SIZE, BOOK_STREAM_CHUNK_SIZE
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+EXPORT_COLUMNS = ('id',) + CSV_COLUMNS
+BOOK_COLUMNS = (
+    'id',
+    'authors',
+    'title',
+    'pub_date',
+    'page_count',
+    'language',
+    'cover_image_adress'
+)
+# Output is sent in chunks of about this many characters rather than row
+# by row
+BUFFER_SIZE = 65536
+
+
+def window_end(last_id, window_size):
+    """Id of the last book of the window after `last_id`, or None if the
+    window holds every remaining book."""
+    ids = Book.objects.filter(id__gt=last_id).order_by('id').values_list(
+        'id', flat=True)
+    return ids[window_size - 1:window_size].first()
+
+
+def iter_books(window_size=None):
+    """Yields a (fields, identifiers) pair per book, in the order of ids:
+    a dict of BOOK_COLUMNS and a list of (type, value)."""
+    window_size = window_size or BOOK_EXPORT_WINDOW_SIZE
+    last_id = 0
+    while True:
+        end = window_end(last_id, window_size)
+        rows = Book.objects.filter(id__gt=last_id)
+        if end is not None:
+            rows = rows.filter(id__lte=end)
+        rows = rows.order_by('id', 'identifier__id').values_list(
+            *BOOK_COLUMNS, 'identifier__type', 'identifier__value'
+        ).iterator(chunk_size=BOOK_STREAM_CHUNK_SIZE)
+        for book_id, book_rows in groupby(rows, key=lambda row: row[0]):
+            book_rows = list(book_rows)
+            fields = dict(zip(BOOK_COLUMNS, book_rows[0]))
+            identifiers = [
+                (row[-2], row[-1]) for row in book_rows if row[-2] is not None
+            ]
+            yield fields, identifiers
+            last_id = book_id
+        if end is None:
+            return
+        # The books of the window may all have been deleted meanwhile
+        last_id = end
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(books):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    ident_types = [ident_type for ident_type, _ in Identifier.IDENTIFIER_TYPES]
+    for fields, identifiers in books:
+        identifiers = dict(identifiers)
+        pub_date = fields['pub_date']
+        yield writer.writerow([
+            fields['id'],
+            fields['title'],
+            fields['authors'],
+            pub_date.isoformat() if pub_date else '',
+            fields['page_count'] if fields['page_count'] is not None else '',
+            fields['language'],
+            fields['cover_image_adress'] or '',
+        ] + [identifiers.get(ident_type, '') for ident_type in ident_types])
+
+
+def jsonl_lines(books):
+    encoder = DjangoJSONEncoder()
+    for fields, identifiers in books:
+        volume = {
+            'id': fields['id'],
+            'title': fields['title'],
+            'authors': split_authors(fields['authors']),
+            'publishedDate': fields['pub_date'],
+            'pageCount': fields['page_count'],
+            'language': fields['language'],
+            'industryIdentifiers': [
+                {'type': ident_type, 'identifier': value}
+                for ident_type, value in identifiers
+            ]
+        }
+        if fields['cover_image_adress']:
+            volume['imageLinks'] = {
+                'thumbnail': fields['cover_image_adress']}
+        yield encoder.encode(volume) + '\n'
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzipped(chunks):
+    """Compresses the text chunks into a gzip stream as they come."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(output_format, compress=False, window_size=None):
+    """The catalog in `output_format` (a key of EXPORT_FORMATS): text
+    chunks, or bytes of gzip if `compress`."""
+    books = iter_books(window_size)
+    if output_format == 'csv':
+        lines = csv_lines(books)
+    else:
+        lines = jsonl_lines(books)
+    chunks = buffered(lines)
+    return gzipped(chunks) if compress else chunks
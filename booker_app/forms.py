@@ -1,9 +1,11 @@
+import re
 from datetime import datetime
 from django import forms
 from django.core.exceptions import ValidationError
 
+from booker_app.isbn import canonical_isbn, clean
 from booker_app.models import Book, Identifier
-from booker.settings import MAX_STR_LEN
+from booker.settings import IMPORT_BATCH_MAX_ISBNS, MAX_STR_LEN
 
 
 class BookForm(forms.Form):
@@ -176,3 +178,39 @@ class ImportBookForm(forms.Form):
             raise ValidationError("Fill in at least one field to import books")
 
         return cleaned
+
+
+class ImportBatchForm(forms.Form):
+    isbns = forms.CharField(
+        label='ISBNs',
+        help_text='ISBN-10s or ISBN-13s, one per line or separated with '
+                  'commas.',
+        widget=forms.Textarea(attrs={'rows': 12, 'cols': 30})
+    )
+
+    def clean_isbns(self):
+        """List of the ISBNs without separators; a book given with both
+        its ISBN-10 and ISBN-13 is kept once."""
+        isbns = []
+        seen = set()
+        invalid = []
+        for value in re.split(r'[\r\n,;]+', self.cleaned_data['isbns']):
+            value = value.strip()
+            if not value:
+                continue
+            canonical = canonical_isbn(value)
+            if canonical is None:
+                invalid.append(value)
+            elif canonical not in seen:
+                seen.add(canonical)
+                isbns.append(clean(value))
+        if invalid:
+            raise ValidationError(f'Invalid ISBNs: {", ".join(invalid)}')
+        if not isbns:
+            raise ValidationError('Give at least one ISBN.')
+        if len(isbns) > IMPORT_BATCH_MAX_ISBNS:
+            raise ValidationError(
+                f'At most {IMPORT_BATCH_MAX_ISBNS} ISBNs can be imported at '
+                f'once.'
+            )
+        return isbns
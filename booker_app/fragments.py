@@ -0,0 +1,47 @@
+"""Cache of the rendered book cards of the book list.
+
+Each card is rendered from partials/book_card.html once and kept in the
+default cache under the book id and its updated_at. A warm page is one
+get_many() and a join.
+
+Every write of a book sets its updated_at, so an edit gets a new key in
+every process, whatever the cache backend: an old card is never read
+again and expires after BOOK_CARD_CACHE_TIMEOUT. Identifier.save() and
+Identifier.delete() set the updated_at of their book; bulk writes of
+identifiers set it themselves. There are no signal receivers, which would
+turn the cascade of a book delete into a query per identifier.
+"""
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from booker.settings import BOOK_CARD_CACHE_TIMEOUT
+
+
+CARD_TEMPLATE = 'partials/book_card.html'
+# Bump when the card template changes, so stale markup is never served
+CARD_VERSION = 3
+
+
+def card_key(book):
+    return f'book_card:{book.id}:{book.updated_at.timestamp()}'
+
+
+def render_cards(books):
+    """Rendered cards of the given books, in order. Only the books missing
+    from the cache have their identifiers loaded and get rendered."""
+    keys = [card_key(book) for book in books]
+    cards = cache.get_many(keys, version=CARD_VERSION)
+    missing = [book for book, key in zip(books, keys) if key not in cards]
+    if missing:
+        prefetch_related_objects(missing, 'identifier_set')
+        rendered = {
+            card_key(book): render_to_string(CARD_TEMPLATE, {'book': book})
+            for book in missing
+        }
+        cache.set_many(
+            rendered, BOOK_CARD_CACHE_TIMEOUT, version=CARD_VERSION)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
+
@@ -0,0 +1,222 @@
+"""Client for the Google Books volumes API
+(https://developers.google.com/books/docs/v1/using#PerformingSearch).
+
+One client per process keeps a pool of keep-alive connections, so an
+import doesn't pay for a new TCP and TLS handshake on every request. Result
+pages past the first one are fetched in parallel on a bounded thread pool.
+
+AsyncGoogleBooksClient serves batches of small searches, eg. a list of
+ISBNs: every search is a coroutine on one asyncio event loop, with at most
+GOOGLE_BOOKS_MAX_CONCURRENCY requests in flight, so a batch takes about as
+long as its slowest lookups rather than their sum.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from booker_app.metrics import GOOGLE_BOOKS_SECONDS
+
+from booker.settings import (
+    GOOGLE_BOOKS_API_KEY, GOOGLE_BOOKS_API_URL, GOOGLE_BOOKS_CONNECT_TIMEOUT,
+    GOOGLE_BOOKS_MAX_CONCURRENCY, GOOGLE_BOOKS_MAX_ITEMS,
+    GOOGLE_BOOKS_MAX_WORKERS, GOOGLE_BOOKS_PAGE_SIZE, GOOGLE_BOOKS_READ_TIMEOUT
+)
+
+
+class GoogleBooksError(Exception):
+    pass
+
+
+def build_query(keywords_fields):
+    """Joins the special keywords, eg. {'intitle': 'flowers', 'isbn': ''}
+    into the `q` parameter: 'intitle:flowers'. Empty fields are skipped."""
+    return ' '.join(
+        f'{key_field}:{value}' for key_field, value
+        in keywords_fields.items() if value
+    )
+
+
+class GoogleBooksClient:
+    def __init__(
+            self,
+            api_url=GOOGLE_BOOKS_API_URL,
+            timeout=(GOOGLE_BOOKS_CONNECT_TIMEOUT, GOOGLE_BOOKS_READ_TIMEOUT),
+            page_size=GOOGLE_BOOKS_PAGE_SIZE,
+            max_items=GOOGLE_BOOKS_MAX_ITEMS,
+            max_workers=GOOGLE_BOOKS_MAX_WORKERS,
+            api_key=GOOGLE_BOOKS_API_KEY,
+            session=None):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.page_size = page_size
+        self.max_items = max_items
+        self.api_key = api_key
+        self.session = session or self.build_session(max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @staticmethod
+    def build_session(pool_size):
+        session = requests.Session()
+        retries = Retry(
+            total=2,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504)
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def fetch_page(self, query, start_index, max_results):
+        params = {
+            'q': query,
+            'startIndex': start_index,
+            'maxResults': max_results
+        }
+        if self.api_key:
+            params['key'] = self.api_key
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.session.get(
+                self.api_url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            page = response.json()
+            outcome = 'ok'
+            return page
+        except (requests.RequestException, ValueError) as e:
+            raise GoogleBooksError(f'Google Books request failed: {e}')
+        finally:
+            GOOGLE_BOOKS_SECONDS.observe(
+                time.perf_counter() - started, outcome=outcome)
+
+    def search(self, keywords_fields, max_items=None):
+        """Returns the volumeInfo of up to `max_items` matching volumes or
+        None if nothing was found."""
+        max_items = max_items or self.max_items
+        query = build_query(keywords_fields)
+        first_page = self.fetch_page(
+            query, 0, min(self.page_size, max_items))
+        # Check if user found any book. If not return None.
+        total = min(first_page.get('totalItems', 0), max_items)
+        if not total or not first_page.get('items'):
+            return None
+
+        start_indexes = range(self.page_size, total, self.page_size)
+        pages = [first_page] + list(self.executor.map(
+            lambda start: self.fetch_page(
+                query, start, min(self.page_size, total - start)),
+            start_indexes
+        ))
+
+        volume_infos = []
+        seen_ids = set()
+        for page in pages:
+            for item in page.get('items', []):
+                # Pages of a search can overlap when the index shifts
+                volume_id = item.get('id')
+                if volume_id and volume_id in seen_ids:
+                    continue
+                seen_ids.add(volume_id)
+                volume_infos.append(item['volumeInfo'])
+        return volume_infos[:max_items]
+
+
+class AsyncGoogleBooksClient:
+    # Same retry policy as the Retry of GoogleBooksClient.build_session
+    RETRIES = 2
+    BACKOFF_FACTOR = 0.3
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(
+            self,
+            api_url=GOOGLE_BOOKS_API_URL,
+            timeout=(GOOGLE_BOOKS_CONNECT_TIMEOUT, GOOGLE_BOOKS_READ_TIMEOUT),
+            page_size=GOOGLE_BOOKS_PAGE_SIZE,
+            concurrency=GOOGLE_BOOKS_MAX_CONCURRENCY,
+            api_key=GOOGLE_BOOKS_API_KEY):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.api_key = api_key
+
+    async def fetch_page(self, session, query, max_results):
+        params = {'q': query, 'startIndex': 0, 'maxResults': max_results}
+        if self.api_key:
+            params['key'] = self.api_key
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            for attempt in range(self.RETRIES + 1):
+                if attempt:
+                    await asyncio.sleep(
+                        self.BACKOFF_FACTOR * 2 ** (attempt - 1))
+                async with session.get(self.api_url, params=params) as response:
+                    if (response.status in self.RETRY_STATUSES
+                            and attempt < self.RETRIES):
+                        continue
+                    response.raise_for_status()
+                    page = await response.json(content_type=None)
+                    outcome = 'ok'
+                    return page
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise GoogleBooksError(f'Google Books request failed: {e!r}')
+        finally:
+            GOOGLE_BOOKS_SECONDS.observe(
+                time.perf_counter() - started, outcome=outcome)
+
+    async def search_first_page(self, session, semaphore, keywords_fields):
+        async with semaphore:
+            page = await self.fetch_page(
+                session, build_query(keywords_fields), self.page_size)
+        return [item['volumeInfo'] for item in page.get('items', [])] or None
+
+    async def search_all(self, searches):
+        connect_timeout, read_timeout = self.timeout
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout) as session:
+            return await asyncio.gather(
+                *(
+                    self.search_first_page(session, semaphore, fields)
+                    for fields in searches
+                ),
+                return_exceptions=True
+            )
+
+    def search_many(self, searches):
+        """Runs the searches (keywords_fields dicts) concurrently. Returns,
+        in their order, the volumeInfos of the first result page, None if
+        nothing was found or the GoogleBooksError of a failed search."""
+        if not searches:
+            return []
+        # A loop of its own: callers are plain threads, eg. import workers
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.search_all(searches))
+        finally:
+            loop.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process wide client sharing one connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GoogleBooksClient()
+    return _client
@@ -0,0 +1,196 @@
+"""Write path for volumes imported from Google Books.
+
+A whole batch of volumes is checked against the database with a constant
+number of queries and written with bulk inserts in a single transaction,
+instead of a lookup and a save per book and per identifier.
+"""
+from datetime import datetime
+
+from django.db import connection, transaction
+
+from booker_app.models import Book, CatalogVersion, Identifier
+
+
+# Statuses of the per-volume results returned by import_volumes()
+IMPORTED = 'imported'
+EXISTS = 'exists'
+INVALID = 'invalid'
+
+
+def clean_date(pub_date):
+    # Hack for date_pub if only a year or a year and a month are
+    # specified
+    if not pub_date:
+        return None
+    if len(pub_date) < 5:
+        pub_date += '-01-01'
+    elif len(pub_date) < 8:
+        pub_date += '-01'
+    return datetime.strptime(pub_date, '%Y-%m-%d').date()
+
+
+def volume_fields(item):
+    """Maps a Google Books volumeInfo to the Book field values and a list of
+    (type, value) identifier pairs. Plain data, so it can be computed in
+    another process."""
+    fields = {
+        # authors is a list; a book can sometimes miss authors as well.
+        'authors': ','.join(item.get('authors', [])),
+        'title': item['title'],
+        'pub_date': clean_date(item.get('publishedDate')),
+        'page_count': item.get('pageCount'),  # optional
+        'language': item.get('language', ''),
+        'cover_image_adress': item.get('imageLinks', {}).get('thumbnail')
+    }
+    identifiers = [
+        (ident['type'], ident['identifier'])
+        for ident in item.get('industryIdentifiers', [])
+    ]
+    return fields, identifiers
+
+
+def volume_to_book(item):
+    """Maps a Google Books volumeInfo to an unsaved Book and the list of its
+    unsaved Identifiers."""
+    fields, identifiers = volume_fields(item)
+    return fields_to_book(fields, identifiers)
+
+
+def fields_to_book(fields, identifiers):
+    book = Book(**fields)
+    identifiers = [
+        Identifier(type=ident_type, value=value)
+        for ident_type, value in identifiers
+    ]
+    return book, identifiers
+
+
+def import_volumes(volume_infos):
+    """Saves the volumes which are not in the database yet.
+
+    Returns one result per volume, in order: a dict with `title`, `status`
+    (IMPORTED, EXISTS or INVALID), `book_id` and `message`.
+    """
+    results = []
+    candidates = []  # (result, book, identifiers) of volumes to be saved
+    for item in volume_infos:
+        result = new_result(item.get('title'))
+        results.append(result)
+        try:
+            book, identifiers = volume_to_book(item)
+        except (KeyError, ValueError) as e:
+            result['status'] = INVALID
+            result['message'] = f'Invalid volume data: {e}'
+            continue
+        candidates.append((result, book, identifiers))
+
+    save_books(filter_new_books(candidates))
+    return results
+
+
+def new_result(title):
+    return {'title': title, 'status': IMPORTED, 'book_id': None, 'message': ''}
+
+
+def too_long_field(obj):
+    """First field of the unsaved instance whose value exceeds its
+    max_length, which the database would refuse along with the whole batch;
+    None if every value fits."""
+    for field in obj._meta.concrete_fields:
+        value = getattr(obj, field.attname)
+        if (field.max_length is not None and isinstance(value, str)
+                and len(value) > field.max_length):
+            return field
+    return None
+
+
+def filter_new_books(candidates):
+    """Drops the (result, book, identifiers) candidates which are invalid or
+    already stored, marking their results. A constant number of queries is
+    used whatever the number of candidates."""
+    valid = []
+    for result, book, identifiers in candidates:
+        field = next(
+            filter(None, map(too_long_field, [book] + identifiers)), None)
+        if field is not None:
+            result['status'] = INVALID
+            result['message'] = (
+                f'Invalid volume data: {field.name} is longer than '
+                f'{field.max_length} characters.'
+            )
+            continue
+        ident_types = [ident.type for ident in identifiers]
+        duplicated_types = {t for t in ident_types if ident_types.count(t) > 1}
+        if duplicated_types:
+            result['status'] = INVALID
+            result['message'] = (
+                f'Identifier for Book: {book.title} with type: '
+                f'{duplicated_types.pop()} already exists.'
+            )
+            continue
+        valid.append((result, book, identifiers))
+
+    # Identifier values and book fingerprints are unique, so two IN
+    # queries tell which volumes are already stored.
+    incoming_values = [
+        ident.value for _, _, identifiers in valid for ident in identifiers
+    ]
+    seen_values = set(Identifier.objects.filter(
+        value__in=incoming_values).values_list('value', flat=True))
+    seen_books = set(Book.objects.filter(
+        fingerprint__in=[book.fill_fingerprint() for _, book, _ in valid]
+    ).values_list('fingerprint', flat=True))
+
+    to_save = []
+    for result, book, identifiers in valid:
+        existing = [i for i in identifiers if i.value in seen_values]
+        if existing:
+            result['status'] = EXISTS
+            result['message'] = (
+                f'Book with {existing[0].type}: {existing[0].value} '
+                f'already exists.'
+            )
+            continue
+        if book.fingerprint in seen_books:
+            result['status'] = EXISTS
+            result['message'] = (
+                f'{book.title} by {book.authors} already exists.')
+            continue
+        # Guards against the same volume appearing twice in one batch
+        seen_values.update(ident.value for ident in identifiers)
+        seen_books.add(book.fingerprint)
+        to_save.append((result, book, identifiers))
+    return to_save
+
+
+def save_books(to_save):
+    """Inserts the (result, book, identifiers) of filter_new_books() in bulk,
+    in one transaction, and fills in their results."""
+    with transaction.atomic():
+        books = [book for _, book, _ in to_save]
+        for book in books:
+            book.fill_search_keys()
+        if connection.features.can_return_ids_from_bulk_insert:
+            Book.objects.bulk_create(books)
+        else:
+            # Without RETURNING the ids of bulk inserted rows are unknown
+            for book in books:
+                book.save()
+        Identifier.objects.bulk_create(link_identifiers(to_save))
+        if to_save:
+            CatalogVersion.bump()
+
+
+def link_identifiers(to_save):
+    """Points the identifiers at their saved books and completes the
+    results. Returns the identifiers to insert."""
+    new_identifiers = []
+    for result, book, identifiers in to_save:
+        result['book_id'] = book.id
+        result['message'] = f'"{book.title}" imported to the database.'
+        for ident in identifiers:
+            ident.book = book
+            # Bulk inserts skip Identifier.save()
+            ident.fill_canonical()
+            new_identifiers.append(ident)
+    return new_identifiers
@@ -0,0 +1,62 @@
+"""Normalization of book identifiers.
+
+The canonical form of an ISBN is its ISBN-13 without hyphens or spaces, so
+the ISBN-10 and ISBN-13 of a book, however written, have the same canonical
+value. Other identifiers are only stripped of hyphens and spaces.
+"""
+import re
+
+
+SEPARATORS_RE = re.compile(r'[\s-]')
+ISBN_TYPES = ('ISBN_10', 'ISBN_13')
+
+
+def clean(value):
+    return SEPARATORS_RE.sub('', value or '').upper()
+
+
+def is_isbn10(value):
+    if not re.fullmatch(r'\d{9}[\dX]', value):
+        return False
+    digits = [10 if d == 'X' else int(d) for d in value]
+    return sum((10 - i) * d for i, d in enumerate(digits)) % 11 == 0
+
+
+def isbn13_check_digit(first_12):
+    total = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(first_12))
+    return str((10 - total % 10) % 10)
+
+
+def is_isbn13(value):
+    return (
+        bool(re.fullmatch(r'97[89]\d{10}', value))
+        and isbn13_check_digit(value[:12]) == value[12]
+    )
+
+
+def isbn10_to_isbn13(value):
+    first_12 = '978' + value[:9]
+    return first_12 + isbn13_check_digit(first_12)
+
+
+def canonical_isbn(value):
+    """ISBN-13 of a valid ISBN-10 or ISBN-13, or None."""
+    value = clean(value)
+    if is_isbn13(value):
+        return value
+    if is_isbn10(value):
+        return isbn10_to_isbn13(value)
+    return None
+
+
+def canonical_identifier(ident_type, value):
+    """Canonical value of a stored identifier; None for an ISBN which fails
+    its checksum."""
+    if ident_type in ISBN_TYPES:
+        return canonical_isbn(value)
+    return clean(value) or None
+
+
+def canonical_lookup(value):
+    """Canonical value to look up a raw identifier of unknown type."""
+    return canonical_isbn(value) or clean(value) or None
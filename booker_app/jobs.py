@@ -0,0 +1,224 @@
+"""Database backed queue of Google Books imports.
+
+ImportBookView only stores an ImportJob and returns; the external HTTP call
+and the database writes happen in `manage.py run_import_worker`, so a slow
+import never blocks a web worker.
+
+Batch jobs of ImportBatchView import a list of ISBNs: the ISBNs already in
+the catalog are skipped, the others are looked up concurrently (see
+AsyncGoogleBooksClient) and the volumes found are saved together with
+import_volumes().
+
+The covers of the books imported by a job are then downloaded in the
+background, see covers.prefetch_covers().
+
+A running job holds a lease, renewed every IMPORT_JOB_HEARTBEAT_INTERVAL
+seconds by the worker running it. Workers put back in the queue the jobs
+whose lease has expired, ie. whose worker died.
+"""
+import json
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from booker_app.cache import get_cache
+from booker_app.covers import prefetch_covers
+from booker_app.google_books import (
+    AsyncGoogleBooksClient, GoogleBooksError, get_client
+)
+from booker_app.importer import EXISTS, IMPORTED, import_volumes, new_result
+from booker_app.isbn import canonical_isbn
+from booker_app.models import Book, Identifier, ImportJob
+from booker.settings import IMPORT_JOB_HEARTBEAT_INTERVAL
+
+
+# Statuses of the per-ISBN results of batch jobs, besides the ones of
+# import_volumes()
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+
+def call_google_api(keywords_fields):
+    return get_cache().search(keywords_fields, get_client().search)
+
+
+def enqueue_import(keywords_fields):
+    return ImportJob.objects.create(query=json.dumps(keywords_fields))
+
+
+def enqueue_batch_import(isbns):
+    return ImportJob.objects.create(query=json.dumps({'isbns': isbns}))
+
+
+def lookup_isbns(isbns):
+    """Maps every ISBN to the volume infos found for it (a list, empty if
+    none) or to the GoogleBooksError of its search. Cached searches are
+    reused, the others run concurrently."""
+    cache = get_cache()
+    found = {isbn: cache.get({'isbn': isbn}) for isbn in isbns}
+    missing = [isbn for isbn in isbns if found[isbn] is None]
+    searched = AsyncGoogleBooksClient().search_many(
+        [{'isbn': isbn} for isbn in missing])
+    for isbn, volume_infos in zip(missing, searched):
+        if not isinstance(volume_infos, Exception):
+            volume_infos = volume_infos or []
+            cache.set({'isbn': isbn}, volume_infos)
+        found[isbn] = volume_infos
+    return found
+
+
+def import_isbns(isbns):
+    """Imports the first volume found for each ISBN. Returns one result
+    per ISBN, in order: the result of import_volumes() with the `isbn`."""
+    canonical = {isbn: canonical_isbn(isbn) for isbn in isbns}
+    stored = dict(Identifier.objects.filter(
+        canonical__in=[value for value in canonical.values() if value]
+    ).values_list('canonical', 'book_id'))
+
+    results = {}
+    to_lookup = []
+    for isbn in isbns:
+        book_id = stored.get(canonical[isbn])
+        if book_id is None:
+            to_lookup.append(isbn)
+            continue
+        result = results[isbn] = new_result(None)
+        result['status'] = EXISTS
+        result['book_id'] = book_id
+        result['message'] = f'ISBN {isbn} is already in the catalog.'
+
+    volumes = []
+    for isbn, volume_infos in lookup_isbns(to_lookup).items():
+        if isinstance(volume_infos, Exception):
+            result = results[isbn] = new_result(None)
+            result['status'] = FAILED
+            result['message'] = str(volume_infos)
+        elif not volume_infos:
+            result = results[isbn] = new_result(None)
+            result['status'] = NOT_FOUND
+            result['message'] = f'No volume found for ISBN {isbn}.'
+        else:
+            volumes.append((isbn, volume_infos[0]))
+    imported = import_volumes([volume_info for _, volume_info in volumes])
+    for (isbn, _), result in zip(volumes, imported):
+        results[isbn] = result
+
+    return [dict(results[isbn], isbn=isbn) for isbn in isbns]
+
+
+def claim_next_job():
+    """Marks the oldest queued job as running and returns it, or None if the
+    queue is empty. Safe to call from many workers at once."""
+    with transaction.atomic():
+        # Rows locked by other workers are skipped instead of waited for
+        queued = ImportJob.objects.filter(status=ImportJob.QUEUED)
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        job = queued.order_by('id').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        # Compare-and-set, for databases without row locks
+        claimed = ImportJob.objects.filter(
+            id=job.id, status=ImportJob.QUEUED
+        ).update(status=ImportJob.RUNNING, started_at=now, heartbeat_at=now)
+        if not claimed:
+            return None
+        job.status = ImportJob.RUNNING
+        job.started_at = job.heartbeat_at = now
+        return job
+
+
+@contextmanager
+def lease(job, interval=None):
+    """Renews the lease of the running `job` every `interval` seconds while
+    the block runs, so that requeue_stale_jobs() leaves it alone."""
+    interval = interval or IMPORT_JOB_HEARTBEAT_INTERVAL
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(interval):
+                try:
+                    ImportJob.objects.filter(
+                        id=job.id, status=ImportJob.RUNNING
+                    ).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    # eg. the database restarting; renewed next time
+                    connection.close()
+        finally:
+            # The thread has its own connection
+            connection.close()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    with lease(job):
+        import_job(job)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'results', 'error', 'finished_at'])
+    if job.status == ImportJob.DONE:
+        prefetch_imported_covers(job.result_list)
+    return job
+
+
+def import_job(job):
+    """Runs the import of `job`, setting its status, results and error."""
+    try:
+        if job.isbns is not None:
+            job.results = json.dumps(import_isbns(job.isbns))
+        else:
+            volume_infos = call_google_api(job.keywords_fields)
+            if volume_infos:
+                job.results = json.dumps(import_volumes(volume_infos))
+            else:
+                job.error = 'No volumes found. Change your search terms.'
+        job.status = ImportJob.DONE
+    except GoogleBooksError as e:
+        job.status = ImportJob.FAILED
+        job.error = str(e)
+    except Exception:
+        job.status = ImportJob.FAILED
+        job.error = traceback.format_exc()
+
+
+def prefetch_imported_covers(results):
+    book_ids = [
+        result['book_id'] for result in results
+        if result['status'] == IMPORTED
+    ]
+    if book_ids:
+        prefetch_covers(Book.objects.filter(
+            id__in=book_ids, cover_image_adress__isnull=False
+        ).values_list('cover_image_adress', flat=True))
+
+
+def run_pending_jobs():
+    """Runs queued jobs until the queue is empty. Returns how many ran."""
+    count = 0
+    job = claim_next_job()
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim_next_job()
+    return count
+
+
+def requeue_stale_jobs(timeout):
+    """Puts back the running jobs whose lease wasn't renewed for `timeout`
+    seconds, left by a worker which died."""
+    return ImportJob.objects.filter(
+        status=ImportJob.RUNNING,
+        heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(status=ImportJob.QUEUED, started_at=None, heartbeat_at=None)
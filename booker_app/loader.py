@@ -0,0 +1,195 @@
+"""Streaming bulk load of Google Books volume dumps, see
+`manage.py load_books`.
+
+Records are read lazily from a JSONL or CSV file, parsed into field values
+on a process pool (volume_fields of the importer) and written batch by
+batch. On PostgreSQL a batch is written with COPY into preallocated ids,
+elsewhere with the bulk inserts of the importer.
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.db import connection, transaction
+
+from booker_app.importer import (
+    EXISTS, IMPORTED, INVALID, fields_to_book, filter_new_books,
+    link_identifiers, new_result, save_books, volume_fields
+)
+from booker_app.models import Book, CatalogVersion, Identifier
+
+
+# Columns of a CSV dump. Authors are separated with commas, as in
+# Book.authors, the identifier columns are named after
+# Identifier.IDENTIFIER_TYPES.
+CSV_COLUMNS = (
+    'title', 'authors', 'publishedDate', 'pageCount', 'language', 'thumbnail',
+    'ISBN_10', 'ISBN_13', 'ISSN', 'OTHER'
+)
+
+
+def iter_records(path, file_format, skip=0):
+    """Raw records of the dump: lines of JSONL or dict rows of CSV."""
+    with open(path, newline='' if file_format == 'csv' else None) as dump:
+        if file_format == 'csv':
+            records = csv.DictReader(dump)
+        else:
+            records = (line for line in dump if line.strip())
+        for record in islice(records, skip, None):
+            yield record
+
+
+def iter_batches(records, batch_size):
+    records = iter(records)
+    batch = list(islice(records, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(records, batch_size))
+
+
+def split_authors(authors):
+    """Authors of a comma separated Book.authors, kept as they are: joined
+    back by volume_fields(), they give the same string and fingerprint."""
+    return authors.split(',') if authors else []
+
+
+def csv_row_to_volume(row):
+    volume = {
+        'authors': split_authors(row.get('authors')),
+        'publishedDate': row.get('publishedDate') or None,
+        'language': row.get('language') or '',
+        'industryIdentifiers': [
+            {'type': ident_type, 'identifier': row[ident_type]}
+            for ident_type, _ in Identifier.IDENTIFIER_TYPES
+            if row.get(ident_type)
+        ]
+    }
+    if row.get('title'):
+        volume['title'] = row['title']
+    if row.get('pageCount'):
+        volume['pageCount'] = int(row['pageCount'])
+    if row.get('thumbnail'):
+        volume['imageLinks'] = {'thumbnail': row['thumbnail']}
+    return volume
+
+
+def parse_batch(records, file_format):
+    """Runs in the pool. Returns a (title, fields, identifiers, error) tuple
+    per record; `error` is None for valid ones."""
+    parsed = []
+    for record in records:
+        title = None
+        try:
+            if file_format == 'csv':
+                volume = csv_row_to_volume(record)
+            else:
+                volume = json.loads(record)
+                # Both volume resources and bare volumeInfos are accepted
+                volume = volume.get('volumeInfo', volume)
+            title = volume.get('title')
+            fields, identifiers = volume_fields(volume)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            parsed.append((title, None, None, f'Invalid volume data: {e}'))
+            continue
+        parsed.append((title, fields, identifiers, None))
+    return parsed
+
+
+def copy_value(value):
+    if value is None:
+        return ''  # NULL in the CSV format of COPY
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_objects(cursor, model, objs):
+    """Inserts unsaved model instances with one COPY, assigning their ids
+    from the table's sequence beforehand."""
+    if not objs:
+        return
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+        "FROM generate_series(1, %s)",
+        [model._meta.db_table, len(objs)]
+    )
+    for obj, (pk,) in zip(objs, cursor.fetchall()):
+        obj.pk = pk
+
+    fields = model._meta.concrete_fields
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write(','.join(
+            copy_value(field.get_db_prep_save(
+                field.pre_save(obj, add=True), connection))
+            for field in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields)
+    cursor.copy_expert(
+        f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+        f'({columns}) FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+
+
+def write_batch(parsed):
+    """Saves the parsed records which are not stored yet. Returns the
+    counts of IMPORTED, EXISTS and INVALID records."""
+    results = []
+    candidates = []
+    for title, fields, identifiers, error in parsed:
+        result = new_result(title)
+        results.append(result)
+        if error:
+            result['status'] = INVALID
+            result['message'] = error
+            continue
+        book, identifiers = fields_to_book(fields, identifiers)
+        candidates.append((result, book, identifiers))
+
+    to_save = filter_new_books(candidates)
+    if connection.vendor == 'postgresql':
+        books = [book for _, book, _ in to_save]
+        for book in books:
+            book.fill_search_keys()
+        with transaction.atomic(), connection.cursor() as cursor:
+            copy_objects(cursor, Book, books)
+            copy_objects(cursor, Identifier, link_identifiers(to_save))
+            if to_save:
+                CatalogVersion.bump()
+    else:
+        save_books(to_save)
+
+    counts = {IMPORTED: 0, EXISTS: 0, INVALID: 0}
+    for result in results:
+        counts[result['status']] += 1
+    return counts
+
+
+class Checkpoint:
+    """Number of records of a dump already loaded, stored next to it so an
+    interrupted load can be resumed."""
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as checkpoint:
+            return json.load(checkpoint)['records']
+
+    def save(self, records):
+        # Written aside and renamed, so a crash never leaves half a file
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump({'records': records}, checkpoint)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from booker_app.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends requests to every booker_app route through the test client '
+        'and writes p50/p95/p99 latency, throughput and query counts per '
+        'scenario to a JSON file. Run generate_books first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='JSON report to write.')
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Timed requests per scenario.')
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Untimed requests sent before the timed ones.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed choosing the books and search terms requested.')
+        parser.add_argument(
+            '--writes', action='store_true',
+            help='Also add, edit and delete books, one by one and in '
+                 'batches, and queue imports; what is created is removed '
+                 'afterwards.')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help='Run only this scenario; can be repeated.')
+
+    def handle(self, *args, **options):
+        report = run_benchmark(
+            requests=options['requests'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            writes=options['writes'],
+            only=options['scenarios']
+        )
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+
+        for name, stats in sorted(report['scenarios'].items()):
+            self.stdout.write(
+                f"{name}: p50 {stats['p50_ms']} ms, "
+                f"p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, "
+                f"{stats['throughput_rps']} req/s, "
+                f"{stats['queries_mean']} queries"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Report written to {options['output']}."))
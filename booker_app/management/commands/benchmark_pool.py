@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from booker_app.benchmark import run_connection_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends queries from several threads, opening a connection for each '
+        'one and then borrowing connections from a pool, and writes the '
+        'p50/p95/p99 latency of both to a JSON file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='benchmark_pool.json',
+            help='JSON report to write.')
+        parser.add_argument(
+            '--database', default='default',
+            help='Alias of the database to connect to.')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Requests per thread.')
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Threads sending requests, like the threads of a worker.')
+        parser.add_argument(
+            '--query', default='SELECT 1',
+            help='Query of every request.')
+        parser.add_argument(
+            '--min-size', type=int, default=1,
+            help='Connections the pool opens ahead.')
+        parser.add_argument(
+            '--max-size', type=int, default=4,
+            help='Connections of the pool at most.')
+
+    def handle(self, *args, **options):
+        report = run_connection_benchmark(
+            alias=options['database'],
+            requests=options['requests'],
+            threads=options['threads'],
+            query=options['query'],
+            min_size=options['min_size'],
+            max_size=options['max_size']
+        )
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+            output.write('\n')
+
+        for name, stats in sorted(report['scenarios'].items()):
+            self.stdout.write(
+                f"{name}: p50 {stats['p50_ms']} ms, "
+                f"p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms, "
+                f"{stats['throughput_rps']} req/s, {stats['errors']} errors"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Report written to {options['output']}."))
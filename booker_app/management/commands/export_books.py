@@ -0,0 +1,60 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booker_app.export import EXPORT_FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports the whole catalog with its identifiers to a CSV or JSONL '
+        'file, which `load_books` can load back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Output file; gzipped if its name ends with .gz.')
+        parser.add_argument(
+            '--format', choices=sorted(EXPORT_FORMATS),
+            help='Output format. Guessed from the file extension by default.')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Compress the output whatever the file name.')
+        parser.add_argument(
+            '--window-size', type=int,
+            help='Books read per query. Defaults to BOOK_EXPORT_WINDOW_SIZE.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path.lower()
+        if name.endswith('.gz'):
+            name = name[:-3]
+        compress = options['gzip'] or name != path.lower()
+        file_format = options['format'] or (
+            'csv' if name.endswith('.csv') else 'jsonl')
+        if os.path.isdir(path):
+            raise CommandError(f'{path} is a directory')
+
+        started = time.monotonic()
+        # Written aside, so an interrupted export never replaces a good one
+        partial = f'{path}.part'
+        if compress:
+            output = open(partial, 'wb')
+        else:
+            output = open(partial, 'w', newline='')
+        try:
+            with output:
+                for chunk in export_stream(
+                        file_format, compress, options['window_size']):
+                    output.write(chunk)
+        except BaseException:
+            os.remove(partial)
+            raise
+        os.replace(partial, path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported the catalog to {path} ({os.path.getsize(path)} bytes, '
+            f'{time.monotonic() - started:.1f}s).'
+        ))
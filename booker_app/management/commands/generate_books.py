@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booker_app.benchmark import synthetic_batches
+from booker_app.importer import EXISTS, IMPORTED, INVALID
+from booker_app.loader import write_batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the catalog with synthetic books and identifiers for '
+        'benchmarks. The same options always generate the same books.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--books', type=int, default=100000,
+            help='Number of books; each gets 1 to 4 identifiers.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of the random generator.')
+        parser.add_argument(
+            '--start', type=int, default=0,
+            help='Number of the first book, to add more books to a '
+                 'generated catalog.')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Books written together.')
+
+    def handle(self, *args, **options):
+        counts = {IMPORTED: 0, EXISTS: 0, INVALID: 0}
+        started = time.monotonic()
+        batches = synthetic_batches(
+            options['books'], options['seed'], options['start'],
+            options['batch_size'])
+        for batch in batches:
+            for status, count in write_batch(batch).items():
+                counts[status] += count
+            processed = sum(counts.values())
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{processed} books: {counts[IMPORTED]} created, '
+                f'{counts[EXISTS]} existing ({rate:.0f} rows/s)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {counts[IMPORTED]} books.'))
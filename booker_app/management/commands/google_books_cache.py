@@ -0,0 +1,67 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booker_app.cache import get_cache
+from booker_app.google_books import GoogleBooksError, get_client
+
+
+# A query line looks like the `q` parameter, eg. 'inauthor:tolkien isbn:123'
+QUERY_FIELD_RE = re.compile(r'(\w+):(.*?)(?=\s+\w+:|$)')
+SEARCH_KEYWORDS = ('inauthor', 'intitle', 'isbn', 'lccn', 'oclc')
+
+
+def parse_query(line):
+    keywords_fields = {}
+    for key_field, value in QUERY_FIELD_RE.findall(line.strip()):
+        if key_field not in SEARCH_KEYWORDS:
+            raise CommandError(f'Unknown search keyword: {key_field}')
+        keywords_fields[key_field] = value.strip()
+    return keywords_fields
+
+
+class Command(BaseCommand):
+    help = (
+        'Purges or pre-warms the Google Books lookup cache. Queries to warm '
+        'are read one per line, eg. "inauthor:tolkien intitle:hobbit".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='Remove every cached lookup.')
+        parser.add_argument(
+            '--warm', metavar='FILE',
+            help='File with queries to look up and cache, one per line.')
+
+    def handle(self, *args, **options):
+        if not options['purge'] and not options['warm']:
+            raise CommandError('Pass --purge and/or --warm FILE.')
+
+        cache = get_cache()
+        if options['purge']:
+            cache.purge()
+            self.stdout.write('Google Books cache purged.')
+
+        if options['warm']:
+            client = get_client()
+            with open(options['warm']) as queries:
+                for line in queries:
+                    keywords_fields = parse_query(line)
+                    if not keywords_fields:
+                        continue
+                    try:
+                        volume_infos = cache.search(
+                            keywords_fields, client.search)
+                    except GoogleBooksError as e:
+                        self.stderr.write(f'{line.strip()}: {e}')
+                        continue
+                    self.stdout.write(
+                        f'{line.strip()}: {len(volume_infos or [])} volumes')
+
+        stats = cache.stats
+        self.stdout.write(
+            f"memory hits: {stats['memory_hits']}, "
+            f"persistent hits: {stats['persistent_hits']}, "
+            f"misses: {stats['misses']}"
+        )
@@ -0,0 +1,86 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booker_app.importer import EXISTS, IMPORTED, INVALID
+from booker_app.loader import (
+    Checkpoint, iter_batches, iter_records, parse_batch, write_batch
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads a Google Books volume dump (JSONL of volumes or volumeInfos, '
+        'or CSV) into the catalog, skipping books which are already stored.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV dump.')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Dump format. Guessed from the file extension by default.')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Records parsed and written together.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Parser processes; 0 parses in the main process.')
+        parser.add_argument(
+            '--checkpoint',
+            help='Checkpoint file. Defaults to PATH.checkpoint.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Skip the records loaded by a previous, interrupted run.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl')
+        checkpoint = Checkpoint(options['checkpoint'] or f'{path}.checkpoint')
+        done = checkpoint.load() if options['resume'] else 0
+        if done:
+            self.stdout.write(f'Resuming after {done} records.')
+
+        batches = iter_batches(
+            iter_records(path, file_format, skip=done), options['batch_size'])
+        counts = {IMPORTED: 0, EXISTS: 0, INVALID: 0}
+        started = time.monotonic()
+        for parsed in self.parse(batches, file_format, options['workers']):
+            for status, count in write_batch(parsed).items():
+                counts[status] += count
+            # The batch is committed, so it never has to be loaded again
+            done += len(parsed)
+            checkpoint.save(done)
+            processed = sum(counts.values())
+            rate = processed / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{done} records: {counts[IMPORTED]} imported, '
+                f'{counts[EXISTS]} existing, {counts[INVALID]} invalid '
+                f'({rate:.0f} rows/s)'
+            )
+
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {path}: {counts[IMPORTED]} books imported.'))
+
+    def parse(self, batches, file_format, workers):
+        """Parsed batches in the order of the file. At most two batches per
+        worker are in flight, so the dump is never read ahead into memory."""
+        if not workers:
+            for batch in batches:
+                yield parse_batch(batch, file_format)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.submit(parse_batch, batch, file_format))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
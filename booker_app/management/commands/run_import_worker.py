@@ -0,0 +1,88 @@
+import threading
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from booker_app.jobs import claim_next_job, requeue_stale_jobs, run_job
+from booker.settings import IMPORT_JOB_HEARTBEAT_INTERVAL, IMPORT_JOB_TIMEOUT
+
+
+class Command(BaseCommand):
+    help = 'Runs the Google Books import jobs queued by the import form.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=2,
+            help='Number of jobs run at the same time.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is empty instead of polling.')
+
+    def handle(self, *args, **options):
+        self.requeue()
+
+        self.stop = threading.Event()
+        threads = [
+            threading.Thread(target=self.work, args=(options,), daemon=True)
+            for _ in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        # Jobs of workers which die later, here or in other processes, are
+        # put back once their lease expires
+        next_requeue = time.monotonic() + IMPORT_JOB_HEARTBEAT_INTERVAL
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+                    if time.monotonic() >= next_requeue:
+                        self.requeue()
+                        next_requeue += IMPORT_JOB_HEARTBEAT_INTERVAL
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+    def requeue(self):
+        try:
+            requeued = requeue_stale_jobs(IMPORT_JOB_TIMEOUT)
+        except DatabaseError as e:
+            self.stderr.write(f'Could not requeue stale jobs: {e}')
+            connection.close()
+            return
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs.')
+
+    def work(self, options):
+        try:
+            while not self.stop.is_set():
+                try:
+                    job = claim_next_job()
+                except DatabaseError as e:
+                    # eg. the database restarting; try again later
+                    self.stderr.write(f'Could not claim a job: {e}')
+                    connection.close()
+                    job = None
+                if job is None:
+                    if options['once']:
+                        return
+                    self.stop.wait(options['poll_interval'])
+                    continue
+                try:
+                    job = run_job(job)
+                except Exception:
+                    # Left running if it couldn't be saved, the job is
+                    # queued again once its lease expires
+                    self.stderr.write(
+                        f'{job} failed:\n{traceback.format_exc()}')
+                    connection.close()
+                    continue
+                self.stdout.write(f'{job}')
+        finally:
+            # Every thread has its own connection
+            connection.close()
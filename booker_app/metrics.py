@@ -0,0 +1,460 @@
+"""Request metrics in the Prometheus text format, served by MetricsView.
+
+MetricsMiddleware times every request, streamed bodies included, and
+counts its database queries (through an execute_wrapper), labelled with
+the URL name of the view. The Google Books client records its HTTP calls.
+Everything is kept in memory of the process, with a lock per metric, so
+the cost per request is a few dictionary updates.
+
+Without METRICS_DIR every process (web worker, import worker) exposes only
+its own numbers. With it, every process writes its numbers to a file of
+that directory at most every METRICS_FLUSH_INTERVAL seconds and on exit,
+and a scrape adds up the files of all of them: counters keep growing
+whichever worker answers. Gauges only count the processes still alive.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.db import connections
+
+from booker.db.pool import all_pools
+from booker.settings import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def escape_label(value):
+    return (
+        str(value).replace('\\', r'\\').replace('\n', r'\n')
+        .replace('"', r'\"')
+    )
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+    registry = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.registry:
+            self.registry.changed()
+
+    def snapshot(self):
+        """{label values: value} of this process."""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, key)} {value}'
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    kind = 'histogram'
+    registry = None
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # Per label values: [count of each bucket and +Inf, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+        if self.registry:
+            self.registry.changed()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: [list(counts), total]
+                for key, (counts, total) in self._series.items()
+            }
+
+    @staticmethod
+    def merge(value, other):
+        (counts, total), (other_counts, other_total) = value, other
+        return [
+            [a + b for a, b in zip(counts, other_counts)],
+            total + other_total
+        ]
+
+    def samples(self, values):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        for key, (counts, total) in sorted(values.items()):
+            if len(counts) != len(bounds):
+                continue  # written with other buckets, by an older release
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', bound)])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Collected:
+    """Metric kept elsewhere, eg. by the connection pools: `collect()`
+    returns its {label values: value} when the metrics are scraped."""
+    registry = None
+
+    def __init__(self, name, documentation, kind, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.collect = collect
+        self.labelnames = labelnames
+
+    def snapshot(self):
+        return self.collect()
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    samples = Counter.samples
+
+    def clear(self):
+        pass
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        # Callables returning (name, kind, documentation, value) of values
+        # kept elsewhere, read when the metrics are scraped
+        self.collectors = []
+        self._next_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric):
+        metric.registry = self
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Values of every metric of this process, as
+        {name: [[label values, value], ...]}."""
+        values = {
+            metric.name: [
+                [list(key), value]
+                for key, value in metric.snapshot().items()
+            ]
+            for metric in self.metrics
+        }
+        for collector in self.collectors:
+            for name, _, _, value in collector():
+                values[name] = [[[], value]]
+        return values
+
+    def path(self, pid):
+        return os.path.join(METRICS_DIR, f'metrics_{pid}.json')
+
+    def flush(self):
+        """Writes the values of this process to METRICS_DIR."""
+        if not METRICS_DIR:
+            return
+        with self._flush_lock:
+            self._next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL
+            path = self.path(os.getpid())
+            # Written aside and renamed, so a scrape never reads half a file
+            partial = f'{path}.part'
+            with open(partial, 'w') as output:
+                json.dump(self.snapshot(), output)
+            os.replace(partial, path)
+
+    def changed(self):
+        if METRICS_DIR and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def snapshots(self):
+        """(pid, values) of every process: this one and, with
+        METRICS_DIR, the ones which wrote there."""
+        if not METRICS_DIR:
+            return [(os.getpid(), self.snapshot())]
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self.flush()
+        snapshots = []
+        for filename in os.listdir(METRICS_DIR):
+            if not (filename.startswith('metrics_')
+                    and filename.endswith('.json')):
+                continue
+            try:
+                pid = int(filename[len('metrics_'):-len('.json')])
+                with open(os.path.join(METRICS_DIR, filename)) as snapshot:
+                    snapshots.append((pid, json.load(snapshot)))
+            except (ValueError, OSError):
+                continue  # eg. removed meanwhile
+        return snapshots
+
+    def render(self):
+        snapshots = self.snapshots()
+        alive = {
+            pid for pid, _ in snapshots
+            if pid == os.getpid() or process_alive(pid)
+        }
+        lines = []
+        for metric in self.metrics:
+            values = {}
+            for pid, snapshot in snapshots:
+                if metric.kind == 'gauge' and pid not in alive:
+                    continue
+                for key, value in snapshot.get(metric.name, []):
+                    key = tuple(key)
+                    values[key] = (
+                        metric.merge(values[key], value) if key in values
+                        else value
+                    )
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples(values))
+        for collector in self.collectors:
+            for name, kind, documentation, _ in collector():
+                value = sum(
+                    value
+                    for pid, snapshot in snapshots
+                    if kind != 'gauge' or pid in alive
+                    for _, value in snapshot.get(name, [])
+                )
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUESTS = registry.register(Counter(
+    'booker_requests_total',
+    'Requests by view, method and status code.',
+    ('view', 'method', 'status')
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    'booker_request_duration_seconds',
+    'Time spent in the view and middlewares and sending a streamed body.',
+    LATENCY_BUCKETS,
+    ('view', 'method')
+))
+DB_QUERIES = registry.register(Histogram(
+    'booker_request_db_queries',
+    'Database queries per request.',
+    QUERY_COUNT_BUCKETS,
+    ('view',)
+))
+DB_SECONDS = registry.register(Histogram(
+    'booker_request_db_duration_seconds',
+    'Time spent in database queries per request.',
+    LATENCY_BUCKETS,
+    ('view',)
+))
+RESPONSE_BYTES = registry.register(Histogram(
+    'booker_response_size_bytes',
+    'Size of the response body; streamed ones are counted once sent.',
+    SIZE_BUCKETS,
+    ('view',)
+))
+GOOGLE_BOOKS_SECONDS = registry.register(Histogram(
+    'booker_google_books_request_duration_seconds',
+    'Time of the HTTP calls to the Google Books API.',
+    LATENCY_BUCKETS,
+    ('outcome',)
+))
+
+DB_POOL_WAIT_SECONDS = registry.register(Histogram(
+    'booker_db_pool_wait_seconds',
+    'Time waited for a pooled database connection.',
+    (0.0001, 0.0005, 0.001) + LATENCY_BUCKETS,
+    ('alias',)
+))
+
+
+def pool_connections():
+    values = {}
+    for (alias, _), pool in all_pools().items():
+        for state, count in (('idle', pool.idle), ('in_use', pool.in_use)):
+            values[alias, state] = values.get((alias, state), 0) + count
+    return values
+
+
+def pool_events():
+    values = {}
+    for (alias, _), pool in all_pools().items():
+        for event, count in pool.stats.items():
+            values[alias, event] = values.get((alias, event), 0) + count
+    return values
+
+
+DB_POOL_CONNECTIONS = registry.register(Collected(
+    'booker_db_pool_connections',
+    'Connections of the pools by state.',
+    'gauge',
+    pool_connections,
+    ('alias', 'state')
+))
+DB_POOL_EVENTS = registry.register(Collected(
+    'booker_db_pool_events_total',
+    'Connections opened, discarded after a failed check and evicted for '
+    'being idle, and borrowers timed out.',
+    'counter',
+    pool_events,
+    ('alias', 'event')
+))
+
+
+def google_books_cache_stats():
+    from booker_app.cache import get_cache
+
+    stats = get_cache().stats
+    for counter in ('memory_hits', 'persistent_hits', 'misses'):
+        yield (
+            f'booker_google_books_cache_{counter}_total',
+            'counter',
+            f'Google Books lookups answered by: {counter}.',
+            stats[counter]
+        )
+
+
+registry.collectors.append(google_books_cache_stats)
+
+
+class QueryTimer:
+    """execute_wrapper counting the queries of a request and their time."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MeasuredStream:
+    """Streamed content calling `finish(size)` once it is exhausted or the
+    response is closed. Django closes the response even if the client went
+    away before the first chunk."""
+    def __init__(self, content, finish):
+        self.content = content
+        self.finish = finish
+        self.size = 0
+        self.finished = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.content:
+                self.size += len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.finished:
+            self.finished = True
+            self.finish(self.size)
+
+
+class MetricsMiddleware:
+    """Should come first in MIDDLEWARE, so the time of the others counts."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+
+        def finish(size):
+            # Streamed rows are read after the view returned, with the
+            # wrapper still in place
+            stack.close()
+            elapsed = time.perf_counter() - started
+            match = request.resolver_match
+            view = match.url_name if match and match.url_name else 'unmatched'
+            REQUESTS.inc(
+                view=view, method=request.method, status=response.status_code)
+            REQUEST_SECONDS.observe(elapsed, view=view, method=request.method)
+            DB_QUERIES.observe(timer.count, view=view)
+            DB_SECONDS.observe(timer.seconds, view=view)
+            RESPONSE_BYTES.observe(size, view=view)
+
+        if response.streaming:
+            response.streaming_content = MeasuredStream(
+                response.streaming_content, finish)
+        else:
+            finish(len(response.content))
+        return response
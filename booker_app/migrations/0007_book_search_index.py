@@ -0,0 +1,102 @@
+from django.db import migrations
+
+
+# Copies of the statements of booker_app/search.py when this migration was
+# written, so later changes to it don't change what this migration does
+SQLITE_FTS_TABLE = 'booker_app_book_fts'
+
+SQLITE_INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+        title, authors, content='booker_app_book', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_insert
+    AFTER INSERT ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, authors)
+        VALUES (new.id, new.title, new.authors);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_delete
+    AFTER DELETE ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, authors)
+        VALUES ('delete', old.id, old.title, old.authors);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_update
+    AFTER UPDATE ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, authors)
+        VALUES ('delete', old.id, old.title, old.authors);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, authors)
+        VALUES (new.id, new.title, new.authors);
+    END""",
+]
+
+SQLITE_REBUILD_SQL = (
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+)
+
+SQLITE_UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}',
+]
+
+POSTGRES_INSTALL_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'ALTER TABLE booker_app_book ADD COLUMN search_vector tsvector',
+    """CREATE FUNCTION booker_app_book_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.authors, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER booker_app_book_search_vector
+    BEFORE INSERT OR UPDATE OF title, authors ON booker_app_book
+    FOR EACH ROW EXECUTE PROCEDURE booker_app_book_search_vector()""",
+    # Fires the trigger for the existing rows
+    'UPDATE booker_app_book SET title = title',
+    """CREATE INDEX booker_app_book_search_vector_idx
+    ON booker_app_book USING gin (search_vector)""",
+    """CREATE INDEX booker_app_book_title_trgm_idx
+    ON booker_app_book USING gin (title gin_trgm_ops)""",
+    """CREATE INDEX booker_app_book_authors_trgm_idx
+    ON booker_app_book USING gin (authors gin_trgm_ops)""",
+]
+
+POSTGRES_UNINSTALL_SQL = [
+    'DROP INDEX IF EXISTS booker_app_book_authors_trgm_idx',
+    'DROP INDEX IF EXISTS booker_app_book_title_trgm_idx',
+    'DROP TRIGGER IF EXISTS booker_app_book_search_vector ON booker_app_book',
+    'DROP FUNCTION IF EXISTS booker_app_book_search_vector()',
+    'ALTER TABLE booker_app_book DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_INSTALL_SQL:
+            schema_editor.execute(sql)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_INSTALL_SQL:
+            schema_editor.execute(sql)
+        schema_editor.execute(SQLITE_REBUILD_SQL)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_UNINSTALL_SQL:
+            schema_editor.execute(sql)
+    elif schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_UNINSTALL_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0006_auto_20200221_1432'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,90 @@
+import hashlib
+import json
+from datetime import date, datetime
+
+from django.db import migrations
+from django.utils.dateparse import parse_date
+
+
+BATCH_SIZE = 2000
+
+
+# Copy of booker_app.models.book_fingerprint when this migration was
+# written, so later changes to it don't change what this migration does
+def book_fingerprint(
+        authors,
+        title,
+        pub_date,
+        page_count,
+        language,
+        cover_image_adress):
+    if isinstance(pub_date, str):
+        pub_date = parse_date(pub_date) or pub_date
+    if isinstance(pub_date, datetime):
+        pub_date = pub_date.date()
+    if isinstance(pub_date, date):
+        pub_date = pub_date.isoformat()
+    values = [
+        authors,
+        title,
+        pub_date,
+        None if page_count is None else int(page_count),
+        language,
+        cover_image_adress
+    ]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """Fills in the fingerprint of every book. Refuses to go on while books
+    duplicate an older one, as the unique index couldn't be created: which
+    one to keep can't be told automatically, so they are listed to be
+    merged or removed by hand."""
+    Book = apps.get_model('booker_app', 'Book')
+    seen = {}
+    duplicates = []
+    last_id = 0
+    while True:
+        books = list(
+            Book.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not books:
+            break
+        to_update = []
+        for book in books:
+            fingerprint = book_fingerprint(
+                book.authors,
+                book.title,
+                book.pub_date,
+                book.page_count,
+                book.language,
+                book.cover_image_adress
+            )
+            if fingerprint in seen:
+                duplicates.append((book.id, seen[fingerprint]))
+                continue
+            seen[fingerprint] = book.id
+            book.fingerprint = fingerprint
+            to_update.append(book)
+        Book.objects.bulk_update(to_update, ['fingerprint'])
+        last_id = books[-1].id
+
+    report = [
+        f'Book {book_id} duplicates book {original_id}.'
+        for book_id, original_id in duplicates
+    ]
+    if report:
+        raise RuntimeError(
+            'Duplicated books, merge or remove them and migrate again:\n'
+            + '\n'.join(report)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0009_book_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.10 on 2026-10-17 12:31
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_identifier_types(apps, schema_editor):
+    """Refuses to add the constraint while a book has two identifiers of
+    the same type. Which one is right can't be told automatically, so they
+    are listed to be fixed by hand."""
+    Identifier = apps.get_model('booker_app', 'Identifier')
+    violations = (
+        Identifier.objects.values('book_id', 'type')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('book_id', 'type')
+    )
+    report = [
+        f"Book {row['book_id']} has {row['count']} {row['type']} identifiers."
+        for row in violations
+    ]
+    if report:
+        raise RuntimeError(
+            'Duplicated identifier types, remove the wrong identifiers '
+            'and migrate again:\n' + '\n'.join(report)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0011_book_fingerprint_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_identifier_types, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='identifier',
+            constraint=models.UniqueConstraint(fields=('book', 'type'), name='unique_identifier_type_per_book'),
+        ),
+    ]
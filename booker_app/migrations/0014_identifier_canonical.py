@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-17 12:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0013_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='identifier',
+            name='canonical',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,74 @@
+import re
+
+from django.db import migrations
+
+
+BATCH_SIZE = 2000
+
+
+# Copy of booker_app.isbn when this migration was written, so later changes
+# to it don't change what this migration does
+SEPARATORS_RE = re.compile(r'[\s-]')
+ISBN_TYPES = ('ISBN_10', 'ISBN_13')
+
+
+def clean(value):
+    return SEPARATORS_RE.sub('', value or '').upper()
+
+
+def is_isbn10(value):
+    if not re.fullmatch(r'\d{9}[\dX]', value):
+        return False
+    digits = [10 if d == 'X' else int(d) for d in value]
+    return sum((10 - i) * d for i, d in enumerate(digits)) % 11 == 0
+
+
+def isbn13_check_digit(first_12):
+    total = sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(first_12))
+    return str((10 - total % 10) % 10)
+
+
+def is_isbn13(value):
+    return (
+        bool(re.fullmatch(r'97[89]\d{10}', value))
+        and isbn13_check_digit(value[:12]) == value[12]
+    )
+
+
+def canonical_identifier(ident_type, value):
+    value = clean(value)
+    if ident_type not in ISBN_TYPES:
+        return value or None
+    if is_isbn13(value):
+        return value
+    if is_isbn10(value):
+        first_12 = '978' + value[:9]
+        return first_12 + isbn13_check_digit(first_12)
+    return None
+
+
+def backfill_canonical(apps, schema_editor):
+    Identifier = apps.get_model('booker_app', 'Identifier')
+    last_id = 0
+    while True:
+        identifiers = list(
+            Identifier.objects.filter(id__gt=last_id).order_by('id')
+            [:BATCH_SIZE]
+        )
+        if not identifiers:
+            break
+        for ident in identifiers:
+            ident.canonical = canonical_identifier(ident.type, ident.value)
+        Identifier.objects.bulk_update(identifiers, ['canonical'])
+        last_id = identifiers[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0014_identifier_canonical'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_canonical, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.10 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0015_backfill_identifier_canonical'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='authors_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='title_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,72 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+BATCH_SIZE = 2000
+KEY_LENGTH = 255
+KEY_COLUMNS = ('title_key', 'authors_key')
+
+
+# Copies of booker_app.models.search_key and of the index statements of
+# booker_app.autocomplete when this migration was written, so later changes
+# to them don't change what this migration does
+def search_key(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.casefold()))[:KEY_LENGTH]
+
+
+def install_autocomplete_index(schema_editor):
+    collation = (
+        ' COLLATE "C"' if schema_editor.connection.vendor == 'postgresql'
+        else ''
+    )
+    for column in KEY_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS booker_app_book_{column}_idx '
+            f'ON booker_app_book ({column}{collation}, id)'
+        )
+
+
+def uninstall_autocomplete_index(schema_editor):
+    for column in KEY_COLUMNS:
+        schema_editor.execute(
+            f'DROP INDEX IF EXISTS booker_app_book_{column}_idx')
+
+
+def backfill_search_keys(apps, schema_editor):
+    Book = apps.get_model('booker_app', 'Book')
+    last_id = 0
+    while True:
+        books = list(
+            Book.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not books:
+            break
+        for book in books:
+            book.title_key = search_key(book.title)
+            book.authors_key = search_key(book.authors)
+        Book.objects.bulk_update(books, ['title_key', 'authors_key'])
+        last_id = books[-1].id
+
+
+def forwards(apps, schema_editor):
+    # Indexed once filled, instead of updating the index row by row
+    backfill_search_keys(apps, schema_editor)
+    install_autocomplete_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    uninstall_autocomplete_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0016_book_search_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.10 on 2026-10-17 14:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def start_leases(apps, schema_editor):
+    # Jobs already running get a lease from their start, as before
+    ImportJob = apps.get_model('booker_app', 'ImportJob')
+    ImportJob.objects.filter(status='running').update(
+        heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booker_app', '0017_book_search_keys_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_leases, migrations.RunPython.noop),
+    ]
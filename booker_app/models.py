@@ -1,8 +1,54 @@
-from django.db import models
+import hashlib
+import json
+import re
+import unicodedata
+from datetime import date, datetime
 
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from booker_app.covers import cover_key, is_proxied
+from booker_app.isbn import canonical_identifier
 from booker.settings import MAX_STR_LEN
 
 
+def book_fingerprint(
+        authors,
+        title,
+        pub_date,
+        page_count,
+        language,
+        cover_image_adress):
+    """sha256 of the fields telling two books apart when they have no
+    identifiers. pub_date can be a date, a datetime or an ISO string."""
+    if isinstance(pub_date, str):
+        pub_date = parse_date(pub_date) or pub_date
+    if isinstance(pub_date, datetime):
+        pub_date = pub_date.date()
+    if isinstance(pub_date, date):
+        pub_date = pub_date.isoformat()
+    values = [
+        authors,
+        title,
+        pub_date,
+        None if page_count is None else int(page_count),
+        language,
+        cover_image_adress
+    ]
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+
+def search_key(text):
+    """Text lowercased, without accents and punctuation, eg. 'Les
+    Misérables!' gives 'les miserables'; compared by prefix."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.casefold()))[:MAX_STR_LEN]
+
+
 class Book(models.Model):
     """Book model with basic book fields according to Google Books:
 
@@ -14,6 +60,11 @@ class Book(models.Model):
         language: Language in which a book was published. Max_len=2
             according to ISO 639-1 code used in Google Book API.
         cover_image: A link to cover image.
+        fingerprint: book_fingerprint() of the fields above, unique so that
+            a duplicate is found with one index lookup. String.
+        updated_at: last time the book was written. Datetime.
+        title_key, authors_key: search_key() of the title and the authors,
+            indexed for autocomplete.py. String.
     """
     authors = models.CharField(max_length=MAX_STR_LEN)
     title = models.CharField(max_length=MAX_STR_LEN)
@@ -21,10 +72,59 @@ class Book(models.Model):
     page_count = models.IntegerField(blank=True, null=True)
     language = models.CharField(max_length=2)
     cover_image_adress = models.CharField(max_length=MAX_STR_LEN, blank=True, null=True)
+    fingerprint = models.CharField(
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed by migration 0017, bytewise on PostgreSQL
+    title_key = models.CharField(
+        max_length=MAX_STR_LEN, blank=True, default='', editable=False)
+    authors_key = models.CharField(
+        max_length=MAX_STR_LEN, blank=True, default='', editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Bulk inserts skip save(); they have to call this themselves
+        self.fill_fingerprint()
+        self.fill_search_keys()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                'fingerprint', 'title_key', 'authors_key'}
+        super().save(*args, **kwargs)
+
+    def fill_fingerprint(self):
+        self.fingerprint = book_fingerprint(
+            self.authors,
+            self.title,
+            self.pub_date,
+            self.page_count,
+            self.language,
+            self.cover_image_adress
+        )
+        return self.fingerprint
+
+    def fill_search_keys(self):
+        self.title_key = search_key(self.title)
+        self.authors_key = search_key(self.authors)
+
+    @property
+    def cover_url(self):
+        """Local thumbnail of the cover, see booker_app/covers.py, or the
+        cover address itself if its host isn't one thumbnails are fetched
+        from."""
+        if not self.cover_image_adress:
+            return None
+        if not is_proxied(self.cover_image_adress):
+            return self.cover_image_adress
+        return reverse('book_cover', kwargs={
+            'book_id': self.id, 'key': cover_key(self.cover_image_adress)})
+
     @property
     def identifier_display(self):
         identifiers = self.identifier_set.all()
@@ -40,6 +140,9 @@ class Identifier(models.Model):
         value: value of a book identifier. String
         type: one of four to choice from IDENTIFIER_TYPES. String.
         book: book object which the identifier belongs to. ForeignKey.
+        updated_at: last time the identifier was written. Datetime.
+        canonical: value normalized by isbn.canonical_identifier(), the
+            ISBN-13 for both ISBN types. String.
     """
     IDENTIFIER_TYPES = [
         ('ISBN_10', 'ISBN_10'),
@@ -54,30 +157,157 @@ class Identifier(models.Model):
         blank=True
     )
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    canonical = models.CharField(
+        max_length=MAX_STR_LEN,
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False
+    )
 
     def __str__(self):
         return (f'{self.type}: {self.value}')
 
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book', 'type'],
+                name='unique_identifier_type_per_book'
+            )
+        ]
+
     def save(
         self,
         force_insert=False,
         force_update=False,
         using=None,
         update_fields=None):
-        # If we update an existing ident we don't want to raise the exception
-        # due to itself existing
-        if self.id:
-            existing_book_idents = Identifier.objects.filter(
-                book_id=self.book.id
-            ).exclude(id=self.id).all()
-        else:
-            existing_book_idents = Identifier.objects.filter(book_id=self.book.id).all()
-        ident_types = [ident.type for ident in existing_book_idents]
-
-        if self.type in ident_types:
+        # Bulk inserts skip save(); they have to call this themselves
+        self.fill_canonical()
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'canonical'}
+        # The database enforces one identifier of a type per book; the
+        # savepoint keeps an outer transaction usable if it refuses
+        try:
+            with transaction.atomic(using=using):
+                super().save(force_insert, force_update, using, update_fields)
+        except IntegrityError:
+            # Also raised for a taken value, which keeps its IntegrityError
+            if not Identifier.objects.filter(
+                    book_id=self.book_id,
+                    type=self.type
+            ).exclude(id=self.id).exists():
+                raise
             raise ValueError(
                 f'Identifier for Book: {self.book.title} with type: '
                 f'{self.type} already exists.'
             )
-        super().save(force_insert, force_insert, using, update_fields)
+        self.touch_book(using)
+
+    def delete(self, using=None, keep_parents=False):
+        # Not called by the deletes of books, which cascade to their
+        # identifiers in one query
+        deleted = super().delete(using, keep_parents)
+        self.touch_book(using)
+        return deleted
+
+    def touch_book(self, using=None):
+        """Marks the book as written, which gives it a new card, see
+        booker_app/fragments.py."""
+        Book.objects.using(using).filter(id=self.book_id).update(
+            updated_at=timezone.now())
+
+    def fill_canonical(self):
+        self.canonical = canonical_identifier(self.type, self.value)
+        return self.canonical
+
+
+class CatalogVersion(models.Model):
+    """Single row counting the writes to the catalog (books and their
+    identifiers). HTTP validators are derived from it, so a conditional
+    request is answered without reading the book tables.
+    Attributes:
+        version: incremented by bump() on every write. Integer.
+        updated_at: time of the last write. Datetime.
+    """
+    ROW_ID = 1
+
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'Catalog version {self.version}'
+
+    @classmethod
+    def current(cls):
+        version = cls.objects.filter(id=cls.ROW_ID).first()
+        if version is None:
+            return cls(id=cls.ROW_ID)
+        return version
+
+    @classmethod
+    def bump(cls):
+        """Call it in the transaction of the write, so readers never see a
+        new version with old data."""
+        bumped = cls.objects.filter(id=cls.ROW_ID).update(
+            version=F('version') + 1, updated_at=timezone.now())
+        if not bumped:
+            cls.objects.get_or_create(
+                id=cls.ROW_ID, defaults={'version': 1})
+
+
+class ImportJob(models.Model):
+    """Import of the volumes matching a Google Books search, queued by
+    ImportBookView, or of a list of ISBNs, queued by ImportBatchView. Run in
+    the background by the `run_import_worker` management command.
+    Attributes:
+        query: search fields (keywords_fields) or {"isbns": [...]} as JSON.
+            String.
+        status: one of JOB_STATUSES. String.
+        results: per volume results of the import as JSON. String.
+        error: why the job failed. String.
+        created_at, started_at, finished_at: job timeline. Datetime.
+        heartbeat_at: last renewal of the lease of the worker running the
+            job, see jobs.lease(). Datetime.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    JOB_STATUSES = [
+        (QUEUED, QUEUED),
+        (RUNNING, RUNNING),
+        (DONE, DONE),
+        (FAILED, FAILED)
+    ]
+    query = models.TextField()
+    status = models.CharField(
+        max_length=7,
+        choices=JOB_STATUSES,
+        default=QUEUED,
+        db_index=True
+    )
+    results = models.TextField(blank=True, default='[]')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Import job {self.id}: {self.status}'
+
+    @property
+    def keywords_fields(self):
+        return json.loads(self.query)
+
+    @property
+    def isbns(self):
+        """ISBNs of a batch job, None for a search."""
+        return self.keywords_fields.get('isbns')
+
+    @property
+    def result_list(self):
+        return json.loads(self.results)
@@ -0,0 +1,146 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from booker.settings import BOOK_PAGE_SIZE, BOOK_MAX_PAGE_SIZE
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_page_size(request):
+    """Page size requested through the `page_size` querystring parameter,
+    clamped to BOOK_MAX_PAGE_SIZE. Falls back to BOOK_PAGE_SIZE."""
+    try:
+        page_size = int(request.GET.get('page_size', BOOK_PAGE_SIZE))
+    except ValueError:
+        return BOOK_PAGE_SIZE
+    return max(1, min(page_size, BOOK_MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    """One page of results with opaque cursors to its neighbours.
+
+    Attributes:
+        object_list: rows of the page in display order. List.
+        next_cursor: token for the following page or None. String.
+        prev_cursor: token for the preceding page or None. String.
+    """
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Cursor based pagination which never uses OFFSET.
+
+    Rows are ordered by `keys` (the last key has to be unique, eg. `id`) and
+    a page is selected with a `WHERE (keys) > (values of the boundary row)`
+    predicate, so every page costs the same as the first one no matter how
+    deep the client has gone. Keys prefixed with '-' are sorted descending.
+    """
+    def __init__(self, queryset, page_size, keys=('id',)):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.keys = keys
+
+    def page(self, cursor=None):
+        if cursor:
+            values, direction = self.decode_cursor(cursor)
+        else:
+            values, direction = None, 'next'
+
+        if direction == 'next':
+            queryset = self.queryset.order_by(*self.keys)
+        else:
+            queryset = self.queryset.order_by(
+                *[self._reverse(key) for key in self.keys])
+        if values is not None:
+            try:
+                queryset = queryset.filter(
+                    self._seek(values, forward=direction == 'next'))
+            except (TypeError, ValueError, ValidationError):
+                # Values of the wrong type for their field
+                raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+        # One extra row tells us whether there is anything past this page
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if direction == 'next':
+            next_cursor = self._cursor(rows[-1], 'next') if has_more else None
+            prev_cursor = (
+                self._cursor(rows[0], 'prev') if values is not None and rows
+                else None
+            )
+        else:
+            rows.reverse()
+            prev_cursor = self._cursor(rows[0], 'prev') if has_more else None
+            next_cursor = self._cursor(rows[-1], 'next') if rows else None
+
+        return KeysetPage(rows, next_cursor, prev_cursor)
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, direction = data['k'], data['d']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor(f'Invalid cursor: {cursor}')
+        if (direction not in ('next', 'prev') or not isinstance(values, list)
+                or len(values) != len(self.keys)):
+            raise InvalidCursor(f'Invalid cursor: {cursor}')
+        return values, direction
+
+    def _cursor(self, row, direction):
+        values = [self._value(row, key.lstrip('-')) for key in self.keys]
+        data = json.dumps({'k': values, 'd': direction}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def _seek(self, values, forward):
+        # (a, b) > (x, y) is expanded to a > x OR (a = x AND b > y), which
+        # works on every backend and for mixed sort directions.
+        condition = Q()
+        equal = {}
+        for key, value in zip(self.keys, values):
+            field = key.lstrip('-')
+            ascending = not key.startswith('-')
+            lookup = 'gt' if ascending == forward else 'lt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    @staticmethod
+    def _reverse(key):
+        return key[1:] if key.startswith('-') else f'-{key}'
+
+    @staticmethod
+    def _value(row, field):
+        if isinstance(row, dict):
+            return row[field]
+        return getattr(row, field)
+
+
+def page_url(request, cursor, **params):
+    """URL of the current view pointing at `cursor`. Extra `params` are
+    carried over in the querystring (eg. the phrase of a POSTed search)."""
+    if not cursor:
+        return None
+    query = request.GET.copy()
+    for key, value in params.items():
+        if value:
+            query[key] = value
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
@@ -0,0 +1,100 @@
+"""Reads from the replicas of DATABASE_REPLICAS, writes to the primary
+(the `default` database).
+
+Only the reads of GET and HEAD requests go to a replica, one picked per
+request by ReplicaMiddleware; management commands, the import worker and
+the other requests stay on the primary. Within a request, reads go back to
+the primary after its first write and inside transactions.
+
+A response to a request which wrote sets a cookie pinning the client to
+the primary for REPLICA_PIN_SECONDS, so it reads its own writes whatever
+the replication lag.
+"""
+import random
+import threading
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from booker.settings import DATABASE_REPLICAS, REPLICA_PIN_SECONDS
+
+
+PRIMARY = DEFAULT_DB_ALIAS
+PIN_COOKIE = 'booker_primary'
+
+# Routing of the request handled by the current thread
+_state = threading.local()
+
+
+def reset():
+    _state.replica = None
+    _state.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if (replica is None or _state.wrote
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        return db == PRIMARY
+
+
+def read_from_primary(view):
+    """Decorator for views whose reads must never lag, eg. the status of
+    a job the client is waiting for."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        _state.replica = None
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def reset_after(content):
+    try:
+        for chunk in content:
+            yield chunk
+    finally:
+        reset()
+
+
+class ReplicaMiddleware:
+    """Should come right after MetricsMiddleware."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset()
+        if (DATABASE_REPLICAS and request.method in ('GET', 'HEAD')
+                and PIN_COOKIE not in request.COOKIES):
+            _state.replica = random.choice(DATABASE_REPLICAS)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            reset()
+            raise
+
+        if DATABASE_REPLICAS and _state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True,
+                samesite='Lax'
+            )
+        if response.streaming:
+            # Streamed rows are read once the view has returned
+            response.streaming_content = reset_after(
+                response.streaming_content)
+        else:
+            reset()
+        return response
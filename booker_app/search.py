@@ -0,0 +1,149 @@
+"""Full-text search over book titles and authors.
+
+The index is kept up to date by the database itself (triggers), so every
+write path - forms, imports and bulk loads - is covered:
+
+* PostgreSQL: a weighted `search_vector` tsvector column with a GIN index
+  plus trigram GIN indexes on `title` and `authors` for fuzzy matches.
+* SQLite (local and test runs): an external content FTS5 table.
+
+`get_search_backend()` picks the backend matching the current connection.
+Every backend returns a Book queryset annotated with `rank` (higher is
+better), meant to be ordered by SEARCH_ORDERING.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from booker_app.models import Book
+
+
+SEARCH_ORDERING = ('-rank', 'id')
+
+SQLITE_FTS_TABLE = 'booker_app_book_fts'
+
+# The FTS table and triggers created by migration 0007. IF NOT EXISTS
+# everywhere, because the statements are re-run after every migrate: SQLite
+# rebuilds a table (dropping its triggers) on ALTER.
+SQLITE_INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+        title, authors, content='booker_app_book', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_insert
+    AFTER INSERT ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, authors)
+        VALUES (new.id, new.title, new.authors);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_delete
+    AFTER DELETE ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, authors)
+        VALUES ('delete', old.id, old.title, old.authors);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_update
+    AFTER UPDATE ON booker_app_book BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, title, authors)
+        VALUES ('delete', old.id, old.title, old.authors);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, title, authors)
+        VALUES (new.id, new.title, new.authors);
+    END""",
+]
+
+
+def search_terms(phrase):
+    """Words of the phrase, stripped of any query syntax."""
+    return re.findall(r'\w+', phrase)
+
+
+def no_results():
+    return Book.objects.annotate(
+        rank=Value(0.0, output_field=FloatField())).none()
+
+
+class PostgresSearchBackend:
+    def search(self, phrase):
+        terms = search_terms(phrase)
+        if not terms:
+            return no_results()
+        # Every term is matched as a prefix, eg. "tolk" finds "Tolkien"
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        # Both functions return real; as float8 the rank survives the
+        # round trip through a pagination cursor (a JSON double), so that
+        # the seek finds the rows tied with the boundary row
+        rank_sql = (
+            "(ts_rank_cd(booker_app_book.search_vector, "
+            "to_tsquery('simple', %s)) + greatest("
+            "word_similarity(%s, booker_app_book.title), "
+            "word_similarity(%s, booker_app_book.authors)))::float8"
+        )
+        # `<%` (word similarity) is served by the trigram indexes and
+        # catches typos the tsvector match would miss.
+        match_sql = (
+            "(booker_app_book.search_vector @@ to_tsquery('simple', %s) "
+            "OR %s <%% booker_app_book.title "
+            "OR %s <%% booker_app_book.authors)"
+        )
+        return Book.objects.annotate(
+            rank=RawSQL(
+                rank_sql, (tsquery, phrase, phrase), output_field=FloatField())
+        ).extra(where=[match_sql], params=[tsquery, phrase, phrase])
+
+
+class SqliteSearchBackend:
+    def search(self, phrase):
+        terms = search_terms(phrase)
+        if not terms:
+            return no_results()
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        # bm25() is lower for better matches; title weighs twice as much
+        rank_sql = (
+            f'SELECT -bm25({SQLITE_FTS_TABLE}, 2.0, 1.0) '
+            f'FROM {SQLITE_FTS_TABLE} '
+            f'WHERE {SQLITE_FTS_TABLE} MATCH %s '
+            f'AND rowid = booker_app_book.id'
+        )
+        match_sql = (
+            f'booker_app_book.id IN (SELECT rowid FROM {SQLITE_FTS_TABLE} '
+            f'WHERE {SQLITE_FTS_TABLE} MATCH %s)'
+        )
+        return Book.objects.annotate(
+            rank=RawSQL(rank_sql, (fts_query,), output_field=FloatField())
+        ).extra(where=[match_sql], params=[fts_query])
+
+
+class SimpleSearchBackend:
+    """Unindexed fallback for other databases."""
+    def search(self, phrase):
+        queryset = Book.objects.annotate(
+            rank=Value(0.0, output_field=FloatField()))
+        for term in search_terms(phrase):
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(authors__icontains=term))
+        return queryset
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SqliteSearchBackend,
+}
+
+
+def get_search_backend():
+    return SEARCH_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+def ensure_sqlite_triggers(using):
+    """Recreates the FTS triggers dropped by SQLite table rebuilds."""
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [SQLITE_FTS_TABLE]
+        )
+        if not cursor.fetchone():
+            return  # migration installing the index has not run yet
+        for sql in SQLITE_INSTALL_SQL[1:]:
+            cursor.execute(sql)
@@ -0,0 +1,36 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def json_array_stream(rows):
+    """Yields `rows` as one JSON array, row by row."""
+    encoder = DjangoJSONEncoder()
+    separator = '['
+    for row in rows:
+        yield separator + encoder.encode(row)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+def ndjson_stream(rows):
+    """Yields `rows` as newline delimited JSON, one document per line."""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def streaming_json_response(rows, output_format='json'):
+    """Response serializing `rows` lazily, so a worker never holds more
+    than the current database chunk in memory."""
+    if output_format == 'ndjson':
+        content = ndjson_stream(rows)
+    else:
+        content = json_array_stream(rows)
+    return StreamingHttpResponse(
+        content, content_type=STREAM_FORMATS[output_format])
@@ -1,7 +1,66 @@
+import asyncio
+import base64
+import concurrent.futures
+import csv
 import datetime
-from django.test import TestCase
+import gzip
+import http.server
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import aiohttp
+import requests
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from booker_app.models import Book, Identifier
+from django.utils import timezone
+from booker.db import pool as db_pool
+from booker.db.pool import ConnectionPool, PoolTimeout
+from booker_app import covers, replicas
+from booker_app.autocomplete import prefix_matches, suggest
+from booker_app.benchmark import isbn_10, isbn_13
+from booker_app.cache import GoogleBooksCache, get_cache
+from booker_app.export import iter_books
+from booker_app.forms import ImportBatchForm
+from booker_app.google_books import (
+    AsyncGoogleBooksClient, GoogleBooksClient, GoogleBooksError
+)
+from booker_app.importer import EXISTS, IMPORTED, import_volumes
+from booker_app.isbn import canonical_identifier, canonical_lookup
+from booker_app.jobs import (
+    FAILED, NOT_FOUND, claim_next_job, enqueue_batch_import, enqueue_import,
+    import_isbns, lease, requeue_stale_jobs, run_pending_jobs
+)
+from booker_app.metrics import DB_POOL_WAIT_SECONDS, registry
+from booker_app.models import (
+    Book, CatalogVersion, Identifier, ImportJob, book_fingerprint, search_key
+)
+from booker_app.replicas import (
+    PIN_COOKIE, ReplicaMiddleware, ReplicaRouter
+)
+from booker_app.views import BookListJsonView
+from booker.settings import REPLICA_PIN_SECONDS
+
+
+# Tests run without collectstatic, so without the manifest of the hashed
+# static file names the production storage looks them up in
+PLAIN_STATICFILES_STORAGE = (
+    'django.contrib.staticfiles.storage.StaticFilesStorage')
 
 
 class TestBookModel(TestCase):
@@ -46,6 +105,28 @@ class TestBookModel(TestCase):
 
         self.assertEqual(len(result), len(expected))
 
+    def test_fingerprint_is_set_on_save(self):
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.fingerprint, book_fingerprint(
+            'John Doe',
+            'Life of John',
+            datetime.date(1990, 10, 20),
+            9,
+            'en',
+            self.book.cover_image_adress
+        ))
+
+        self.book.title = 'Death of John'
+        self.book.save(update_fields=['title'])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.fingerprint, self.book.fill_fingerprint())
+
+    def test_duplicate_fingerprint(self):
+        duplicate = Book.objects.get(id=self.book.id)
+        duplicate.id = None
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            duplicate.save()
+
 
 class TestIdentifierModel(TestCase):
 
@@ -87,8 +168,49 @@ class TestIdentifierModel(TestCase):
         self.assertEqual(ident.value, '9999')
         self.assertEqual(len(Identifier.objects.all()), 1)
 
+    def test_save_identifier_without_reading_siblings(self):
+        Identifier(value='9992', type='ISBN_10', book=self.book).save()
+        ident = Identifier(value='9993', type='ISBN_13', book=self.book)
+
+        # One INSERT, wrapped in a savepoint, and the UPDATE of the
+        # book's updated_at which renews its card
+        with CaptureQueriesContext(connection) as queries:
+            ident.save()
+        statements = [
+            query['sql'].split()[0].upper()
+            for query in queries.captured_queries
+            if not query['sql'].upper().startswith(
+                ('SAVEPOINT', 'RELEASE SAVEPOINT'))
+        ]
+        self.assertEqual(statements, ['INSERT', 'UPDATE'])
+
+    def test_save_identifier_taken_value_fails(self):
+        other_book = Book.objects.create(
+            authors='Jane Doe', title='Life of Jane', language='en')
+        Identifier(value='9992', type='ISBN_10', book=self.book).save()
+
+        with self.assertRaises(IntegrityError):
+            Identifier(value='9992', type='ISBN_10', book=other_book).save()
+
+    def test_force_update_identifier(self):
+        ident = Identifier(value='9992', type='ISBN_10', book=self.book)
+        ident.save()
+
+        ident.value = '9999'
+        ident.save(force_update=True)
+        self.assertEqual(Identifier.objects.get().value, '9999')
+
+
+def streamed_json(response):
+    return json.loads(b''.join(response.streaming_content))
+
 
 # Function to populate Book and Identifier model in view tests.
+# Authorization header of the book batch API, with the token patched into
+# BOOK_BATCH_API_TOKENS
+BATCH_AUTH = {'HTTP_AUTHORIZATION': 'Bearer secret'}
+
+
 def create_book_with_ident(
         authors,
         title,
@@ -115,6 +237,7 @@ def create_book_with_ident(
     identifier.save()
     return book, identifier
 
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
 class TestBookListView(TestCase):
     def test_no_books(self):
         response = self.client.get(reverse('book_list'))
@@ -135,7 +258,7 @@ class TestBookListView(TestCase):
         )
         response = self.client.get(reverse('book_list'))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.context['book_list'].first(), book)
+        self.assertEqual(response.context['book_list'][0], book)
 
     def test_multiple_books(self):
         book, ident = create_book_with_ident(
@@ -145,7 +268,7 @@ class TestBookListView(TestCase):
             'foo', 'foo', '1990-01-01', 1, 'foo', 'foo', 'ISBN_10', '5450'
         )
         book_3, ident_3 = create_book_with_ident(
-            'foo', 'foo', '1990-01-01', 1, 'foo', 'foo', 'ISBN_13', '5451'
+            'foo', 'bar', '1990-01-01', 1, 'foo', 'foo', 'ISBN_13', '5451'
         )
         list_of_books = Book.objects.all()
         response = self.client.get(reverse('book_list'))
@@ -154,7 +277,672 @@ class TestBookListView(TestCase):
         for book in response.context['book_list']:
             assert(book in list_of_books)
 
+    def test_identifiers_loaded_in_one_query(self):
+        """
+        Rendering the list costs the same number of queries no matter how
+        many books (and identifiers) are in the catalog.
+        """
+        for i in range(2):
+            create_book_with_ident(
+                'foo', f'foo 10{i}', '1990-01-01', 1, 'en', 'foo', 'ISSN',
+                f'10{i}'
+            )
+        with self.assertNumQueries(3):
+            self.client.get(reverse('book_list'))
+
+        for i in range(10):
+            create_book_with_ident(
+                'foo', f'foo 20{i}', '1990-01-01', 1, 'en', 'foo', 'ISSN',
+                f'20{i}'
+            )
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('book_list'))
+        self.assertContains(response, 'ISSN: 209')
+
+    def test_search_identifiers_loaded_in_one_query(self):
+        for i in range(5):
+            create_book_with_ident(
+                'foo', f'foo 10{i}', '1990-01-01', 1, 'en', 'foo', 'ISSN',
+                f'10{i}'
+            )
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse('book_list'), {'search_field': 'foo'})
+        self.assertContains(response, 'ISSN: 104')
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        self.books = [
+            create_book_with_ident(
+                f'author {i}', f'title {i}', '1990-01-01', 1, 'en', '',
+                'ISSN', f'77{i}'
+            )[0]
+            for i in range(5)
+        ]
+
+    def test_book_list_walks_pages_without_offset(self):
+        url = reverse('book_list') + '?page_size=2'
+        seen = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                seen.extend(response.context['book_list'])
+                url = response.context['next_url']
+
+        self.assertEqual(seen, self.books)
+        for query in queries.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_book_list_prev_page(self):
+        response = self.client.get(reverse('book_list') + '?page_size=2')
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual(response.context['book_list'], self.books[2:4])
+
+        response = self.client.get(response.context['prev_url'])
+        self.assertEqual(response.context['book_list'], self.books[:2])
+        self.assertIsNone(response.context['prev_url'])
+
+    def test_search_results_are_paginated(self):
+        response = self.client.post(
+            reverse('book_list') + '?page_size=2', {'search_field': 'author'})
+        self.assertEqual(response.context['book_list'], self.books[:2])
+
+        response = self.client.get(response.context['next_url'])
+        self.assertEqual(response.context['book_list'], self.books[2:4])
+
+    def test_search_pages_keep_tied_ranks(self):
+        # Same title and authors: every match has the same rank
+        tied = [
+            Book.objects.create(
+                authors='Tied Author', title='Tied', language='en',
+                page_count=pages)
+            for pages in range(1, 6)
+        ]
+        response = self.client.get(
+            reverse('book_list'), {'search_field': 'tied', 'page_size': 2})
+        found = list(response.context['book_list'])
+        while response.context['next_url']:
+            response = self.client.get(response.context['next_url'])
+            found.extend(response.context['book_list'])
+        self.assertEqual(found, tied)
+
+    def test_json_link_header(self):
+        url = reverse('book_list_json')
+        response = self.client.get(url, {'page_size': 3})
+        self.assertEqual(
+            [book['id'] for book in streamed_json(response)],
+            [book.id for book in self.books[:3]]
+        )
+        self.assertIn('rel="next"', response['Link'])
+        self.assertNotIn('rel="prev"', response['Link'])
+
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        self.assertEqual(
+            [book['id'] for book in streamed_json(response)],
+            [book.id for book in self.books[3:]]
+        )
+        self.assertIn('rel="prev"', response['Link'])
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_json_invalid_cursor(self):
+        response = self.client.get(
+            reverse('book_list_json'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_well_formed_cursor_with_wrong_values(self):
+        for data in ({'k': 5, 'd': 'next'}, {'k': ['abc'], 'd': 'next'},
+                     {'k': [[1]], 'd': 'prev'}):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(data).encode()).decode().rstrip('=')
+            response = self.client.get(
+                reverse('book_list_json'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, data)
+            response = self.client.get(
+                reverse('book_list'), {'cursor': cursor})
+            self.assertRedirects(response, reverse('book_list'))
+
+
+class TestBookListJsonStreaming(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_book_with_ident(
+                'foo', f'title {i}', '1990-01-01', 1, 'en', '', 'ISSN', f'{i}')
+
+    def test_json_array(self):
+        response = self.client.get(reverse('book_list_json'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        books = streamed_json(response)
+        self.assertEqual(
+            [book['title'] for book in books],
+            ['title 0', 'title 1', 'title 2']
+        )
+        self.assertEqual(books[0]['pub_date'], '1990-01-01')
+
+    def test_empty_json_array(self):
+        response = self.client.get(reverse('book_list_json'), {'title': 'x'})
+        self.assertEqual(streamed_json(response), [])
+
+    def test_ndjson(self):
+        response = self.client.get(
+            reverse('book_list_json'), {'format': 'ndjson', 'page_size': 2})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)['title'] for line in lines],
+            ['title 0', 'title 1']
+        )
+
+    @mock.patch('booker_app.views.BOOK_STREAM_CHUNK_SIZE', 2)
+    def test_unpaginated_stream_reads_in_chunks(self):
+        with mock.patch('booker_app.pagination.BOOK_MAX_PAGE_SIZE', 1):
+            response = self.client.get(
+                reverse('book_list_json'), {'page_size': 0})
+            books = streamed_json(response)
+        self.assertEqual(len(books), 3)
+        self.assertNotIn('Link', response)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('book_list_json'), {'format': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_default_fields(self):
+        books = streamed_json(self.client.get(reverse('book_list_json')))
+        self.assertEqual(set(books[0]), set(BookListJsonView.FIELDS))
+
+    def test_sparse_fields_are_selected_by_the_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('book_list_json'), {'fields': 'title, language'})
+            books = streamed_json(response)
+        self.assertEqual(
+            books[0], {'id': books[0]['id'], 'title': 'title 0', 'language': 'en'})
+        select = queries.captured_queries[-1]['sql']
+        self.assertIn('"title"', select)
+        self.assertNotIn('"authors"', select.split('FROM')[0])
+
+    def test_unknown_field(self):
+        response = self.client.get(
+            reverse('book_list_json'), {'fields': 'title,fingerprint'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fingerprint', response.json()['error'])
+
+    def test_include_identifiers_in_one_query(self):
+        def count_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                books = streamed_json(
+                    self.client.get(reverse('book_list_json'), params))
+            return len(queries), books
+
+        without, _ = count_queries({'page_size': 2})
+        with_identifiers, books = count_queries(
+            {'page_size': 2, 'include': 'identifiers', 'fields': 'title'})
+        self.assertEqual(with_identifiers, without + 1)
+        self.assertEqual(
+            books[1]['identifiers'], [{'type': 'ISSN', 'value': '1'}])
+
+    @mock.patch('booker_app.views.BOOK_STREAM_CHUNK_SIZE', 2)
+    def test_unpaginated_stream_includes_identifiers(self):
+        response = self.client.get(
+            reverse('book_list_json'),
+            {'page_size': 0, 'include': 'identifiers'}
+        )
+        books = streamed_json(response)
+        self.assertEqual(
+            [book['identifiers'][0]['value'] for book in books],
+            ['0', '1', '2']
+        )
+
+    def test_unknown_include(self):
+        response = self.client.get(
+            reverse('book_list_json'), {'include': 'covers'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestBookCards(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.book, self.ident = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'en', 'foo', 'ISSN', '1337')
+
+    def test_warm_page_reads_cards_from_cache(self):
+        self.client.get(reverse('book_list'))
+
+        # Catalog version and the page of books; no identifiers
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('book_list'))
+        self.assertContains(response, 'Identifier: ISSN: 1337')
+
+    def test_card_follows_writes(self):
+        self.client.get(reverse('book_list'))
+
+        Identifier(value='9781', type='ISBN_13', book=self.book).save()
+        self.assertContains(
+            self.client.get(reverse('book_list')), 'ISBN_13: 9781')
+
+        self.book.title = 'Renamed'
+        self.book.save()
+        self.assertContains(self.client.get(reverse('book_list')), 'Renamed')
+
+        self.ident.delete()
+        self.assertNotContains(
+            self.client.get(reverse('book_list')), 'ISSN: 1337')
+
+    def test_card_key_follows_updated_at(self):
+        # Written without any signal, as if by another process: nothing
+        # drops the cached card, the new updated_at is enough
+        self.client.get(reverse('book_list'))
+        Book.objects.filter(id=self.book.id).update(
+            title='Renamed elsewhere', updated_at=timezone.now())
+        self.assertContains(
+            self.client.get(reverse('book_list')), 'Renamed elsewhere')
+
+
+class StubImageServer:
+    """Local HTTP server standing in for books.google.com: /cover.png is a
+    600x900 PNG, /redirect redirects to the instance metadata address,
+    anything else is a 404. Counts the requests by path."""
+    def __init__(self):
+        image = io.BytesIO()
+        Image.new('RGBA', (600, 900), (200, 30, 30, 255)).save(image, 'PNG')
+        requests_by_path = self.requests = {}
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_by_path[self.path] = (
+                    requests_by_path.get(self.path, 0) + 1)
+                if self.path == '/redirect':
+                    self.send_response(302)
+                    self.send_header(
+                        'Location', 'http://169.254.169.254/latest/meta-data/')
+                    self.end_headers()
+                    return
+                if self.path != '/cover.png':
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', len(image.getvalue()))
+                self.end_headers()
+                self.wfile.write(image.getvalue())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.05},
+            daemon=True
+        ).start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestCoverAddresses(SimpleTestCase):
+    def test_private_addresses_are_refused(self):
+        for host in ('127.0.0.1', '10.1.2.3', '169.254.169.254', '::1'):
+            self.assertFalse(covers.is_public_address(host, 80), host)
+        self.assertTrue(covers.is_public_address('8.8.8.8', 80))
+
+    def test_hosts_are_checked(self):
+        self.assertTrue(covers.host_allowed('books.google.com'))
+        self.assertTrue(covers.host_allowed('lh3.googleusercontent.com'))
+        self.assertFalse(covers.host_allowed('books.google.com.evil.example'))
+        with self.assertRaises(covers.CoverError):
+            covers.check_url('file:///etc/passwd')
+        with mock.patch('booker_app.covers.COVER_ALLOWED_HOSTS', ['localhost']):
+            with self.assertRaises(covers.CoverError):
+                covers.check_url('http://localhost:8000/cover.png')
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestCovers(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = StubImageServer()
+        self.addCleanup(self.server.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch(
+            'booker_app.covers.COVER_CACHE_DIR', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(covers._failures.clear)
+        # The stub server stands in for an allowed, public host
+        for target, value in (
+                ('COVER_ALLOWED_HOSTS', ['127.0.0.1']),
+                ('is_public_address', lambda host, port: host == '127.0.0.1')):
+            patcher = mock.patch(f'booker_app.covers.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'en',
+            self.server.url('/cover.png'), 'ISSN', '1')
+
+    def test_thumbnail_is_fetched_once(self):
+        response = self.client.get(self.book.cover_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        thumbnail = Image.open(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(thumbnail.size, (128, 192))
+
+        # Served from the disk, without the database or the image server
+        with self.assertNumQueries(0):
+            response = self.client.get(self.book.cover_url)
+            b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, {'/cover.png': 1})
+
+    def test_key_of_another_cover(self):
+        url = reverse(
+            'book_cover', kwargs={'book_id': self.book.id, 'key': 'a' * 64})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.server.requests, {})
+
+    def test_missing_cover_is_not_asked_for_again(self):
+        self.book.cover_image_adress = self.server.url('/missing.png')
+        self.book.save()
+        for _ in range(2):
+            response = self.client.get(self.book.cover_url)
+            self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.server.requests, {'/missing.png': 1})
+
+    def test_only_allowed_hosts_are_fetched(self):
+        for url in ('http://169.254.169.254/latest/meta-data/',
+                    'http://internal.example/cover.png',
+                    self.server.url('/redirect')):
+            self.book.cover_image_adress = url
+            self.book.save()
+            # The proxy is asked directly, cover_url links to other hosts
+            response = self.client.get(reverse('book_cover', kwargs={
+                'book_id': self.book.id, 'key': covers.cover_key(url)}))
+            self.assertEqual(response.status_code, 502)
+        # The redirect to the metadata address was not followed
+        self.assertEqual(self.server.requests, {'/redirect': 1})
+
+    def test_card_shows_the_local_thumbnail(self):
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, f'src="{self.book.cover_url}"')
+
+    def test_covers_of_other_hosts_are_linked_directly(self):
+        address = 'https://covers.example.org/1.jpg'
+        self.book.cover_image_adress = address
+        self.book.save()
+        self.assertEqual(self.book.cover_url, address)
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, f'src="{address}"')
+
+    def test_covers_are_prefetched_after_import(self):
+        volume = google_volume(
+            'Imported', [('ISBN_13', '1')],
+            imageLinks={'thumbnail': self.server.url('/cover.png')}
+        )
+        Book.objects.all().delete()
+        futures = []
+        with mock.patch(
+                'booker_app.jobs.call_google_api', return_value=[volume]), \
+                mock.patch(
+                    'booker_app.jobs.prefetch_covers',
+                    side_effect=lambda urls: futures.extend(
+                        covers.prefetch_covers(urls))):
+            enqueue_import({'intitle': 'Imported'})
+            run_pending_jobs()
+        concurrent.futures.wait(futures)
+
+        book = Book.objects.get(title='Imported')
+        self.assertEqual(self.server.requests, {'/cover.png': 1})
+        with self.assertNumQueries(0):
+            response = self.client.get(book.cover_url)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestIdentifierLookup(TestCase):
+    def setUp(self):
+        self.book, _ = create_book_with_ident(
+            'J.R.R. Tolkien', 'The Hobbit', '1991-01-01', 310, 'en', '',
+            'ISBN_13', '978-0-261-10221-7'
+        )
+        Identifier(value='OCLC-12', type='OTHER', book=self.book).save()
+
+    def test_canonical_values(self):
+        self.assertEqual(
+            canonical_identifier('ISBN_10', '0-261-10221-4'), '9780261102217')
+        self.assertEqual(
+            canonical_identifier('ISBN_13', '978 0 261 10221 7'),
+            '9780261102217'
+        )
+        self.assertEqual(
+            canonical_identifier('ISBN_10', '080442957x'), '9780804429573')
+        # Wrong check digit
+        self.assertIsNone(canonical_identifier('ISBN_13', '9780261102218'))
+        self.assertEqual(canonical_identifier('ISSN', '0317-8471'), '03178471')
+        self.assertEqual(canonical_lookup('0261102214'), '9780261102217')
+        self.assertEqual(
+            Identifier.objects.get(type='ISBN_13').canonical, '9780261102217')
+
+    def test_lookup_in_one_request(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                reverse('identifier_lookup'),
+                {'identifiers': ['0-261-10221-4', '1111111111', 'oclc-12']},
+                content_type='application/json'
+            )
+
+        results = response.json()['results']
+        self.assertEqual(
+            [result['identifier'] for result in results],
+            ['0-261-10221-4', '1111111111', 'oclc-12']
+        )
+        self.assertEqual(results[0]['book']['id'], self.book.id)
+        self.assertEqual(
+            sorted(i['type'] for i in results[0]['book']['identifiers']),
+            ['ISBN_13', 'OTHER']
+        )
+        self.assertIsNone(results[1]['book'])
+        self.assertEqual(results[2]['book']['title'], 'The Hobbit')
+
+    def test_lookup_get(self):
+        response = self.client.get(
+            reverse('identifier_lookup') + '?identifier=9780261102217')
+        self.assertEqual(
+            response.json()['results'][0]['book']['id'], self.book.id)
+
+    def test_invalid_request(self):
+        response = self.client.post(
+            reverse('identifier_lookup'), 'not json',
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch('booker_app.views.IDENTIFIER_LOOKUP_MAX', 1):
+            response = self.client.get(
+                reverse('identifier_lookup') + '?identifier=1&identifier=2')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestAutocomplete(TestCase):
+    def setUp(self):
+        cache.clear()
+        for authors, title in (
+                ('J.R.R. Tolkien', 'The Lord of the Rings'),
+                ('J.R.R. Tolkien', 'The Hobbit'),
+                ('Victor Hugo', 'Les Misérables'),
+                ('Thomas Mann', 'Lotte in Weimar')):
+            Book(authors=authors, title=title, language='en').save()
+
+    def suggest(self, text):
+        response = self.client.get(reverse('autocomplete'), {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search_key(self):
+        self.assertEqual(search_key('Les Misérables!'), 'les miserables')
+        self.assertEqual(search_key('  The   LORD, of-the'), 'the lord of the')
+        self.assertEqual(search_key(None), '')
+        book = Book.objects.get(title='The Hobbit')
+        self.assertEqual(
+            (book.title_key, book.authors_key), ('the hobbit', 'j r r tolkien'))
+
+    def test_titles_then_authors(self):
+        data = self.suggest('Th')
+        self.assertEqual(data['prefix'], 'th')
+        self.assertEqual(
+            [(book['title'], book['match']) for book in data['results']],
+            [('The Hobbit', 'title'), ('The Lord of the Rings', 'title'),
+             ('Lotte in Weimar', 'authors')]
+        )
+        data = self.suggest('les mise')
+        self.assertEqual(
+            [book['title'] for book in data['results']], ['Les Misérables'])
+        data = self.suggest('j. r. r. tolk')
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(self.suggest('lord')['results'], [])
 
+    def test_short_prefix_and_limit(self):
+        self.assertEqual(self.suggest('t')['results'], [])
+        self.assertEqual(
+            [book['title'] for book in suggest('th', limit=2)],
+            ['The Hobbit', 'The Lord of the Rings']
+        )
+
+    def test_cached_per_prefix_until_the_catalog_changes(self):
+        self.suggest('the')
+        # Only the catalog version is read
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.suggest('The ')['results']), 2)
+
+        Book(authors='Nobody', title='The Trial', language='de').save()
+        self.assertEqual(len(self.suggest('the')['results']), 2)
+        CatalogVersion.bump()
+        self.assertEqual(len(self.suggest('the')['results']), 3)
+
+    def test_prefix_lookup_uses_the_index(self):
+        queryset = prefix_matches('title_key', 'the')[:10]
+        with connection.cursor() as cursor:
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('booker_app_book_title_key_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @mock.patch('booker_app.views.BOOK_BATCH_API_TOKENS', ['secret'])
+    def test_bulk_writes_fill_the_keys(self):
+        response = self.client.post(
+            reverse('book_batch'),
+            {'operations': [
+                {'op': 'create', 'book': {
+                    'authors': 'Émile Zola', 'title': 'Germinal',
+                    'pub_date': '1885', 'language': 'fr'}},
+                {'op': 'update', 'id': Book.objects.get(
+                    title='The Hobbit').id, 'book': {'title': 'Hobbit'}},
+            ]},
+            content_type='application/json', **BATCH_AUTH
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            Book.objects.get(title='Germinal').authors_key, 'emile zola')
+        self.assertEqual(
+            Book.objects.get(title='Hobbit').title_key, 'hobbit')
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        self.book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'en', 'foo', 'ISSN', '1337')
+        CatalogVersion.bump()
+        self.urls = [
+            reverse('book_list'),
+            reverse('book_list_json') + '?format=ndjson',
+            reverse('book_details', kwargs={'book_id': self.book.id})
+        ]
+
+    def test_unchanged_catalog_is_not_modified(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            # Only the catalog version is read
+            with self.assertNumQueries(1):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+
+        self.client.post(reverse('add_book'), {
+            'authors': 'bar',
+            'title': 'bar',
+            'pub_date': '2010-10-10',
+            'language': 'en',
+            'page_count': 4
+        })
+
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_import_changes_etag(self):
+        version = CatalogVersion.current().version
+        import_volumes([google_volume('Imported')])
+        self.assertEqual(CatalogVersion.current().version, version + 1)
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestBookSearch(TestCase):
+    def search(self, phrase):
+        response = self.client.post(
+            reverse('book_list'), {'search_field': phrase})
+        return list(response.context['book_list'])
+
+    def test_title_match_ranks_first(self):
+        by_author, _ = create_book_with_ident(
+            'Ann Tolkien', 'Letters', '1990-01-01', 1, 'en', '', 'ISSN', '1')
+        by_title, _ = create_book_with_ident(
+            'John Doe', 'Reading Tolkien', '1990-01-01', 1, 'en', '',
+            'ISSN', '2'
+        )
+        create_book_with_ident(
+            'John Doe', 'Other', '1990-01-01', 1, 'en', '', 'ISSN', '3')
+
+        self.assertEqual(self.search('tolkien'), [by_title, by_author])
+
+    def test_prefix_and_multiple_terms(self):
+        book, _ = create_book_with_ident(
+            'John Ronald Tolkien', 'The Hobbit', '1990-01-01', 1, 'en', '',
+            'ISSN', '1'
+        )
+        create_book_with_ident(
+            'John Doe', 'The Road', '1990-01-01', 1, 'en', '', 'ISSN', '2')
+
+        self.assertEqual(self.search('hobb tolk'), [book])
+        self.assertEqual(self.search('"(*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        book, _ = create_book_with_ident(
+            'John Doe', 'Old title', '1990-01-01', 1, 'en', '', 'ISSN', '1')
+        book.title = 'New title'
+        book.save()
+        self.assertEqual(self.search('old'), [])
+        self.assertEqual(self.search('new'), [book])
+
+        book.delete()
+        self.assertEqual(self.search('new'), [])
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
 class TestBookDetailsView(TestCase):
 
     def test_no_book(self):
@@ -235,7 +1023,84 @@ class TestBookDetailsView(TestCase):
 
             self.assertEqual(book_edited.authors, data['authors'])
 
+    def edit_data(self, **identifiers):
+        data = {
+            'authors': 'bar',
+            'title': 'bar',
+            'pub_date': '2010-10-10',
+            'language': 'en',
+            'page_count': 42
+        }
+        data.update(identifiers)
+        return data
+
+    def test_book_edit_updates_and_adds_identifiers(self):
+        book, ident = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'pl', 'foo', 'ISSN', '1337')
+        url = reverse('book_details', kwargs={'book_id': book.id})
+
+        response = self.client.post(
+            url, self.edit_data(ISSN='1338', ISBN_13='9781'))
+
+        self.assertEqual(
+            response.context['success_msg'], 'Book updated successfully')
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'bar')
+        self.assertEqual(book.fingerprint, book.fill_fingerprint())
+        self.assertEqual(
+            sorted(book.identifier_display), ['ISBN_13: 9781', 'ISSN: 1338'])
+        self.assertEqual(Identifier.objects.get(type='ISSN').id, ident.id)
+
+    def test_book_edit_identifier_of_other_book(self):
+        book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'pl', 'foo', 'ISSN', '1337')
+        create_book_with_ident(
+            'baz', 'baz', '1990-01-01', 1, 'pl', 'baz', 'ISSN', '4242')
+        url = reverse('book_details', kwargs={'book_id': book.id})
+
+        response = self.client.post(url, self.edit_data(ISSN='4242'))
+
+        self.assertEqual(
+            response.context['error_msg'],
+            'Book with this identifier already exists.'
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.title, 'foo')
+
+    def test_book_edit_duplicate_of_other_book(self):
+        book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'pl', 'foo', 'ISSN', '1337')
+        create_book_with_ident(
+            'bar', 'bar', '2010-10-10', 42, 'en', None, 'ISSN', '4242')
+        url = reverse('book_details', kwargs={'book_id': book.id})
+
+        response = self.client.post(url, self.edit_data(ISSN='1338'))
+
+        self.assertEqual(
+            response.context['error_msg'],
+            'Book with these details already exists.'
+        )
+        self.assertEqual(Identifier.objects.get(book=book).value, '1337')
+
+    def test_book_edit_query_count(self):
+        """
+        An edit costs the same number of queries however many identifiers
+        are added or changed.
+        """
+        book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'pl', 'foo', 'ISSN', '1337')
+        url = reverse('book_details', kwargs={'book_id': book.id})
+
+        # savepoint, lock, identifiers, book update, bulk update, bulk
+        # insert, catalog version, release
+        with self.assertNumQueries(8):
+            self.client.post(url, self.edit_data(ISSN='1', ISBN_10='2'))
+        with self.assertNumQueries(8):
+            self.client.post(url, self.edit_data(
+                ISSN='3', ISBN_10='4', ISBN_13='5', OTHER='6'))
 
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
 class TestBookFormView(TestCase):
     def test_add_book_ok(self):
         data = {
@@ -272,7 +1137,26 @@ class TestBookFormView(TestCase):
             response = self.client.post(reverse('add_book'), data)
             self.assertEqual(response.status_code, 400)
 
+    def test_add_duplicate_book_with_identifier(self):
+        data = {
+            'authors': 'a',
+            'title': 'b',
+            'pub_date': '2010',
+            'language': 'pl',
+            'page_count': 4,
+            'ISBN_10': '1234567890'
+        }
+        self.client.post(reverse('add_book'), data)
+        data['ISBN_10'] = '0987654321'
+        response = self.client.post(reverse('add_book'), data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['msg'], 'b by a already exists.')
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(Identifier.objects.count(), 1)
 
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
 class TestBookDeleteView(TestCase):
     def test_delete_book(self):
         book, ident = create_book_with_ident(
@@ -290,3 +1174,1185 @@ class TestBookDeleteView(TestCase):
         b = Book.objects.all()
 
         self.assertEqual(len(b), 0)
+
+
+@mock.patch('booker_app.replicas.DATABASE_REPLICAS', ['replica_0'])
+class TestReplicaRouting(SimpleTestCase):
+    # Not TestCase: its transaction would keep every read on the primary
+    databases = {'default'}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.addCleanup(replicas.reset)
+
+    def route(self, request, view=None):
+        """Response of the middleware and where the view read from."""
+        read_from = []
+
+        def get_response(request):
+            if view:
+                view()
+            read_from.append(self.router.db_for_read(Book))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(get_response)(request)
+        return response, read_from[0]
+
+    def test_get_reads_from_a_replica(self):
+        response, read_from = self.route(self.factory.get('/'))
+        self.assertEqual(read_from, 'replica_0')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        # Outside of requests everything stays on the primary
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_post_reads_from_the_primary(self):
+        _, read_from = self.route(self.factory.post('/'))
+        self.assertEqual(read_from, 'default')
+
+    def test_write_pins_the_client(self):
+        response, read_from = self.route(
+            self.factory.get('/'),
+            view=lambda: self.router.db_for_write(Book))
+        self.assertEqual(read_from, 'default')
+        self.assertEqual(
+            response.cookies[PIN_COOKIE]['max-age'], REPLICA_PIN_SECONDS)
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        _, read_from = self.route(request)
+        self.assertEqual(read_from, 'default')
+
+    def test_transactions_read_from_the_primary(self):
+        def view():
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Book), 'default')
+        self.route(self.factory.get('/'), view=view)
+
+    def test_streamed_rows_read_from_the_replica(self):
+        def stream():
+            yield self.router.db_for_read(Book)
+
+        response = ReplicaMiddleware(
+            lambda request: StreamingHttpResponse(stream())
+        )(self.factory.get('/'))
+        self.assertEqual(list(response.streaming_content), [b'replica_0'])
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+
+@mock.patch('booker_app.replicas.DATABASE_REPLICAS', ['replica_0'])
+class TestReplicaPinning(TestCase):
+    def test_form_post_sets_the_pin_cookie(self):
+        book, _ = create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'pl', None, 'ISSN', '0009')
+        response = self.client.post(
+            reverse('delete_book', kwargs={'id': book.id}))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertFalse(Book.objects.exists())
+
+
+def google_volume(title, identifiers=(), **extra):
+    volume = {
+        'title': title,
+        'authors': ['Jane Doe'],
+        'publishedDate': '2001-05',
+        'language': 'en',
+        'industryIdentifiers': [
+            {'type': ident_type, 'identifier': value}
+            for ident_type, value in identifiers
+        ]
+    }
+    volume.update(extra)
+    return volume
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestImportBookView(TestCase):
+    def import_volumes(self, volumes):
+        with mock.patch(
+                'booker_app.jobs.call_google_api', return_value=volumes):
+            response = self.client.post(
+                reverse('import_book'), {'search_title': 'anything'})
+            run_pending_jobs()
+        return self.client.get(response.context['job_url']).json()
+
+    def test_post_only_queues_a_job(self):
+        with mock.patch('booker_app.jobs.call_google_api') as google_api:
+            response = self.client.post(
+                reverse('import_book'), {'search_title': 'Hobbit'})
+            google_api.assert_not_called()
+
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.QUEUED)
+        self.assertEqual(job.keywords_fields['intitle'], 'Hobbit')
+        self.assertEqual(
+            response.context['job_url'],
+            reverse('import_job', kwargs={'job_id': job.id})
+        )
+
+    def test_import_saves_books_and_identifiers(self):
+        job = self.import_volumes([
+            google_volume('First', [('ISBN_13', '111'), ('ISBN_10', '112')]),
+            google_volume('Second', [('ISBN_13', '211')]),
+            google_volume('No idents'),
+        ])
+
+        self.assertEqual(job['status'], ImportJob.DONE)
+        self.assertEqual(
+            [result['status'] for result in job['results']],
+            [IMPORTED, IMPORTED, IMPORTED]
+        )
+        self.assertEqual(Book.objects.count(), 3)
+        first = Book.objects.get(title='First')
+        self.assertEqual(job['results'][0]['book_id'], first.id)
+        self.assertEqual(first.pub_date, datetime.date(2001, 5, 1))
+        self.assertEqual(
+            sorted(first.identifier_display),
+            ['ISBN_10: 112', 'ISBN_13: 111']
+        )
+
+    def test_existing_volumes_are_skipped(self):
+        create_book_with_ident(
+            'a', 'Stored', '1990-01-01', 1, 'en', '', 'ISBN_13', '111')
+        self.import_volumes([google_volume('No idents')])
+
+        job = self.import_volumes([
+            google_volume('Stored', [('ISBN_13', '111')]),
+            google_volume('No idents'),
+            google_volume('New', [('ISBN_13', '311')]),
+            google_volume('New again', [('ISBN_13', '311')]),
+        ])
+
+        self.assertEqual(
+            [result['status'] for result in job['results']],
+            [EXISTS, EXISTS, IMPORTED, EXISTS]
+        )
+        self.assertEqual(
+            job['results'][0]['message'],
+            'Book with ISBN_13: 111 already exists.'
+        )
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)),
+            ['New', 'No idents', 'Stored']
+        )
+
+    def test_identified_duplicate_of_stored_book_is_skipped(self):
+        self.import_volumes([google_volume('Stored')])
+
+        job = self.import_volumes([
+            google_volume('Stored', [('ISBN_13', '111')]),
+        ])
+
+        self.assertEqual(job['results'][0]['status'], EXISTS)
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertFalse(Identifier.objects.exists())
+
+    def test_failed_job(self):
+        with mock.patch(
+                'booker_app.jobs.call_google_api',
+                side_effect=GoogleBooksError('timed out')):
+            enqueue_import({'isbn': '1'})
+            run_pending_jobs()
+
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.error, 'timed out')
+
+    def test_unknown_job(self):
+        response = self.client.get(
+            reverse('import_job', kwargs={'job_id': 1}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_lookups_do_not_grow_with_volumes(self):
+        volumes = [
+            google_volume(f'Book {i}', [('ISBN_13', f'9{i}'), ('ISSN', f'8{i}')])
+            for i in range(10)
+        ] + [google_volume(f'No idents {i}') for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            import_volumes(volumes)
+
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(
+            len([q for q in sql if q.startswith('SELECT')]), 2)
+        self.assertEqual(
+            len([q for q in sql if 'INSERT INTO "booker_app_identifier"' in q]),
+            1
+        )
+        self.assertEqual(Identifier.objects.count(), 20)
+
+
+class TestImportWorker(TransactionTestCase):
+    def test_worker_drains_the_queue(self):
+        for i in range(3):
+            enqueue_import({'isbn': str(i)})
+        volumes = [google_volume('Book', [('ISBN_13', '1')])]
+        with mock.patch(
+                'booker_app.jobs.call_google_api', return_value=volumes):
+            call_command(
+                'run_import_worker', once=True, concurrency=1,
+                stdout=io.StringIO()
+            )
+
+        self.assertEqual(
+            set(ImportJob.objects.values_list('status', flat=True)),
+            {ImportJob.DONE}
+        )
+        self.assertEqual(Book.objects.count(), 1)
+
+    def test_failing_job_does_not_stop_the_worker(self):
+        for i in range(2):
+            enqueue_import({'isbn': str(i)})
+        volumes = [google_volume('Book', [('ISBN_13', '1')])]
+        stderr = io.StringIO()
+        with mock.patch(
+                'booker_app.jobs.call_google_api', return_value=volumes), \
+                mock.patch(
+                    'booker_app.jobs.prefetch_imported_covers',
+                    side_effect=[RuntimeError('covers'), None]) as prefetch:
+            call_command(
+                'run_import_worker', once=True, concurrency=1,
+                stdout=io.StringIO(), stderr=stderr
+            )
+
+        self.assertEqual(prefetch.call_count, 2)
+        self.assertIn('RuntimeError: covers', stderr.getvalue())
+
+    def test_lease_is_renewed_while_the_job_runs(self):
+        enqueue_import({'isbn': '1'})
+        job = claim_next_job()
+        with lease(job, interval=0.01):
+            time.sleep(0.2)
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+    def test_only_expired_leases_are_requeued(self):
+        now = timezone.now()
+        alive, dead = [
+            ImportJob.objects.create(
+                query='{}', status=ImportJob.RUNNING, started_at=started,
+                heartbeat_at=heartbeat
+            )
+            for started, heartbeat in (
+                (now - datetime.timedelta(hours=1), now),
+                (now - datetime.timedelta(minutes=2),
+                 now - datetime.timedelta(minutes=2)),
+            )
+        ]
+
+        self.assertEqual(requeue_stale_jobs(60), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, ImportJob.RUNNING)
+        self.assertEqual(dead.status, ImportJob.QUEUED)
+
+
+class FakeGoogleBooksSession:
+    """Stands in for requests.Session; serves `total` numbered volumes."""
+    def __init__(self, total, fail=False):
+        self.total = total
+        self.fail = fail
+        self.calls = []
+
+    def get(self, url, params, timeout):
+        self.calls.append(dict(params, timeout=timeout))
+        if self.fail:
+            raise requests.ConnectionError('connection refused')
+        start = params['startIndex']
+        end = min(start + params['maxResults'], self.total)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({
+            'totalItems': self.total,
+            'items': [
+                {'id': str(i), 'volumeInfo': {'title': f'Book {i}'}}
+                for i in range(start, end)
+            ]
+        }).encode()
+        return response
+
+
+class TestGoogleBooksClient(TestCase):
+    def test_pages_through_results(self):
+        session = FakeGoogleBooksSession(total=95)
+        client = GoogleBooksClient(session=session, timeout=(1, 2))
+
+        volumes = client.search({'intitle': 'flowers', 'inauthor': 'keyes'})
+
+        self.assertEqual(
+            [volume['title'] for volume in volumes],
+            [f'Book {i}' for i in range(95)]
+        )
+        self.assertEqual(
+            sorted(call['startIndex'] for call in session.calls), [0, 40, 80])
+        self.assertEqual(session.calls[0]['q'], 'intitle:flowers inauthor:keyes')
+        self.assertEqual(session.calls[0]['timeout'], (1, 2))
+
+    def test_max_items(self):
+        session = FakeGoogleBooksSession(total=500)
+        client = GoogleBooksClient(session=session, max_items=50)
+
+        self.assertEqual(len(client.search({'isbn': '1'})), 50)
+        self.assertEqual(len(session.calls), 2)
+
+    def test_nothing_found(self):
+        client = GoogleBooksClient(session=FakeGoogleBooksSession(total=0))
+        self.assertIsNone(client.search({'isbn': '1'}))
+
+    def test_connection_error(self):
+        client = GoogleBooksClient(
+            session=FakeGoogleBooksSession(total=1, fail=True))
+        with self.assertRaises(GoogleBooksError):
+            client.search({'isbn': '1'})
+
+
+class FakeAsyncGoogleBooksSession:
+    """Stands in for aiohttp.ClientSession; answers with the given status
+    codes in turn, the last one with a page of one volume."""
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = []
+
+    def get(self, url, params):
+        self.calls.append(params)
+        return FakeAsyncResponse(self.statuses.pop(0))
+
+
+class FakeAsyncResponse:
+    def __init__(self, status):
+        self.status = status
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientError(f'HTTP {self.status}')
+
+    async def json(self, content_type='application/json'):
+        return {'totalItems': 1, 'items': [{'volumeInfo': {'title': 'One'}}]}
+
+
+class TestAsyncGoogleBooksClient(TestCase):
+    def run_coroutine(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_searches_run_concurrently(self):
+        in_flight = []
+        most_in_flight = []
+
+        async def fetch_page(session, query, max_results):
+            in_flight.append(query)
+            most_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.remove(query)
+            if query == 'isbn:13':
+                raise GoogleBooksError('HTTP 500')
+            if query == 'isbn:14':
+                return {'totalItems': 0}
+            return {'items': [{'volumeInfo': {'title': query}}]}
+
+        client = AsyncGoogleBooksClient(concurrency=5)
+        started = time.perf_counter()
+        with mock.patch.object(client, 'fetch_page', fetch_page):
+            results = client.search_many(
+                [{'isbn': str(i)} for i in range(20)])
+        elapsed = time.perf_counter() - started
+
+        # 4 rounds of 5 lookups instead of 20 in a row
+        self.assertLess(elapsed, 20 * 0.05 / 2)
+        self.assertEqual(max(most_in_flight), 5)
+        self.assertEqual(results[0], [{'title': 'isbn:0'}])
+        self.assertIsInstance(results[13], GoogleBooksError)
+        self.assertIsNone(results[14])
+
+    def test_retries_server_errors(self):
+        client = AsyncGoogleBooksClient()
+        client.BACKOFF_FACTOR = 0
+        session = FakeAsyncGoogleBooksSession([503, 200])
+        page = self.run_coroutine(client.fetch_page(session, 'isbn:1', 40))
+        self.assertEqual(page['items'][0]['volumeInfo']['title'], 'One')
+        self.assertEqual(len(session.calls), 2)
+
+    def test_client_error(self):
+        client = AsyncGoogleBooksClient()
+        client.BACKOFF_FACTOR = 0
+        session = FakeAsyncGoogleBooksSession([503, 503, 503])
+        with self.assertRaises(GoogleBooksError):
+            self.run_coroutine(client.fetch_page(session, 'isbn:1', 40))
+        self.assertEqual(len(session.calls), 3)
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'google_books': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'google_books',
+    },
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestGoogleBooksCache(TestCase):
+    def setUp(self):
+        self.fetch = mock.Mock(return_value=[{'title': 'Hobbit'}])
+        get_cache().purge()
+
+    def test_tiers_and_counters(self):
+        cache = GoogleBooksCache()
+        fields = {'inauthor': 'Tolkien ', 'intitle': '', 'isbn': '978-83-1'}
+
+        self.assertEqual(cache.search(fields, self.fetch), [{'title': 'Hobbit'}])
+        # Normalized to the same key
+        cache.search({'isbn': '978831', 'inauthor': 'tolkien'}, self.fetch)
+        # A new process only has the persistent tier
+        GoogleBooksCache().search(fields, self.fetch)
+        fresh = GoogleBooksCache()
+        fresh.search(fields, self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(
+            cache.stats, {'memory_hits': 1, 'persistent_hits': 0, 'misses': 1})
+        self.assertEqual(fresh.stats['persistent_hits'], 1)
+
+    def test_empty_results_are_cached(self):
+        cache = GoogleBooksCache()
+        self.fetch.return_value = None
+
+        self.assertIsNone(cache.search({'isbn': '1'}, self.fetch))
+        self.assertIsNone(cache.search({'isbn': '1'}, self.fetch))
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_expired_entries_are_refetched(self):
+        cache = GoogleBooksCache(ttl=-1)
+        cache.search({'isbn': '1'}, self.fetch)
+        cache.search({'isbn': '1'}, self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_purge_reaches_the_memory_of_other_processes(self):
+        worker = GoogleBooksCache()
+        worker.search({'isbn': '1'}, self.fetch)
+        GoogleBooksCache().purge()
+
+        # Until its next check the worker trusts its memory tier
+        worker.search({'isbn': '1'}, self.fetch)
+        self.assertEqual(self.fetch.call_count, 1)
+        with mock.patch('booker_app.cache.GENERATION_CHECK_INTERVAL', 0):
+            worker.search({'isbn': '1'}, self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_command_warms_and_purges(self):
+        client = mock.Mock()
+        client.search = self.fetch
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as queries:
+            queries.write('inauthor:tolkien intitle:the hobbit\nisbn:1\n')
+            queries.flush()
+            with mock.patch(
+                    'booker_app.management.commands.google_books_cache'
+                    '.get_client', return_value=client):
+                call_command('google_books_cache', warm=queries.name,
+                             stdout=io.StringIO())
+
+        self.fetch.assert_any_call(
+            {'inauthor': 'tolkien', 'intitle': 'the hobbit'})
+        get_cache().search({'isbn': '1'}, self.fetch)
+        self.assertEqual(self.fetch.call_count, 2)
+
+        call_command('google_books_cache', purge=True, stdout=io.StringIO())
+        get_cache().search({'isbn': '1'}, self.fetch)
+        self.assertEqual(self.fetch.call_count, 3)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestImportBatch(TestCase):
+    def setUp(self):
+        get_cache().purge()
+        self.addCleanup(get_cache().purge)
+
+    def test_form_cleans_and_dedupes_isbns(self):
+        form = ImportBatchForm({
+            'isbns': f'{isbn_13(1)}\n  0-00-000002-7 , {isbn_10(1)};\n\n'
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['isbns'], [isbn_13(1), isbn_10(2)])
+
+    def test_form_rejects_invalid_isbns(self):
+        form = ImportBatchForm({'isbns': f'{isbn_13(1)}\n9780000000000'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('9780000000000', form.errors['isbns'][0])
+
+    @mock.patch('booker_app.forms.IMPORT_BATCH_MAX_ISBNS', 2)
+    def test_form_limits_the_batch(self):
+        form = ImportBatchForm({
+            'isbns': '\n'.join(isbn_13(i) for i in range(3))})
+        self.assertFalse(form.is_valid())
+
+    def test_post_only_queues_a_job(self):
+        with mock.patch.object(
+                AsyncGoogleBooksClient, 'search_many') as search_many:
+            response = self.client.post(
+                reverse('import_batch'), {'isbns': isbn_13(1)})
+            search_many.assert_not_called()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.isbns, [isbn_13(1)])
+        self.assertEqual(
+            response.context['job_url'],
+            reverse('import_job', kwargs={'job_id': job.id})
+        )
+
+    def test_job_imports_every_isbn(self):
+        stored, _ = create_book_with_ident(
+            'foo', 'Stored', '1990-01-01', 1, 'en', None,
+            'ISBN_13', isbn_13(1))
+        isbns = [isbn_10(1), isbn_13(2), isbn_13(3), isbn_13(4)]
+        searched = [
+            [google_volume('Two', [('ISBN_13', isbn_13(2))])],
+            None,
+            GoogleBooksError('HTTP 500')
+        ]
+        job = enqueue_batch_import(isbns)
+        with mock.patch.object(
+                AsyncGoogleBooksClient, 'search_many',
+                return_value=searched) as search_many:
+            run_pending_jobs()
+        # The stored book is not looked up
+        search_many.assert_called_once_with(
+            [{'isbn': isbn} for isbn in isbns[1:]])
+
+        job.refresh_from_db()
+        results = job.result_list
+        self.assertEqual([result['isbn'] for result in results], isbns)
+        self.assertEqual(
+            [result['status'] for result in results],
+            [EXISTS, IMPORTED, NOT_FOUND, FAILED]
+        )
+        self.assertEqual(results[0]['book_id'], stored.id)
+        self.assertEqual(
+            Book.objects.get(title='Two').id, results[1]['book_id'])
+
+        # Successful lookups are cached, failed ones are tried again
+        Book.objects.filter(title='Two').delete()
+        with mock.patch.object(
+                AsyncGoogleBooksClient, 'search_many',
+                return_value=[None]) as search_many:
+            self.assertEqual(
+                [result['status'] for result in import_isbns(isbns[1:])],
+                [IMPORTED, NOT_FOUND, NOT_FOUND]
+            )
+        search_many.assert_called_once_with([{'isbn': isbn_13(4)}])
+
+
+class TestLoadBooksCommand(TestCase):
+    def write_dump(self, suffix, content):
+        dump = tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, delete=False, newline='')
+        dump.write(content)
+        dump.close()
+        self.addCleanup(os.remove, dump.name)
+        return dump.name
+
+    def load(self, path, **options):
+        stdout = io.StringIO()
+        call_command('load_books', path, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def jsonl_dump(self):
+        volumes = [
+            {'volumeInfo': google_volume('One', [('ISBN_13', '1')])},
+            google_volume('Two', [('ISBN_13', '2')]),
+            google_volume('Two again', [('ISBN_13', '2')]),
+            {'authors': ['No title']},
+            google_volume('Three'),
+        ]
+        return self.write_dump(
+            '.jsonl', '\n'.join(json.dumps(volume) for volume in volumes))
+
+    def test_jsonl(self):
+        output = self.load(self.jsonl_dump(), batch_size=2, workers=0)
+
+        self.assertIn('3 imported, 1 existing, 1 invalid', output)
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)),
+            ['One', 'Three', 'Two']
+        )
+        self.assertEqual(
+            Book.objects.get(title='One').identifier_display, ['ISBN_13: 1'])
+
+    def test_too_long_values_are_invalid(self):
+        volumes = [
+            google_volume('Regional', language='zh-CN'),
+            google_volume('Long' * 100),
+            google_volume('Long identifier', [('OTHER', 'x' * 300)]),
+            google_volume('Fits'),
+        ]
+        path = self.write_dump(
+            '.jsonl', '\n'.join(json.dumps(volume) for volume in volumes))
+
+        output = self.load(path, workers=0)
+
+        self.assertIn('1 imported, 0 existing, 3 invalid', output)
+        self.assertEqual(
+            list(Book.objects.values_list('title', flat=True)), ['Fits'])
+
+    def test_parser_processes(self):
+        self.load(self.jsonl_dump(), batch_size=1, workers=2)
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_csv(self):
+        path = self.write_dump('.csv', (
+            'title,authors,publishedDate,pageCount,language,thumbnail,'
+            'ISBN_10,ISBN_13,ISSN,OTHER\n'
+            'Hobbit,"J. R. R. Tolkien,C. Tolkien",1937,310,en,,1234,978,,\n'
+        ))
+        self.load(path, workers=0)
+
+        book = Book.objects.get()
+        self.assertEqual(book.authors, 'J. R. R. Tolkien,C. Tolkien')
+        self.assertEqual(book.pub_date, datetime.date(1937, 1, 1))
+        self.assertEqual(book.page_count, 310)
+        self.assertEqual(
+            sorted(book.identifier_display), ['ISBN_10: 1234', 'ISBN_13: 978'])
+
+    def test_resume_from_checkpoint(self):
+        path = self.jsonl_dump()
+        with open(f'{path}.checkpoint', 'w') as checkpoint:
+            json.dump({'records': 3}, checkpoint)
+
+        output = self.load(path, workers=0, resume=True)
+
+        self.assertIn('Resuming after 3 records.', output)
+        self.assertEqual(
+            list(Book.objects.values_list('title', flat=True)), ['Three'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestMetrics(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        return response.content.decode().splitlines()
+
+    def test_requests_are_recorded_per_view(self):
+        create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'en', 'foo', 'ISSN', '1337')
+        self.client.get(reverse('book_list'))
+        self.client.get(reverse('book_list'))
+        streamed_json(self.client.get(reverse('book_list_json')))
+
+        lines = self.scrape()
+        self.assertIn(
+            'booker_requests_total{view="book_list",method="GET",status="200"} 2',
+            lines
+        )
+        self.assertIn(
+            'booker_request_duration_seconds_count'
+            '{view="book_list",method="GET"} 2',
+            lines
+        )
+        self.assertIn(
+            'booker_request_db_queries_bucket{view="book_list",le="+Inf"} 2',
+            lines
+        )
+        size = [
+            line for line in lines
+            if line.startswith('booker_response_size_bytes_sum'
+                               '{view="book_list_json"}')
+        ]
+        self.assertEqual(len(size), 1)
+        self.assertGreater(float(size[0].split()[-1]), 0)
+        self.assertTrue(any(
+            line.startswith('booker_google_books_cache_misses_total ')
+            for line in lines
+        ))
+
+    def test_streamed_queries_are_counted(self):
+        create_book_with_ident(
+            'foo', 'foo', '1990-01-01', 1, 'en', 'foo', 'ISSN', '1337')
+        response = self.client.get(
+            reverse('book_list_json'), {'page_size': 0})
+        streamed_json(response)
+        response.close()
+
+        lines = self.scrape()
+        queries = [
+            line for line in lines
+            if line.startswith(
+                'booker_request_db_queries_sum{view="book_list_json"}')
+        ]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+
+    def test_processes_are_added_up(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch(
+            'booker_app.metrics.METRICS_DIR', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # A worker still running and one which exited
+        for pid, requests_count in ((os.getppid(), 2), (4194305, 3)):
+            path = os.path.join(directory.name, f'metrics_{pid}.json')
+            with open(path, 'w') as snapshot:
+                json.dump({
+                    'booker_requests_total': [
+                        [['book_list', 'GET', 200], requests_count]],
+                    'booker_db_pool_connections': [
+                        [['default', 'idle'], 1]],
+                }, snapshot)
+
+        self.client.get(reverse('book_list'))
+        lines = self.scrape()
+        self.assertIn(
+            'booker_requests_total{view="book_list",method="GET",status="200"} 6',
+            lines
+        )
+        self.assertIn(
+            'booker_db_pool_connections{alias="default",state="idle"} 1',
+            lines
+        )
+        self.assertIn(
+            f'metrics_{os.getpid()}.json', os.listdir(directory.name))
+
+    def test_google_books_calls_are_timed(self):
+        client = GoogleBooksClient(session=FakeGoogleBooksSession(total=1))
+        client.search({'intitle': 'flowers'})
+        failing = GoogleBooksClient(
+            session=FakeGoogleBooksSession(total=1, fail=True))
+        with self.assertRaises(GoogleBooksError):
+            failing.search({'intitle': 'flowers'})
+
+        lines = self.scrape()
+        self.assertIn(
+            'booker_google_books_request_duration_seconds_count'
+            '{outcome="ok"} 1',
+            lines
+        )
+        self.assertIn(
+            'booker_google_books_request_duration_seconds_count'
+            '{outcome="error"} 1',
+            lines
+        )
+
+
+class TestConnectionPool(SimpleTestCase):
+    def make_pool(self, **options):
+        options.setdefault('reap_interval', 0)
+        pool = ConnectionPool(
+            lambda: sqlite3.connect(':memory:', check_same_thread=False),
+            **options
+        )
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connections_are_reused(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats['connects'], 1)
+        self.assertEqual((pool.idle, pool.in_use), (0, 1))
+
+    def test_waits_for_a_free_connection_up_to_timeout(self):
+        waits = []
+        pool = self.make_pool(max_size=1, timeout=0.05, on_wait=waits.append)
+        connection = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats['timeouts'], 1)
+
+        threading.Timer(0.02, pool.putconn, [connection]).start()
+        pool.timeout = 5
+        self.assertIs(pool.getconn(), connection)
+        self.assertEqual(len(waits), 2)
+        self.assertGreater(waits[1], 0.01)
+
+    def test_failed_check_replaces_the_connection(self):
+        def check(connection):
+            raise sqlite3.OperationalError('server closed the connection')
+
+        pool = self.make_pool(check=check, check_after=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        second = pool.getconn()
+        self.assertIsNot(second, first)
+        self.assertEqual(pool.stats['discarded'], 1)
+        self.assertEqual(pool.stats['connects'], 2)
+        self.assertEqual(pool.in_use, 1)
+
+    def test_idle_connections_are_evicted_down_to_min_size(self):
+        pool = self.make_pool(min_size=1, max_idle=0)
+        conns = [pool.getconn() for _ in range(3)]
+        for conn in conns:
+            pool.putconn(conn)
+        self.assertEqual(pool.evict_idle(), 2)
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(pool.stats['evictions'], 2)
+
+    def test_fill_and_close(self):
+        pool = self.make_pool(min_size=2)
+        pool.fill()
+        self.assertEqual((pool.idle, pool.stats['connects']), (2, 2))
+        connection = pool.getconn()
+        pool.putconn(connection, close=True)
+        self.assertEqual((pool.idle, pool.in_use), (1, 0))
+
+        pool.close()
+        self.assertEqual(pool.idle, 0)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+
+    def test_pools_are_shared_and_exported(self):
+        registry.clear()
+        self.addCleanup(db_pool.close_pools)
+        pool = db_pool.get_pool(('test', ''), self.make_pool)
+        self.assertIs(db_pool.get_pool(('test', ''), self.make_pool), pool)
+        pool.getconn()
+        DB_POOL_WAIT_SECONDS.observe(0.002, alias='test')
+
+        lines = registry.render().splitlines()
+        self.assertIn(
+            'booker_db_pool_connections{alias="test",state="in_use"} 1',
+            lines
+        )
+        self.assertIn(
+            'booker_db_pool_events_total{alias="test",event="connects"} 1',
+            lines
+        )
+        self.assertIn('booker_db_pool_wait_seconds_count{alias="test"} 1', lines)
+
+        db_pool.close_pools()
+        self.assertEqual(db_pool.all_pools(), {})
+
+
+@override_settings(STATICFILES_STORAGE=PLAIN_STATICFILES_STORAGE)
+class TestBenchmarkCommands(TestCase):
+    def test_generate_books_is_reproducible(self):
+        call_command(
+            'generate_books', books=20, batch_size=8, stdout=io.StringIO())
+        books = list(Book.objects.order_by('id').values(
+            'title', 'authors', 'pub_date', 'language', 'page_count'))
+        identifiers = Identifier.objects.count()
+        self.assertEqual(len(books), 20)
+        self.assertGreaterEqual(identifiers, 20)
+        self.assertLessEqual(identifiers, 80)
+
+        Book.objects.all().delete()
+        call_command('generate_books', books=20, stdout=io.StringIO())
+        self.assertEqual(books, list(Book.objects.order_by('id').values(
+            'title', 'authors', 'pub_date', 'language', 'page_count')))
+
+    def test_benchmark_report(self):
+        call_command('generate_books', books=5, stdout=io.StringIO())
+        enqueue_import({'intitle': 'river'})
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('booker_app.covers.COVER_CACHE_DIR', directory), \
+                mock.patch('booker_app.covers.download') as download, \
+                mock.patch('booker_app.views.BOOK_BATCH_API_TOKENS', ['t']), \
+                mock.patch('booker_app.benchmark.BOOK_BATCH_API_TOKENS', ['t']):
+            output = os.path.join(directory, 'benchmark.json')
+            call_command(
+                'benchmark', output=output, requests=3, warmup=1,
+                writes=True, stdout=io.StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        download.assert_not_called()
+        self.assertEqual(report['dataset']['books'], 5)
+        self.assertEqual(ImportJob.objects.count(), 1)
+        stats = report['scenarios']['book_list']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['errors'], 0)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(
+            set(report['scenarios']),
+            {
+                'book_list', 'book_list_search', 'book_list_not_modified',
+                'book_list_json', 'book_list_json_filtered', 'book_details',
+                'book_export', 'book_cover', 'identifier_lookup',
+                'autocomplete', 'add_book_form', 'import_book_form',
+                'import_job', 'metrics', 'add_book', 'edit_book',
+                'delete_book', 'import_book', 'book_batch', 'import_batch'
+            }
+        )
+        self.assertEqual(Book.objects.count(), 5)
+        for name in ('add_book', 'edit_book', 'delete_book', 'book_export',
+                     'book_cover', 'book_batch', 'import_batch'):
+            self.assertEqual(report['scenarios'][name]['errors'], 0)
+
+    def test_benchmark_pool_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark_pool.json')
+            call_command(
+                'benchmark_pool', output=output, requests=5, threads=2,
+                max_size=1, stdout=io.StringIO())
+            with open(output) as report_file:
+                report = json.load(report_file)
+
+        scenarios = report['scenarios']
+        self.assertEqual(
+            set(scenarios), {'connect_per_request', 'pooled'})
+        for stats in scenarios.values():
+            self.assertEqual(stats['requests'], 10)
+            self.assertEqual(stats['errors'], 0)
+        self.assertEqual(scenarios['pooled']['pool']['connects'], 1)
+
+
+@mock.patch('booker_app.views.BOOK_BATCH_API_TOKENS', ['secret'])
+class TestBookBatchView(TestCase):
+    def post(self, operations):
+        response = self.client.post(
+            reverse('book_batch'), {'operations': operations},
+            content_type='application/json', **BATCH_AUTH)
+        return response.json()['results']
+
+    def book(self, title, **fields):
+        return dict(
+            {'authors': 'a', 'title': title, 'pub_date': '2001',
+             'language': 'en', 'page_count': 10},
+            **fields
+        )
+
+    def test_create_update_delete(self):
+        stored, _ = create_book_with_ident(
+            'a', 'Stored', '1990-01-01', 1, 'en', None, 'ISSN', '1337')
+        removed, _ = create_book_with_ident(
+            'a', 'Removed', '1990-01-01', 1, 'en', None, 'ISSN', '4242')
+
+        results = self.post([
+            {'op': 'create', 'book': self.book('New'),
+             'identifiers': {'ISBN_10': '0-261-10221-4'}},
+            {'op': 'update', 'id': stored.id, 'book': {'title': 'Changed'},
+             'identifiers': {'ISSN': '1338', 'OTHER': 'x1'}},
+            {'op': 'delete', 'id': removed.id},
+        ])
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'updated', 'deleted']
+        )
+        new = Book.objects.get(title='New')
+        self.assertEqual(results[0]['book_id'], new.id)
+        self.assertEqual(new.pub_date, datetime.date(2001, 1, 1))
+        self.assertEqual(
+            Identifier.objects.get(book=new).canonical, '9780261102217')
+        stored.refresh_from_db()
+        self.assertEqual(stored.title, 'Changed')
+        self.assertEqual(stored.authors, 'a')
+        self.assertEqual(stored.fingerprint, stored.fill_fingerprint())
+        self.assertEqual(
+            sorted(stored.identifier_display), ['ISSN: 1338', 'OTHER: x1'])
+        self.assertFalse(Book.objects.filter(id=removed.id).exists())
+
+    def test_invalid_items_get_their_own_result(self):
+        stored, _ = create_book_with_ident(
+            'a', 'Stored', '1990-01-01', 1, 'en', None, 'ISSN', '1337')
+
+        results = self.post([
+            {'op': 'create', 'book': {'title': 'No authors'}},
+            {'op': 'create', 'book': self.book('Taken'),
+             'identifiers': {'ISSN': '1337'}},
+            {'op': 'create', 'book': self.book('Twice')},
+            {'op': 'create', 'book': self.book('Twice')},
+            {'op': 'update', 'id': 999, 'book': {'title': 'x'}},
+            {'op': 'rename'},
+            {'op': 'create',
+             'book': self.book('Bad date', pub_date='2001-13-45')},
+        ])
+
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['invalid', 'exists', 'created', 'exists', 'not_found', 'invalid',
+             'invalid']
+        )
+        self.assertIn('authors', results[0]['errors'])
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_chunks_use_a_constant_number_of_queries(self):
+        def operations(prefix, count):
+            return [
+                {'op': 'create', 'book': self.book(f'{prefix} {i}'),
+                 'identifiers': {
+                     'ISBN_13': f'{prefix}{i}', 'ISSN': f'S{prefix}{i}'}}
+                for i in range(count)
+            ]
+
+        with CaptureQueriesContext(connection) as small:
+            self.post(operations('1', 2))
+        with CaptureQueriesContext(connection) as large:
+            self.post(operations('2', 20))
+        if connection.features.can_return_ids_from_bulk_insert:
+            self.assertEqual(
+                len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(Identifier.objects.count(), 44)
+
+    def test_deletes_use_a_constant_number_of_queries(self):
+        def delete(prefix, count):
+            books = [
+                create_book_with_ident(
+                    'a', f'{prefix} {i}', '1990-01-01', 1, 'en', None,
+                    'ISSN', f'{prefix}{i}')[0]
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.post([{'op': 'delete', 'id': book.id} for book in books])
+            return len(queries.captured_queries)
+
+        self.assertEqual(delete('1', 2), delete('2', 18))
+        self.assertFalse(Identifier.objects.exists())
+
+    def test_invalid_request(self):
+        response = self.client.post(
+            reverse('book_batch'), {'operations': 'all'},
+            content_type='application/json', **BATCH_AUTH)
+        self.assertEqual(response.status_code, 400)
+
+    def test_book_must_be_an_object(self):
+        stored, _ = create_book_with_ident(
+            'a', 'Stored', '1990-01-01', 1, 'en', None, 'ISSN', '1337')
+        results = self.post([
+            {'op': 'create', 'book': ['x']},
+            {'op': 'update', 'id': stored.id, 'book': 'x'},
+            {'op': 'create', 'book': self.book('New')},
+        ])
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['invalid', 'invalid', 'created']
+        )
+        self.assertEqual(results[0]['message'], 'book must be an object.')
+
+    def test_token_and_json_required(self):
+        body = json.dumps({'operations': [{'op': 'delete', 'id': 1}]})
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            response = self.client.post(
+                reverse('book_batch'), body,
+                content_type='application/json', **headers)
+            self.assertEqual(response.status_code, 403)
+
+        # What a cross-site form can send without a preflight
+        response = self.client.post(
+            reverse('book_batch'), body, content_type='text/plain',
+            **BATCH_AUTH)
+        self.assertEqual(response.status_code, 415)
+
+    def test_refused_without_configured_tokens(self):
+        with mock.patch('booker_app.views.BOOK_BATCH_API_TOKENS', []):
+            response = self.client.post(
+                reverse('book_batch'), {'operations': []},
+                content_type='application/json', **BATCH_AUTH)
+        self.assertEqual(response.status_code, 403)
+
+
+class TestBookExport(TestCase):
+    def setUp(self):
+        self.book, _ = create_book_with_ident(
+            'Jane Doe,John Doe', 'First', '1990-01-01', 10, 'en',
+            'http://covers/1', 'ISBN_13', '9780000000001')
+        Identifier(value='1234-5678', type='ISSN', book=self.book).save()
+        self.bare = Book(authors='', title='Second', language='pl')
+        self.bare.save()
+
+    def export(self, **params):
+        response = self.client.get(reverse('book_export'), params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="books.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual([row['title'] for row in rows], ['First', 'Second'])
+        self.assertEqual(rows[0]['authors'], 'Jane Doe,John Doe')
+        self.assertEqual(rows[0]['publishedDate'], '1990-01-01')
+        self.assertEqual(rows[0]['ISBN_13'], '9780000000001')
+        self.assertEqual(rows[0]['ISSN'], '1234-5678')
+        self.assertEqual(rows[1]['ISBN_13'], '')
+        self.assertEqual(rows[1]['pageCount'], '')
+
+    def test_gzipped_jsonl(self):
+        response, content = self.export(format='jsonl', gzip=1)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('books.jsonl.gz', response['Content-Disposition'])
+        volumes = [
+            json.loads(line)
+            for line in gzip.decompress(content).decode().splitlines()
+        ]
+        self.assertEqual(volumes[0]['id'], self.book.id)
+        self.assertEqual(volumes[0]['authors'], ['Jane Doe', 'John Doe'])
+        self.assertEqual(
+            volumes[0]['imageLinks'], {'thumbnail': 'http://covers/1'})
+        self.assertEqual(len(volumes[0]['industryIdentifiers']), 2)
+        self.assertEqual(volumes[1]['industryIdentifiers'], [])
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('book_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_reads_in_windows(self):
+        for i in range(3):
+            Book(title=f'More {i}', authors='foo', language='en').save()
+        with CaptureQueriesContext(connection) as queries:
+            books = list(iter_books(window_size=2))
+        self.assertEqual(
+            [fields['id'] for fields, _ in books],
+            list(Book.objects.order_by('id').values_list('id', flat=True))
+        )
+        # End of each of the 3 windows, then the window itself
+        self.assertEqual(len(queries), 6)
+
+    def test_command_output_loads_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.csv')
+            call_command(
+                'export_books', path, window_size=1, stdout=io.StringIO())
+            self.assertEqual(os.listdir(directory), ['books.csv'])
+            Book.objects.all().delete()
+            call_command(
+                'load_books', path, workers=0, stdout=io.StringIO())
+
+        book = Book.objects.get(title='First')
+        self.assertEqual(book.authors, 'Jane Doe,John Doe')
+        self.assertEqual(book.pub_date, datetime.date(1990, 1, 1))
+        self.assertEqual(
+            sorted(book.identifier_set.values_list('value', flat=True)),
+            ['1234-5678', '9780000000001']
+        )
+        self.assertTrue(Book.objects.filter(title='Second').exists())
+
+    def test_exports_load_back_unchanged(self):
+        self.book.authors = 'Doe, Jane,Smith , John'
+        self.book.save()
+        stored = sorted(Book.objects.values_list('authors', 'fingerprint'))
+        for name in ('books.csv', 'books.jsonl'):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, name)
+                call_command('export_books', path, stdout=io.StringIO())
+                Book.objects.all().delete()
+                call_command(
+                    'load_books', path, workers=0, stdout=io.StringIO())
+            self.assertEqual(
+                sorted(Book.objects.values_list('authors', 'fingerprint')),
+                stored
+            )
+
+    def test_command_gzip_from_extension(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'books.jsonl.gz')
+            call_command('export_books', path, stdout=io.StringIO())
+            with gzip.open(path, 'rt') as export:
+                titles = [json.loads(line)['title'] for line in export]
+        self.assertEqual(titles, ['First', 'Second'])
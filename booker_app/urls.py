@@ -1,7 +1,9 @@
-from django.urls import path
+from django.urls import path, re_path
 from booker_app.views import (
-    BookView, BookFormView, BookDetailsView, BookDelete, BookListJsonView,
-    ImportBookView
+    AutocompleteView, BookView, BookBatchView, BookExportView, BookFormView,
+    BookDetailsView, BookDelete, BookListJsonView, CoverView,
+    IdentifierLookupView, ImportBatchView, ImportBookView, ImportJobView,
+    MetricsView
 )
 
 urlpatterns = [
@@ -19,4 +21,32 @@ urlpatterns = [
         name='delete_book'
     ),
     path('import_book/', ImportBookView.as_view(), name='import_book'),
+    path(
+        'import_book/batch/',
+        ImportBatchView.as_view(),
+        name='import_batch'
+    ),
+    path(
+        'import_job/<int:job_id>/',
+        ImportJobView.as_view(),
+        name='import_job'
+    ),
+    path(
+        'identifiers/lookup/',
+        IdentifierLookupView.as_view(),
+        name='identifier_lookup'
+    ),
+    path(
+        'books/autocomplete/',
+        AutocompleteView.as_view(),
+        name='autocomplete'
+    ),
+    path('books/batch/', BookBatchView.as_view(), name='book_batch'),
+    path('books/export/', BookExportView.as_view(), name='book_export'),
+    re_path(
+        r'^covers/(?P<book_id>[0-9]+)/(?P<key>[0-9a-f]{64})\.jpg$',
+        CoverView.as_view(),
+        name='book_cover'
+    ),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
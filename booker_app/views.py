@@ -1,65 +1,251 @@
+import hmac
 import json
-import requests
-from datetime import datetime
+import os
+from itertools import islice
 
-from django.db.models import Q
 from django.shortcuts import render, redirect, reverse
 from django.http import (
-    HttpResponse, HttpResponseNotFound, HttpResponseRedirect, JsonResponse
+    FileResponse, HttpResponse, HttpResponseNotFound, HttpResponseRedirect,
+    JsonResponse, StreamingHttpResponse
 )
+from django.db import IntegrityError, transaction
+from django.db.models import Q, prefetch_related_objects
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 
+from booker_app.autocomplete import get_suggestions
+from booker_app.batch import apply_operations
 from booker_app.forms import (BookForm, IdentifierForm, SearchBookForm,
-    ImportBookForm, BookFormEdit
+    ImportBatchForm, ImportBookForm, BookFormEdit
 )
-from booker_app.models import Book, Identifier
+from booker_app.covers import (
+    COVER_MAX_AGE, CoverError, cover_key, get_thumbnail, thumbnail_path
+)
+from booker_app.export import EXPORT_FORMATS, export_stream
+from booker_app.fragments import render_cards
+from booker_app.isbn import canonical_lookup
+from booker_app.jobs import enqueue_batch_import, enqueue_import
+from booker_app.metrics import registry
+from booker_app.models import Book, CatalogVersion, Identifier, ImportJob
+from booker_app.pagination import (
+    InvalidCursor, KeysetPaginator, get_page_size, page_url
+)
+from booker_app.replicas import read_from_primary
+from booker_app.search import SEARCH_ORDERING, get_search_backend
+from booker_app.streaming import STREAM_FORMATS, streaming_json_response
+from booker.settings import (
+    BOOK_BATCH_API_TOKENS, BOOK_BATCH_MAX_OPERATIONS, BOOK_STREAM_CHUNK_SIZE,
+    IDENTIFIER_LOOKUP_MAX
+)
+
+
+def catalog_version(request, *args, **kwargs):
+    # condition() asks for the ETag and the Last-Modified date separately
+    if not hasattr(request, 'catalog_version'):
+        request.catalog_version = CatalogVersion.current()
+    return request.catalog_version
+
+
+def catalog_etag(request, *args, **kwargs):
+    return f'catalog-{catalog_version(request).version}'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_version(request).updated_at
+
+
+# Answers 304 Not Modified while the catalog is unchanged, reading only the
+# CatalogVersion row
+catalog_condition = method_decorator(condition(
+    etag_func=catalog_etag, last_modified_func=catalog_last_modified))
 
 
 class BookView(View):
+    @catalog_condition
     def get(self, request):
-        book_list = Book.objects.all()
-        form = SearchBookForm()
-        context = {'book_list': book_list, 'form': form}
-        return render(request, 'book_list.html', context)
+        search_phrase = request.GET.get('search_field', '')
+        return self.render_page(request, search_phrase)
 
     def post(self, request, *args, **kwargs):
         form = SearchBookForm(request.POST)
         if not form.is_valid():  # TODO fix redirect
             return redirect('book_list')
         search_phrase = form.cleaned_data['search_field']
-        search_result = Book.objects.filter(
-            Q(authors__icontains=search_phrase) |
-            Q(title__icontains=search_phrase) |
-            Q(language__icontains=search_phrase) |
-            Q(pub_date__icontains=search_phrase)
-        )
+        return self.render_page(request, search_phrase)
+
+    def render_page(self, request, search_phrase):
+        if search_phrase:
+            # Ranked, indexed full-text search over titles and authors
+            book_list = get_search_backend().search(search_phrase)
+            ordering = SEARCH_ORDERING
+        else:
+            book_list = Book.objects.all()
+            ordering = ('id',)
+        paginator = KeysetPaginator(
+            book_list, get_page_size(request), keys=ordering)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor:
+            return redirect('book_list')
 
-        context = {'book_list': search_result}
+        form = SearchBookForm(initial={'search_field': search_phrase})
+        context = {
+            'book_list': page.object_list,
+            # Cached cards; identifiers are loaded in one extra query for
+            # the cards which are not
+            'book_cards': render_cards(page.object_list),
+            'form': form,
+            'next_url': page_url(
+                request, page.next_cursor, search_field=search_phrase),
+            'prev_url': page_url(
+                request, page.prev_cursor, search_field=search_phrase),
+        }
         return render(request, 'book_list.html', context)
 
 
 class BookListJsonView(View):
+    # Columns a client can ask for with `fields`; `id` is always returned
+    FIELDS = (
+        'id',
+        'authors',
+        'title',
+        'pub_date',
+        'page_count',
+        'language',
+        'cover_image_adress',
+        'updated_at'
+    )
+    INCLUDES = ('identifiers',)
+
+    @catalog_condition
     def get(self, request):
         """Search keyword should be passed through the URL as a querystring
         in the following format:
         ?authors=[AUTHORS]&title=[TITLE]&language=[LANGUAGE]&pub_date=[YYYY-MM-DD]
+
+        Results are paginated: `page_size` sets the number of books per
+        page and the neighbouring pages are linked in the `Link` header
+        (rel="next" and rel="prev") through an opaque `cursor` parameter.
+        `page_size=0` streams every matching book instead.
+
+        `format` is either `json` (an array, default) or `ndjson` (one book
+        per line). The response is streamed in both cases.
+
+        `fields` is a comma separated subset of FIELDS, selected by the
+        query itself; every field by default. `include=identifiers` adds
+        the identifiers of every book, loaded with one query per page.
         """
         authors = request.GET.get('authors', '')
         title = request.GET.get('title', '')
         language = request.GET.get('language', '')
         pub_date = request.GET.get('pub_date', '')
-        search_result = list(Book.objects.filter(
+        output_format = request.GET.get('format', 'json')
+        if output_format not in STREAM_FORMATS:
+            error_msg = f'Unknown format: {output_format}'
+            return JsonResponse({'error': error_msg}, status=400)
+        fields = self.FIELDS
+        if request.GET.get('fields'):
+            fields = ['id'] + [
+                field.strip() for field in request.GET['fields'].split(',')
+                if field.strip() and field.strip() != 'id'
+            ]
+            unknown = [field for field in fields if field not in self.FIELDS]
+            if unknown:
+                error_msg = f'Unknown fields: {", ".join(unknown)}'
+                return JsonResponse({'error': error_msg}, status=400)
+        includes = [
+            include for include in request.GET.get('include', '').split(',')
+            if include
+        ]
+        unknown = [i for i in includes if i not in self.INCLUDES]
+        if unknown:
+            error_msg = f'Unknown include: {", ".join(unknown)}'
+            return JsonResponse({'error': error_msg}, status=400)
+
+        search_result = Book.objects.filter(
             authors__icontains=authors,
             title__icontains=title,
             language__icontains=language,
             pub_date__icontains=pub_date
-        ).values())
+        ).values(*fields)
+
+        if request.GET.get('page_size') == '0':
+            # Server-side cursor read in chunks; memory stays flat whatever
+            # the size of the result.
+            rows = search_result.order_by('id').iterator(
+                chunk_size=BOOK_STREAM_CHUNK_SIZE)
+            if 'identifiers' in includes:
+                rows = with_identifiers(rows, BOOK_STREAM_CHUNK_SIZE)
+            return streaming_json_response(rows, output_format)
+
+        paginator = KeysetPaginator(search_result, get_page_size(request))
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        rows = page.object_list
+        if 'identifiers' in includes:
+            rows = with_identifiers(rows, len(rows) or 1)
+        response = streaming_json_response(rows, output_format)
+        links = [
+            f'<{request.build_absolute_uri(url)}>; rel="{rel}"'
+            for rel, url in (
+                ('next', page_url(request, page.next_cursor)),
+                ('prev', page_url(request, page.prev_cursor))
+            ) if url
+        ]
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
+
 
-        return JsonResponse(search_result, safe=False)
+class BookExportView(View):
+    @catalog_condition
+    def get(self, request):
+        """Streams the whole catalog with its identifiers as a download, see
+        booker_app/export.py. `format` is `csv` (default) or `jsonl`;
+        `gzip=1` compresses it on the fly."""
+        output_format = request.GET.get('format', 'csv')
+        if output_format not in EXPORT_FORMATS:
+            error_msg = f'Unknown format: {output_format}'
+            return JsonResponse({'error': error_msg}, status=400)
+        compress = request.GET.get('gzip') in ('1', 'true')
+
+        filename = f'books.{output_format}'
+        content_type = EXPORT_FORMATS[output_format]
+        if compress:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(
+            export_stream(output_format, compress), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+def with_identifiers(rows, chunk_size):
+    """Adds an `identifiers` list to the book rows, querying the
+    identifiers of `chunk_size` books at a time."""
+    rows = iter(rows)
+    chunk = list(islice(rows, chunk_size))
+    while chunk:
+        identifiers = {row['id']: [] for row in chunk}
+        for book_id, ident_type, value in Identifier.objects.filter(
+                book_id__in=list(identifiers)
+        ).order_by('id').values_list('book_id', 'type', 'value'):
+            identifiers[book_id].append({'type': ident_type, 'value': value})
+        for row in chunk:
+            row['identifiers'] = identifiers[row['id']]
+            yield row
+        chunk = list(islice(rows, chunk_size))
 
 
 class BookDetailsView(View):
+    @catalog_condition
     def get(self, request, book_id):
         book = Book.objects.get(id=book_id)
         if not book:
@@ -84,87 +270,73 @@ class BookDetailsView(View):
         return render(request, 'book_details.html', context)
 
     def post(self, request, book_id):
-        book = Book.objects.get(id=book_id)
-        if not book:
-            not_found_msg = 'Book not found'
-            return render(
-                request,
-                'book_details.html',
-                {'not_found_msg':not_found_msg}
-            )
-
-        form_book = BookFormEdit(
-            request.POST,
-            initial={
-                'authors': book.authors,
-                'title': book.title,
-                'pub_date': book.pub_date,
-                'page_count': book.page_count,
-                'language': book.language,
-                'cover_image_adress': book.cover_image_adress
-            },
-            instance=book
-        )
-
-        identifiers = Identifier.objects.filter(book_id=book.id).all()
-        ident_types_in_book = [ident.type for ident in identifiers]
         form_ident = IdentifierForm(request.POST)
-
-        if form_book.is_valid():
-            form_book.save(commit=False)
-
-            if form_ident.is_valid():
-                for ident_type in Identifier.IDENTIFIER_TYPES:
-                    ident_type = ident_type[0]  # Pick a value from the tuple
-                    if form_ident.cleaned_data[ident_type]:
-                        # check if ident value exists in other book.
-                        ident_exist_in_other_book = Identifier.objects.filter(
-                            type=ident_type,
-                            value=form_ident.cleaned_data[ident_type]
-                        ).first()
-                        if (ident_exist_in_other_book and
-                            ident_exist_in_other_book.book_id != book.id):
-                            error_msg = "Book with this identifier already exists."
-                            return render(
-                                request,
-                                'book_list.html',
-                                {'error_msg': error_msg}
-                            )
-                        form_book.save()
-                        if ident_type in ident_types_in_book:
-                            ident_to_update = Identifier.objects.filter(
-                                book_id=book.id, type=ident_type
-                            ).first()
-                            ident_to_update.type=ident_type
-                            ident_to_update.value=form_ident.cleaned_data[ident_type]
-                            ident_to_update.book=book
-                            ident_to_update.save()
-                        else:
-                            Identifier(
-                            type=ident_type,
-                            value=form_ident.cleaned_data[ident_value],
-                            book=book
-                            ).save()
-                        success_msg = 'Book updated successfully'
-                        context = {
-                            'form_book': form_book,
-                            'form_ident': form_ident,
-                            'success_msg': success_msg
-                        }
-                        return render(request, 'book_details.html', context)
-            else:
-                error_msg = "Updating failed. Invalid indentifier."
-                context = {'error_msg': error_msg}
-                return render(request, 'book_details.html', context)
-
+        try:
+            with transaction.atomic():
+                # Concurrent edits of the book wait for this one to finish
+                book = Book.objects.select_for_update().get(id=book_id)
+                form_book = BookFormEdit(request.POST, instance=book)
+                context = {'form_book': form_book, 'form_ident': form_ident}
+                if not form_book.is_valid():
+                    context['error_msg'] = 'Updating failed. Invalid book.'
+                    return render(request, 'book_details.html', context)
+                if not form_ident.is_valid():
+                    context['error_msg'] = (
+                        'Updating failed. Invalid indentifier.')
+                    return render(request, 'book_details.html', context)
+
+                error_msg = self.update_book(form_book, form_ident)
+        except IntegrityError:
+            # The new data collided with a book or identifier saved
+            # concurrently; nothing has been written
+            error_msg = 'Book with these details already exists.'
+
+        if error_msg:
+            context['error_msg'] = error_msg
         else:
-            success_msg = 'Book updated successfully'
-            context = {
-                'form_book': form_book,
-                'form_ident': form_ident,
-                'success_msg': success_msg
-            }
-            return render(request, 'book_details.html', context)
+            context['success_msg'] = 'Book updated successfully'
+        return render(request, 'book_details.html', context)
+
+    def update_book(self, form_book, form_ident):
+        """Saves the edited book and its identifiers with a fixed number of
+        queries. Returns an error message if an identifier belongs to
+        another book."""
+        book = form_book.instance
+        new_values = {
+            ident_type: form_ident.cleaned_data[ident_type]
+            for ident_type, _ in Identifier.IDENTIFIER_TYPES
+            if form_ident.cleaned_data[ident_type]
+        }
+        # Identifier values are unique, so one query finds both the
+        # identifiers of the book and those taken by other books
+        identifiers = Identifier.objects.filter(
+            Q(value__in=new_values.values()) | Q(book_id=book.id))
+        own_identifiers = {}
+        for ident in identifiers:
+            if ident.book_id != book.id:
+                return 'Book with this identifier already exists.'
+            own_identifiers[ident.type] = ident
+
+        form_book.save()
+        to_update = []
+        to_create = []
+        for ident_type, value in new_values.items():
+            ident = own_identifiers.get(ident_type)
+            if ident is None:
+                ident = Identifier(type=ident_type, value=value, book=book)
+                ident.fill_canonical()
+                to_create.append(ident)
+            elif ident.value != value:
+                ident.value = value
+                ident.fill_canonical()
+                # bulk_update() skips auto_now
+                ident.updated_at = timezone.now()
+                to_update.append(ident)
+        Identifier.objects.bulk_update(
+            to_update, ['value', 'canonical', 'updated_at'])
+        Identifier.objects.bulk_create(to_create)
+        CatalogVersion.bump()
+        return None
 
 
 class BookFormView(View):
@@ -223,15 +395,29 @@ class BookFormView(View):
             language=form_book.cleaned_data['language']
             cover_image_adress=form_book.cleaned_data['cover_image_adress']
 
-            # If no idents exist we don't want to duplicate the book
-            if not ident_instances and self.check_if_book_exists(
-                authors,
-                title,
-                pub_date,
-                page_count,
-                language,
-                cover_image_adress):
+            new_book = Book(
+                authors=authors,
+                title=title,
+                pub_date=pub_date,
+                page_count=page_count,
+                language=language,
+                cover_image_adress=cover_image_adress
+            )
+            # A book with the same fields is a duplicate, identifiers or not
+            book_exists = self.check_if_book_exists(new_book)
+            if not book_exists:
+                try:
+                    with transaction.atomic():
+                        new_book.save()
+                        for ident in ident_instances:
+                            ident.book = new_book
+                            ident.save()
+                        CatalogVersion.bump()
+                except IntegrityError:
+                    # The same book was added concurrently
+                    book_exists = True
 
+            if book_exists:
                 error_msg = f'{title} by {authors} already exists.'
                 return render(
                     request,
@@ -243,49 +429,22 @@ class BookFormView(View):
                     }
                 )
 
-            new_book = Book(
-                authors=form_book.cleaned_data['authors'],
-                title=form_book.cleaned_data['title'],
-                pub_date=form_book.cleaned_data['pub_date'],
-                page_count=form_book.cleaned_data['page_count'],
-                language=form_book.cleaned_data['language'],
-                cover_image_adress=form_book.cleaned_data['cover_image_adress']
-            )
-            new_book.save()
-            for ident in ident_instances:
-                ident.book = new_book
-                ident.save()
-
             return redirect('book_list')
 
 
-    def check_if_book_exists(
-        self,
-        authors,
-        title,
-        pub_date,
-        page_count,
-        language,
-        cover_image_adress):
-
+    def check_if_book_exists(self, book):
         return Book.objects.filter(
-            authors=authors,
-            title=title,
-            pub_date=pub_date,
-            page_count=page_count,
-            language=language,
-            cover_image_adress=cover_image_adress
-        ).first()
+            fingerprint=book.fill_fingerprint()).first()
 
 
 class BookDelete(View):
     def post(self, request, id):
         book = Book.objects.get(id=id)
         if book:
-            idents = Identifier.objects.filter(book_id=book.id).all()
-            for ident in idents:
-                ident.delete()
-            book.delete()
+            with transaction.atomic():
+                # Identifiers go with their book (on_delete=CASCADE)
+                book.delete()
+                CatalogVersion.bump()
             return HttpResponseRedirect(reverse('book_list'))
         else:
           return HttpResponseRedirect(reverse('book_list'))
@@ -318,118 +477,224 @@ class ImportBookView(View):
             'oclc': search_oclc
         }
 
-        volume_infos = self.call_google_api(keywords_fields)
-        if not volume_infos:
-            error_msg = 'No volumes found. Change your search terms.'
-            return render(request, 'book_list.html', {'error_msg': error_msg})
-
-        success_msg = ''
-        for item in volume_infos:
-            book_exists = None  # we don't know if a book exists in our db
-            ident_instances = []  # to be saved after the book
-            for ident in item.get('industryIdentifiers', []):
-                type = ident['type']
-                value = ident['identifier']
-                identifier = Identifier.objects.filter(
-                    type=type,
-                    value=value
-                ).first()
-                # Hack to break out of outer loop
-                if identifier:
-                    book_exists = True
-                    error_msg = (
-                        f'Book with {type}: {value} already exists.'
-                    )
-                    break
-                else:
-                    # Idents that we will want to save, but need a book
-                    # instance for the Foreign Key
-                    ident_instances.append(Identifier(type=type, value=value))
+        # The search and the import run in `manage.py run_import_worker`
+        job = enqueue_import(keywords_fields)
+        success_msg = f'Import queued as job {job.id}.'
+        context = {
+            'form': ImportBookForm(),
+            'success_msg': success_msg,
+            'job_url': reverse('import_job', kwargs={'job_id': job.id})
+        }
+        return render(request, 'import_book.html', context)
 
-            if book_exists:
-                return render(request, 'book_list.html', {"error_msg": error_msg})
-
-            # authors is a list; a book can sometimes miss authors as well.
-            authors = ','.join(item.get('authors', []))
-            title = item['title']
-            pub_date = self.clean_date(item.get('publishedDate'))
-            page_count = item.get('pageCount')  # optional
-            language = item.get('language')
-            cover_image_adress = item.get('imageLinks', {}).get('thumbnail')
-
-            # If no idents exist we don't want to duplicate the book
-            if not ident_instances and self.check_if_book_exists(
-                authors,
-                title,
-                pub_date,
-                page_count,
-                language,
-                cover_image_adress):
-
-                continue
-
-            book = Book(
-                authors=authors,
-                title=title,
-                pub_date=pub_date,
-                page_count=page_count,
-                language=language,
-                cover_image_adress=cover_image_adress
-            )
-            book.save()
-            for ident in ident_instances:
-                ident.book = book
-                ident.save()
 
-            success_msg += f'"{book.title}" imported to the database. '
+class ImportBatchView(View):
+    """Import of a pasted list of ISBNs, looked up concurrently by the
+    import worker."""
+    def get(self, request):
+        form = ImportBatchForm()
+        return render(request, 'import_batch.html', {'form': form})
 
-        return render(
-            request,
-            'book_list.html',
-            {'success_msg': success_msg},
-            {'error_msg': error_msg}
+    def post(self, request):
+        form = ImportBatchForm(request.POST)
+        if not form.is_valid():
+            return render(request, 'import_batch.html', {'form': form})
+
+        job = enqueue_batch_import(form.cleaned_data['isbns'])
+        success_msg = (
+            f'Import of {len(form.cleaned_data["isbns"])} ISBNs queued as '
+            f'job {job.id}.'
         )
+        context = {
+            'form': ImportBatchForm(),
+            'success_msg': success_msg,
+            'job_url': reverse('import_job', kwargs={'job_id': job.id})
+        }
+        return render(request, 'import_batch.html', context)
+
+
+class ImportJobView(View):
+    @method_decorator(read_from_primary)
+    def get(self, request, job_id):
+        """Status of an import job and, once it is done, the result of the
+        import of every volume found."""
+        job = ImportJob.objects.filter(id=job_id).first()
+        if not job:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+        return JsonResponse({
+            'id': job.id,
+            'status': job.status,
+            'query': job.keywords_fields,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'error': job.error,
+            'results': job.result_list
+        })
+
+
+def book_json(book):
+    """Book fields and identifiers; the identifiers should be prefetched."""
+    return {
+        'id': book.id,
+        'authors': book.authors,
+        'title': book.title,
+        'pub_date': book.pub_date,
+        'page_count': book.page_count,
+        'language': book.language,
+        'cover_image_adress': book.cover_image_adress,
+        'identifiers': [
+            {'type': ident.type, 'value': ident.value}
+            for ident in book.identifier_set.all()
+        ]
+    }
+
 
-    def call_google_api(self, keywords_fields):
-        valid_fields = [
-            f'{key_field}:{keywords_fields[key_field]}' for key_field
-            in keywords_fields.keys() if keywords_fields[key_field]
+@method_decorator(csrf_exempt, name='dispatch')
+class IdentifierLookupView(View):
+    """Resolves many identifiers to books in one request, eg.
+    ?identifier=978-0-261-10221-7&identifier=0261102214 or a POSTed JSON
+    object {"identifiers": [...]}. ISBNs match whatever their form, an
+    ISBN-10 finds the book stored with its ISBN-13 and the other way round.
+
+    Results follow the order of the identifiers; `book` is null for those
+    not found.
+    """
+    def get(self, request):
+        return self.lookup(request.GET.getlist('identifier'))
+
+    def post(self, request):
+        try:
+            identifiers = json.loads(request.body)['identifiers']
+        except (ValueError, KeyError, TypeError):
+            identifiers = None
+        if not isinstance(identifiers, list) or not all(
+                isinstance(value, str) for value in identifiers):
+            error_msg = 'Expected a JSON object with a list of identifiers.'
+            return JsonResponse({'error': error_msg}, status=400)
+        return self.lookup(identifiers)
+
+    def lookup(self, identifiers):
+        if len(identifiers) > IDENTIFIER_LOOKUP_MAX:
+            error_msg = (
+                f'At most {IDENTIFIER_LOOKUP_MAX} identifiers per request.')
+            return JsonResponse({'error': error_msg}, status=400)
+
+        canonical = [canonical_lookup(value) for value in identifiers]
+        # One indexed IN query for all of them, one for their identifiers
+        matches = Identifier.objects.filter(
+            canonical__in={value for value in canonical if value}
+        ).select_related('book').order_by('id')
+        books = {}
+        by_id = {}
+        for ident in matches:
+            # Every match has its own copy of the book
+            book = by_id.setdefault(ident.book_id, ident.book)
+            books.setdefault(ident.canonical, book)
+        prefetch_related_objects(list(by_id.values()), 'identifier_set')
+
+        results = [
+            {
+                'identifier': value,
+                'canonical': key,
+                'book': book_json(books[key]) if key in books else None
+            }
+            for value, key in zip(identifiers, canonical)
         ]
-        url = 'https://www.googleapis.com/books/v1/volumes'
-        params = {'q': f'{valid_field}' for valid_field in valid_fields}
-        response_bytes = requests.get(url, params=params)
-        response = response_bytes.content.decode("utf-8")
-        # Check if user found any book. If not return None.
-        response_check = json.loads(response)["totalItems"]
-        if not response_check:
-            return None
-
-        response = json.loads(response)['items']
-        return [item['volumeInfo'] for item in response]
-
-    def clean_date(self, pub_date):
-        # Hack for date_pub if only a year or a year and a month are
-        # specified
-        if len(pub_date) < 5:
-            pub_date += '-01-01'
-        elif len(pub_date) < 8:
-            pub_date += '-01'
-        return datetime.strptime(pub_date, '%Y-%m-%d')
-
-    def check_if_book_exists(
-        self,
-        authors,
-        title,
-        pub_date,
-        page_count,
-        language,
-        cover_image_adress):
+        return JsonResponse({'results': results})
 
-        return Book.objects.filter(
-            authors=authors,
-            title=title,
-            pub_date=pub_date,
-            page_count=page_count,
-            language=language,
-            cover_image_adress=cover_image_adress
-        ).first()
+
+class AutocompleteView(View):
+    @catalog_condition
+    def get(self, request):
+        """Suggestions for the search box, eg. ?q=lord%20of: the books
+        whose title, or first author, starts with the words typed so far,
+        ignoring case, accents and punctuation. Each result tells which of
+        them matched: {"id": 1, "title": ..., "authors": ...,
+        "match": "title"}.
+
+        Served from a cache per prefix while the catalog is unchanged.
+        """
+        prefix, suggestions = get_suggestions(
+            request.GET.get('q', ''), catalog_version(request).version)
+        return JsonResponse({'prefix': prefix, 'results': suggestions})
+
+
+def has_batch_token(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    scheme, _, token = authorization.partition(' ')
+    return scheme.lower() == 'bearer' and any(
+        hmac.compare_digest(token.encode(), allowed.encode())
+        for allowed in BOOK_BATCH_API_TOKENS
+    )
+
+
+# Authenticated by a token, which a cross-site request can't send; JSON
+# only, so that a browser preflights any cross-site call
+@method_decorator(csrf_exempt, name='dispatch')
+class BookBatchView(View):
+    def post(self, request):
+        """Applies a JSON object {"operations": [...]} of:
+        {"op": "create", "book": {...}, "identifiers": {"ISBN_13": ...}},
+        {"op": "update", "id": 1, "book": {...}, "identifiers": {...}} and
+        {"op": "delete", "id": 1}.
+
+        Book fields and identifiers are validated like in the HTML forms.
+        An update changes only the book fields and identifier types given.
+        Returns a result per operation, in order; see batch.apply_operations.
+
+        Needs an `Authorization: Bearer <token>` header with one of
+        BOOK_BATCH_API_TOKENS and a JSON body (Content-Type
+        application/json).
+        """
+        if not has_batch_token(request):
+            return JsonResponse(
+                {'error': 'A valid API token is required.'}, status=403)
+        if request.content_type != 'application/json':
+            return JsonResponse(
+                {'error': 'Expected Content-Type application/json.'},
+                status=415
+            )
+        try:
+            operations = json.loads(request.body)['operations']
+        except (ValueError, KeyError, TypeError):
+            operations = None
+        if not isinstance(operations, list):
+            error_msg = 'Expected a JSON object with a list of operations.'
+            return JsonResponse({'error': error_msg}, status=400)
+        if len(operations) > BOOK_BATCH_MAX_OPERATIONS:
+            error_msg = (
+                f'At most {BOOK_BATCH_MAX_OPERATIONS} operations per request.')
+            return JsonResponse({'error': error_msg}, status=400)
+        return JsonResponse({'results': apply_operations(operations)})
+
+
+class CoverView(View):
+    def get(self, request, book_id, key):
+        """Thumbnail of the cover of a book, see booker_app/covers.py. `key`
+        is the hash of the cover address, so a stored thumbnail is served
+        without touching the database and cached by browsers for good."""
+        path = thumbnail_path(key)
+        if not os.path.exists(path):
+            book = Book.objects.filter(id=book_id).only(
+                'cover_image_adress').first()
+            if (not book or not book.cover_image_adress
+                    or cover_key(book.cover_image_adress) != key):
+                return HttpResponseNotFound()
+            try:
+                path = get_thumbnail(book.cover_image_adress)
+            except CoverError:
+                return HttpResponse(status=502)
+
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+        response['Cache-Control'] = (
+            f'public, max-age={COVER_MAX_AGE}, immutable')
+        return response
+
+
+class MetricsView(View):
+    def get(self, request):
+        """Request metrics for Prometheus: of this process, or of every
+        process of the host with METRICS_DIR."""
+        return HttpResponse(
+            registry.render(), content_type='text/plain; version=0.0.4')